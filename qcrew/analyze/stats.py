@@ -2,27 +2,119 @@
 
 import numpy as np
 
+
+class RunningStats:
+    """
+    Accumulates the running mean and standard error of repeated sweeps.
+    State is kept in float64 as count, mean and M2 (sum of squared differences from the
+    mean), where mean and M2 have the sweep shape. Whole batches are merged with Chan et
+    al.'s parallel formula, so accumulators built from separate batches can also be
+    combined with merge().
+    Inspired by https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance
+    """
+
+    def __init__(self, count=0, mean=None, m2=None):
+        """
+        count: number of repetitions accumulated so far
+        mean: running mean, shape is the sweep shape
+        m2: running sum of squares of differences from the current mean
+        """
+        self.count = int(count)
+        self.mean = None if mean is None else np.array(mean, dtype=np.float64)
+        self.m2 = None if m2 is None else np.array(m2, dtype=np.float64)
+        self._scratch = None  # reused between updates to hold batch deviations
+
+    def update(self, xs):
+        """
+        Merges a batch of results into the accumulator and returns it.
+        xs: raw data matrix, xs.shape[0] is the repetition dimension, while the other
+        dimensions are the sweep dimensions.
+        """
+        xs = np.asarray(xs)
+        batch_count = xs.shape[0]
+        if batch_count == 0:
+            return self
+
+        batch_mean = xs.mean(axis=0, dtype=np.float64)
+        deviations = self._get_scratch(xs.shape)
+        np.subtract(xs, batch_mean, out=deviations)
+        np.square(deviations, out=deviations)
+        batch_m2 = deviations.sum(axis=0)
+        return self._merge(batch_count, batch_mean, batch_m2)
+
+    def merge(self, other):
+        """
+        Merges another RunningStats accumulator into this one and returns it.
+        """
+        return self._merge(other.count, other.mean, other.m2)
+
+    @property
+    def variance(self):
+        """
+        Unbiased variance of a single repetition. None before any update, nan after a
+        single repetition.
+        """
+        if self.count == 0:
+            return None
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std_err(self):
+        """
+        Standard error of the running mean. None before any update, nan after a single
+        repetition.
+        """
+        if self.count == 0:
+            return None
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return np.sqrt(self.m2 / (self.count * (self.count - 1)))
+
+    def _merge(self, count, mean, m2):
+        """
+        Combines (count, mean, m2) of a disjoint set of repetitions into the state.
+        """
+        if count == 0:
+            return self
+        if self.count == 0:
+            self.count = count
+            self.mean = np.array(mean, dtype=np.float64)
+            self.m2 = np.array(m2, dtype=np.float64)
+            return self
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta ** 2 * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+        return self
+
+    def _get_scratch(self, shape):
+        """
+        Returns a float64 buffer of the given shape, reusing memory between updates.
+        """
+        scratch = self._scratch
+        is_reusable = scratch is not None and scratch.shape[1:] == shape[1:]
+        if not is_reusable or scratch.shape[0] < shape[0]:
+            scratch = self._scratch = np.empty(shape, dtype=np.float64)
+        return scratch[: shape[0]]
+
+
 def get_std_err(xs, ms, n, std_err=None, m=None, s=None):
     """
     Python implementation of Welford's online algorithm to calculate running std err
     Inspired by http://www.johndcook.com/standard_deviation.html
+    Stateless wrapper of RunningStats, prefer keeping one RunningStats across batches.
     Arguments:
     xs: raw data matrix, xs.shape[0] is the repetition dimension, while xs.shape[1] is the sweep dimension.
-    ms: mean value
-    n: the repetition = xs.shape[0]
+    ms: running mean after each repetition in xs, unused as the means are merged from xs
+    n: the total number of repetitions, including the ones in xs
     std_err: previous std err
     m: previous mean value
     s: previous sum of squares of differences from the current mean
     """
-    if std_err is None:
-        old_m, old_s = xs[0], np.zeros(xs.shape[1])  # m_1 = x_1, s_1 = 0
-        xs, ms = xs[1:], ms[1:]  # safe to ignore first result array
-    else:
-        old_m, old_s = m, s  # recall m_k-1, s_k-1
-
-    # the following lines do s_k = s_k-1 + (x_k - m_k-1) * (x_k - m_k)
-    new_deltas, old_deltas = xs - ms, xs - np.insert(ms, 0, old_m, 0)[:-1]
-    new_ss = np.vstack(((new_deltas * old_deltas), old_s))
-    new_m, new_s = ms[-1], np.sum(new_ss, axis=0)
-    std_err = np.sqrt(new_s / (n * (n - 1)))
-    return std_err, new_m, new_s
+    count = 0 if std_err is None else n - xs.shape[0]
+    running_stats = RunningStats(count, m, s).update(xs)
+    return running_stats.std_err, running_stats.mean, running_stats.m2
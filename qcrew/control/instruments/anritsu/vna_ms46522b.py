@@ -9,7 +9,8 @@ from qcrew.helpers import logger
 class VNA(Instrument):
     """ """
 
-    HEADER_LEN = 11
+    # binary transfer format, REAL (64 bit) or REAL32, and its struct datatype
+    DATA_FORMAT, DATA_TYPE = "real", "d"
     MIN_SWEEP_POINTS = 2
     MAX_SWEEP_POINTS = 20001
     MIN_SWEEP_DELAY = 0
@@ -83,6 +84,10 @@ class VNA(Instrument):
         self.handle.write(":sweep:type linear")  # for now, only support linear sweeps
         self.handle.write(":sense:sweep:delay:state 1")  # turn per point sweep delay on
 
+        # transfer data as little-endian binary blocks instead of ASCII
+        self.handle.write(f":format:data {VNA.DATA_FORMAT}")
+        self.handle.write(":format:border swapped")
+
     def configure(self, **config) -> None:
         """ """
         self.hold()
@@ -108,16 +113,16 @@ class VNA(Instrument):
         self.handle.close()
 
     @property
-    def data(self):
+    def data(self) -> dict[str, list[float]]:
         """ """
         self.hold()
         self.handle.write(":display:window:y:auto")  # auto-scale all traces
 
         data = dict()
         for count, key in enumerate(self.datakeys, start=1):
-            self.handle.write(f":calculate:parameter{count}:select")
-            data_str = self.handle.query(":calculate:data:fdata?")[VNA.HEADER_LEN :]
-            data[key] = [float(value) for value in data_str.split()]
+            # select the trace and read it in the same message, one round trip per trace
+            query = f":calculate:parameter{count}:select;:calculate:data:fdata?"
+            data[key] = self._query_binary(query)
         return data
 
     @property
@@ -126,10 +131,18 @@ class VNA(Instrument):
         return [f"{s_param}_{trace_format}" for s_param, trace_format in self._traces]
 
     @property
-    def frequencies(self) -> list:
-        """ """
-        freq_str = self.handle.query(":sense:frequency:data?")[VNA.HEADER_LEN :]
-        return [float(freq) for freq in freq_str.split()]
+    def frequencies(self) -> list[float]:
+        """ """
+        return self._query_binary(":sense:frequency:data?")
+
+    def _query_binary(self, query: str) -> list[float]:
+        """
+        Reads the IEEE 488.2 binary block returned by query into a list, which unlike
+        a numpy array can be sent to clients of the VNA's Pyro proxy.
+        """
+        return self.handle.query_binary_values(
+            query, datatype=VNA.DATA_TYPE, is_big_endian=False, container=list
+        )
 
     @property
     def fcenter(self) -> float:
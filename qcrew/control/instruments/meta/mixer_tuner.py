@@ -1,8 +1,10 @@
 """ """
 
+import functools
+import itertools
 import math
 import time
-from typing import Callable
+from typing import Callable, Generator
 
 import numpy as np
 import scipy.optimize
@@ -21,22 +23,53 @@ from qm.QuantumMachine import QuantumMachine
 class MixerTuner:
     """ """
 
+    methods: tuple[str] = ("nelder-mead", "paraboloid")  # see _minimize()
+    method: str = "nelder-mead"
     simplex: np.ndarray = np.array([[0.0, 0.0], [0.0, 0.1], [0.1, 0.0]])
     threshold: float = 2.0  # in dBm
     maxiter: int = 100
+    probe_step: float = 0.05  # initial spacing of the paraboloid probe grid
+    max_rounds: int = 3  # max number of paraboloid fits
+    shrink: float = 0.3  # scales the probe grid spacing between paraboloid fits
+    fast_probe: bool = False  # measure contrast with Sa124.get_tone_contrast(), no sweep
+    parallel: bool = False  # tune all modes at once if their tones are span apart
     span: float = 2e6
     rbw: float = 50e3
     ref_power: float = 0.0
 
-    def __init__(self, *modes: qcm.Mode, sa: Sa124, qm: QuantumMachine) -> None:
+    def __init__(
+        self,
+        *modes: qcm.Mode,
+        sa: Sa124,
+        qm: QuantumMachine,
+        method: str = None,
+        fast_probe: bool = None,
+        parallel: bool = None,
+    ) -> None:
         """ """
         self._sa: Sa124 = sa
         self._qm: QuantumMachine = qm
         self._modes: tuple[qcm.Mode] = modes
+        if method is not None:
+            if method not in self.methods:
+                raise ValueError(f"Invalid {method = }, valid methods: {self.methods}")
+            self.method = method
+        if fast_probe is not None:
+            self.fast_probe = fast_probe
+        if parallel is not None:
+            self.parallel = parallel
+        self.acquisitions: int = 0  # number of SA acquisitions made by objective fns
         logger.info(f"Initialized MixerTuner with {self._modes}")
 
     def tune(self) -> None:
         """ """
+        if self.parallel and len(self._modes) > 1:
+            if self._are_tones_separated():
+                self._tune_parallel()
+                return
+            logger.warning("Tones too close for parallel tuning, tuning in series")
+
+        job = None
         try:
             for mode in self._modes:
                 mode.lo_freq = mode.lo_freq  # play carrier freq to mode
@@ -45,60 +78,175 @@ class MixerTuner:
         except AttributeError:
             logger.error("MixerTuner is initialized with unrecognized arguments")
             raise
-        else:
-            job.halt()
+        finally:
+            if job is not None:  # stop playing tones whether tuning succeeded or not
+                job.halt()
+        logger.info(f"Tuning used {self.acquisitions} SA acquisitions in total")
+
+    def _tune_parallel(self) -> None:
+        """
+        Plays all modes from one QUA program and tunes the LO leakage of all modes, then
+        their SB leakage. Paraboloid searches of all modes advance in turn, one SA
+        acquisition each, re-centering the SA on each mode's tone before reading it.
+        """
+        if self.method != "paraboloid":
+            logger.warning(f"Parallel tuning ignores method={self.method!r}")
+        job = None
+        try:
+            for mode in self._modes:
+                mode.lo_freq = mode.lo_freq  # play carrier freq to mode
+            job = self._qm.execute(self._get_qua_program(*self._modes))  # int freqs
+            for key in ("LO", "SB"):
+                self._tune_round_robin(key, job)
+        except AttributeError:
+            logger.error("MixerTuner is initialized with unrecognized arguments")
+            raise
+        finally:
+            if job is not None:  # stop playing tones whether tuning succeeded or not
+                job.halt()
+        logger.info(f"Tuning used {self.acquisitions} SA acquisitions in total")
+
+    def _tune_round_robin(self, key: str, job: QmJob) -> None:
+        """ """
+        searches = dict()  # mode: [objective fn, search, offsets to evaluate next]
+        for mode in self._modes:
+            center = self._get_center(mode, key)
+            is_tuned, center_idx, floor = self._check_tuning(center=center)
+            if is_tuned:
+                logger.success(f"{mode} {key} already within {self.threshold}dBm!")
+                continue
+            get_contrast = self._get_probe(center, center_idx, floor, recenter=True)
+            if key == "LO":
+                objective_fn = self._get_lo_objective(mode, get_contrast)
+            else:
+                objective_fn = self._get_sb_objective(mode, job, get_contrast)
+            search = self._get_paraboloid_search()
+            searches[mode] = [objective_fn, search, next(search)]
+
+        logger.info(f"Minimizing {key} leakage of {list(searches)} in parallel...")
+        start_time, start_acquisitions = time.perf_counter(), self.acquisitions
+        while searches:
+            for mode, state in list(searches.items()):
+                objective_fn, search, offsets = state
+                try:
+                    state[2] = search.send(objective_fn(offsets))
+                except StopIteration as stop:
+                    del searches[mode]
+                    result, offsets = stop.value, stop.value.x
+                    if offsets is None:  # no finite contrast was probed
+                        logger.error(f"{mode} {key} search: {result.message}")
+                        continue
+                    if not result.success:
+                        logger.warning(f"{mode} {key} search: {result.message}")
+                    self._set_best_offsets(mode, key, objective_fn, offsets, start_time)
+        count = self.acquisitions - start_acquisitions
+        logger.info(f"Parallel {key} tuning used {count} SA acquisitions")
+
+    def _set_best_offsets(
+        self,
+        mode: qcm.Mode,
+        key: str,
+        objective_fn: Callable[[tuple[float]], float],
+        offsets: tuple[float],
+        start_time: float,
+    ) -> None:
+        """ """
+        contrast = objective_fn(offsets)  # also sets the offsets on the running program
+        time_ = time.perf_counter() - start_time
+        logger.success(f"Minimized {mode} {key} in {time_:.5}s, final {contrast = :.5}")
+        if contrast > self.threshold:
+            diff = contrast - self.threshold
+            logger.warning(f"Final contrast exceeds threshold by {diff}dBm")
+        names = ("I", "Q") if key == "LO" else ("G", "P")
+        mode.mixer_offsets = dict(zip(names, offsets))
+
+    def _are_tones_separated(self) -> bool:
+        """
+        Returns True if the LO, SB and signal tones of different modes are all more than
+        span apart, so that no tone falls in the sweep around another mode's tone.
+        """
+        for mode_a, mode_b in itertools.combinations(self._modes, 2):
+            for tone_a in self._get_tones(mode_a):
+                for tone_b in self._get_tones(mode_b):
+                    if abs(tone_a - tone_b) <= self.span:
+                        logger.debug(f"{mode_a} and {mode_b} have tones within span")
+                        return False
+        return True
+
+    def _get_tones(self, mode: qcm.Mode) -> tuple[float]:
+        """ """
+        lo_freq, int_freq = mode.lo_freq, mode.int_freq
+        return (lo_freq, lo_freq - int_freq, lo_freq + int_freq)
+
+    def _get_center(self, mode: qcm.Mode, key: str) -> float:
+        """ """
+        return mode.lo_freq if key == "LO" else mode.lo_freq - mode.int_freq
 
     def _tune_mode(self, mode: qcm.Mode, job: QmJob) -> None:
         """ """
         for key in ("LO", "SB"):
-            center = mode.lo_freq if key == "LO" else mode.lo_freq - mode.int_freq
+            center = self._get_center(mode, key)
             is_tuned, center_idx, floor = self._check_tuning(center=center)
             if is_tuned:
                 logger.success(f"{key} already tuned to within {self.threshold}dBm!")
                 continue
             logger.info(f"Minimizing {mode} {key} leakage...")
+            get_contrast = self._get_probe(center, center_idx, floor)
             if key == "LO":
-                i_offset, q_offset = self._tune_lo(mode, center_idx, floor)
+                i_offset, q_offset = self._tune_lo(mode, get_contrast)
                 if i_offset is not None and q_offset is not None:
                     mode.mixer_offsets = {"I": i_offset, "Q": q_offset}
             elif key == "SB":
-                g_offset, p_offset = self._tune_sb(mode, job, center_idx, floor)
+                g_offset, p_offset = self._tune_sb(mode, job, get_contrast)
                 if g_offset is not None and p_offset is not None:
                     mode.mixer_offsets = {"G": g_offset, "P": p_offset}
 
-    def _tune_lo(self, mode: qcm.Mode, center_idx: int, floor: float) -> tuple[float]:
+    def _tune_lo(
+        self, mode: qcm.Mode, get_contrast: Callable[[], float]
+    ) -> tuple[float]:
+        """ """
+        result = self._minimize(self._get_lo_objective(mode, get_contrast))
+        return result if result is not None else (None, None)
+
+    def _tune_sb(
+        self, mode: qcm.Mode, job: QmJob, get_contrast: Callable[[], float]
+    ) -> None:
+        """ """
+        result = self._minimize(self._get_sb_objective(mode, job, get_contrast))
+        return result if result is not None else (None, None)
+
+    def _get_lo_objective(
+        self, mode: qcm.Mode, get_contrast: Callable[[], float]
+    ) -> Callable[[tuple[float]], float]:
         """ """
 
         def objective_fn(offsets: tuple[float]) -> float:
             i_offset, q_offset, mode_name = offsets[0], offsets[1], mode.name
             self._qm.set_output_dc_offset_by_element(mode_name, "I", i_offset)
             self._qm.set_output_dc_offset_by_element(mode_name, "Q", q_offset)
-            contrast = self._get_contrast(center_idx, floor)
+            contrast = get_contrast()
             return contrast
 
-        result = self._minimize(objective_fn)
-        return result if result is not None else (None, None)
+        return objective_fn
 
-    def _tune_sb(
-        self, mode: qcm.Mode, job: QmJob, center_idx: int, floor: float
-    ) -> None:
+    def _get_sb_objective(
+        self, mode: qcm.Mode, job: QmJob, get_contrast: Callable[[], float]
+    ) -> Callable[[tuple[float]], float]:
         """ """
 
         def objective_fn(offsets: tuple[float]) -> float:
             correction_matrix = qciqm.QMConfig.get_mixer_correction_matrix(*offsets)
             job.set_element_correction(mode.name, correction_matrix)
-            contrast = self._get_contrast(center_idx, floor)
+            contrast = get_contrast()
             return contrast
 
-        result = self._minimize(objective_fn)
-        return result if result is not None else (None, None)
+        return objective_fn
 
     def _check_tuning(self, center: float) -> tuple[bool, int, float]:
         """ """
-        span, rbw, ref_pow = self.span, self.rbw, self.ref_power
-        fs, amps = self._sa.sweep(center=center, span=span, rbw=rbw, ref_power=ref_pow)
-        sweep_info = self._sa.sweep_info
-        center_idx = math.ceil(sweep_info["sweep_length"] / 2 + 1)
+        packed = self._sa.sweep_packed(**self._get_sweep_params(center))
+        fs, amps = Sa124.unpack_sweep(packed)
+        center_idx = math.ceil(len(amps) / 2 + 1)
         stop, start = int(center_idx / 2), int(center_idx + (center_idx / 2))
         floor = (np.average(amps[:stop]) + np.average(amps[start:])) / 2
         contrast = amps[center_idx] - floor
@@ -107,30 +255,186 @@ class MixerTuner:
         logger.debug(f"Tuning check at {real_center:E}: {contrast = :.5}dBm")
         return is_tuned, center_idx, floor
 
-    def _get_qua_program(self, mode: qcm.Mode) -> _Program:
+    def _get_sweep_params(self, center: float) -> dict[str, float]:
+        """ """
+        return {
+            "center": center,
+            "span": self.span,
+            "rbw": self.rbw,
+            "ref_power": self.ref_power,
+        }
+
+    def _get_qua_program(self, *modes: qcm.Mode) -> _Program:
         """ """
         with program() as mixer_tuning:
             with infinite_loop_():
-                mode.play("constant_pulse")
+                for mode in modes:  # modes are distinct elements, so they play at once
+                    mode.play("constant_pulse")
         return mixer_tuning
 
+    def _get_probe(
+        self, center: float, center_idx: int, floor: float, recenter: bool = False
+    ) -> Callable[[], float]:
+        """
+        Returns a function measuring the leakage contrast at center. It reads the center
+        bin of a full sweep or, if fast_probe, the tone and noise floor powers from the
+        spectrum of a short IQ acquisition, see Sa124.get_tone_contrast(). If recenter,
+        sweeps are re-centered on center, as other tones may be measured in between.
+        """
+        if self.fast_probe:
+            return functools.partial(self._get_tone_contrast, center)
+        if recenter:
+            return functools.partial(
+                self._get_centered_contrast, center, center_idx, floor
+            )
+        return functools.partial(self._get_contrast, center_idx, floor)
+
     def _get_contrast(self, center_idx: int, floor: float) -> float:
         """ """
-        _, amps = self._sa.sweep()
+        self.acquisitions += 1
+        _, amps = Sa124.unpack_sweep(self._sa.sweep_packed())
         return abs(amps[center_idx] - floor)
 
-    def _minimize(self, fn: Callable[[tuple[float]], float]) -> tuple[float]:
+    def _get_centered_contrast(
+        self, center: float, center_idx: int, floor: float
+    ) -> float:
+        """ """
+        self.acquisitions += 1
+        packed = self._sa.sweep_packed(**self._get_sweep_params(center))
+        _, amps = Sa124.unpack_sweep(packed)
+        return abs(amps[center_idx] - floor)
+
+    def _get_tone_contrast(self, center: float) -> float:
         """ """
-        start_time = time.perf_counter()
-        fatol, simplex, maxiter = self.threshold, self.simplex, self.maxiter
-        opt = {"fatol": fatol, "initial_simplex": simplex, "maxiter": maxiter}
-        result = scipy.optimize.minimize(fn, [0, 0], method="Nelder-Mead", options=opt)
-        if result.success:
-            time_, contrast = time.perf_counter() - start_time, fn(result.x)
-            logger.success(f"Minimized in {time_:.5}s with final {contrast = :.5}")
-            if contrast > self.threshold:
-                diff = contrast - self.threshold
-                logger.warning(f"Final contrast exceeds threshold by {diff}dBm")
-            return result.x
+        self.acquisitions += 1
+        return abs(self._sa.get_tone_contrast(center))
+
+    def _minimize(self, fn: Callable[[tuple[float]], float]) -> tuple[float]:
+        """
+        Minimizes fn with scipy's Nelder-Mead, or with successive paraboloid fits (see
+        _paraboloid_search()) which need far fewer SA acquisitions. Returns the best
+        offsets found, after setting them with fn, even if the search did not converge.
+        """
+        start_time, start_acquisitions = time.perf_counter(), self.acquisitions
+        if self.method == "paraboloid":
+            result = self._run_search(fn, self._get_paraboloid_search())
         else:
+            fatol, simplex, maxiter = self.threshold, self.simplex, self.maxiter
+            opt = {"fatol": fatol, "initial_simplex": simplex, "maxiter": maxiter}
+            result = scipy.optimize.minimize(
+                fn, [0, 0], method="Nelder-Mead", options=opt
+            )
+        if result.x is None:  # no finite contrast was probed
             logger.error(f"Minimization unsuccessful, details: {result.message}")
+            return None
+        if not result.success:
+            logger.warning(f"Using the best offsets probed, details: {result.message}")
+        time_, contrast = time.perf_counter() - start_time, fn(result.x)  # sets them
+        count = self.acquisitions - start_acquisitions
+        logger.success(
+            f"Minimized in {time_:.5}s with {count} SA acquisitions and final "
+            f"{contrast = :.5}"
+        )
+        if contrast > self.threshold:
+            diff = contrast - self.threshold
+            logger.warning(f"Final contrast exceeds threshold by {diff}dBm")
+        return result.x
+
+    def _get_paraboloid_search(self) -> Generator:
+        """ """
+        step, rounds, shrink = self.probe_step, self.max_rounds, self.shrink
+        return _paraboloid_search((0.0, 0.0), step, rounds, shrink, self.threshold)
+
+    def _run_search(
+        self, fn: Callable[[tuple[float]], float], search: Generator
+    ) -> scipy.optimize.OptimizeResult:
+        """
+        Evaluates fn at the offsets yielded by search until it returns its result.
+        """
+        try:
+            offsets = next(search)
+            while True:
+                offsets = search.send(fn(offsets))
+        except StopIteration as stop:
+            return stop.value
+
+
+def _paraboloid_search(
+    start: tuple[float], step: float, rounds: int, shrink: float, threshold: float
+) -> Generator[np.ndarray, float, scipy.optimize.OptimizeResult]:
+    """
+    Minimizes a leakage contrast (in dB above the floor) of two offsets. Each round
+    probes a 3x3 grid of the given step around the center, fits a paraboloid to the
+    probed leakage power in linear units, which is quadratic in the offset errors, and
+    probes its minimum, clamped to a trust region of two steps. If the fit is
+    degenerate, the round ends on the best grid probe instead. The next round is
+    centered on the best offsets probed so far with the step scaled by shrink.
+    Yields the offsets to probe and expects their contrast to be sent back. Stops once
+    the contrast is below threshold, after the given number of rounds or when a probe
+    is not finite, and returns an OptimizeResult with the offsets and contrast of the
+    best probe, which is only successful if the contrast is below threshold.
+    """
+    grid = np.array([(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)], dtype=float)
+    center, best_offsets, best_contrast = np.array(start, dtype=float), None, np.inf
+    num_rounds, num_probes, num_degenerate_fits, message = 0, 0, 0, None
+    for num_rounds in range(1, rounds + 1):
+        contrasts = list()
+        for offsets in center + step * grid:
+            contrast = yield offsets
+            contrasts.append(contrast)
+            if contrast < best_contrast:
+                best_offsets, best_contrast = offsets, contrast
+        num_probes += len(grid)
+        if best_contrast < threshold:
+            break
+        if not np.all(np.isfinite(contrasts)):
+            message = f"Probed a non-finite contrast in round {num_rounds}"
+            break
+
+        jump = _get_paraboloid_minimum(grid, 10 ** (np.array(contrasts) / 10))
+        if jump is None:  # fall back to the best grid probe
+            num_degenerate_fits += 1
+        else:
+            jump *= min(1.0, 2.0 / max(np.linalg.norm(jump), 1e-12))  # trust region
+            offsets = center + step * jump
+            contrast = yield offsets
+            num_probes += 1
+            if contrast < best_contrast:
+                best_offsets, best_contrast = offsets, contrast
+            if best_contrast < threshold:
+                break
+
+        center, step = best_offsets, step * shrink
+
+    success = bool(best_contrast < threshold)
+    if success:
+        message = f"Contrast below {threshold}dB"
+    elif message is None:
+        message = f"Contrast above {threshold}dB after {num_rounds} rounds"
+    if num_degenerate_fits:
+        message += f", {num_degenerate_fits} paraboloid fits were degenerate"
+    return scipy.optimize.OptimizeResult(
+        x=best_offsets,
+        fun=best_contrast,
+        success=success,
+        message=message,
+        nit=num_rounds,
+        nfev=num_probes,
+    )
+
+
+def _get_paraboloid_minimum(points: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Least-squares fits z = a + b*x + c*y + d*x^2 + e*x*y + f*y^2 to values at points and
+    returns the location of its minimum. Returns None if the fit is degenerate, i.e.
+    the points do not determine it or it is not convex beyond round-off.
+    """
+    x, y = points.T
+    design = np.stack((np.ones_like(x), x, y, x ** 2, x * y, y ** 2), axis=1)
+    (_, b, c, d, e, f), _, rank, _ = np.linalg.lstsq(design, values, rcond=None)
+    hessian = np.array([[2 * d, e], [e, 2 * f]])
+    min_curvature = np.sqrt(np.finfo(float).eps) * np.max(np.abs(values))
+    is_convex = np.all(np.linalg.eigvalsh(hessian) > min_curvature)
+    if rank < design.shape[1] or not is_convex:
+        return None
+    return np.linalg.solve(hessian, -np.array([b, c]))
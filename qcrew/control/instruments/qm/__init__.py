@@ -1,4 +1,9 @@
 """ """
 
 from qcrew.control.instruments.qm.qm_config_builder import QMConfig, QMConfigBuilder
-from qcrew.control.instruments.qm.qm_result_fetcher import QMResultFetcher
+from qcrew.control.instruments.qm.qm_program_cache import QMProgramCache
+from qcrew.control.instruments.qm.qm_result_fetcher import (
+    QMResultFetcher,
+    QMResultStore,
+)
+from qcrew.control.instruments.qm.qm_session import QMSession
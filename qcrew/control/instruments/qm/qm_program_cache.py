@@ -0,0 +1,82 @@
+""" """
+
+from collections import OrderedDict
+import hashlib
+import json
+from typing import Any
+
+import numpy as np
+from qm.QmJob import QmJob
+from qm.QuantumMachine import QuantumMachine
+
+from qcrew.helpers import logger
+
+
+class QMProgramCache:
+    """
+    Remembers the ids of QUA programs compiled on each quantum machine, keyed on a
+    stable hash of everything that determines the program, so re-running an identical
+    experiment skips compilation. Falls back to qm.execute() on QM versions without
+    qm.compile().
+    """
+
+    maxsize: int = 16  # number of program ids kept, least recently used are evicted
+
+    def __init__(self) -> None:
+        """ """
+        self._program_ids: OrderedDict[str, Any] = OrderedDict()
+        self.hits: int = 0  # number of executions that reused a compiled program
+        self.misses: int = 0  # number of executions that compiled their program
+
+    def __len__(self) -> int:
+        """ """
+        return len(self._program_ids)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Returns a hex digest of the given JSON-serializable parts, which does not depend
+        on dict ordering. numpy arrays and scalars, tuples and sets are also accepted.
+        """
+        serialized = json.dumps(parts, sort_keys=True, default=_to_json)
+        return hashlib.sha1(serialized.encode()).hexdigest()
+
+    def execute(self, qm: QuantumMachine, program, *key_parts: Any) -> QmJob:
+        """
+        Executes the QUA program on the qm, reusing the program compiled earlier on the
+        same qm for the same key parts if there is one.
+        """
+        if not hasattr(qm, "compile"):  # older QM API, compiles on every execute
+            return qm.execute(program)
+
+        key = self.make_key(qm.id, *key_parts)
+        program_id = self._program_ids.get(key)
+        if program_id is None:
+            self.misses += 1
+            program_id = qm.compile(program)
+            self._program_ids[key] = program_id
+            if len(self._program_ids) > self.maxsize:
+                self._program_ids.popitem(last=False)
+        else:
+            self.hits += 1
+            self._program_ids.move_to_end(key)
+            logger.info(f"Reusing program compiled on QM '{qm.id}'")
+
+        return qm.queue.add_compiled(program_id).wait_for_execution()
+
+    def clear(self) -> None:
+        """ """
+        self._program_ids.clear()
+
+
+def _to_json(obj: Any) -> Any:
+    """
+    Converts objects json does not serialize natively, used as json.dumps default.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    return repr(obj)
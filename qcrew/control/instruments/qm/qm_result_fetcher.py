@@ -1,29 +1,119 @@
 """ """
 
-from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Any, Callable, Iterable
 
+import numpy as np
 from qm._results_01 import MultipleNamedJobResult, SingleNamedJobResult
 from qm.QmJob import JobResults
 
 
+class QMResultStore:
+    """
+    Preallocated, growable array holding the rows fetched so far for one result tag.
+    Batches are written in place and handed out as views, which stay valid after the
+    store grows because rows are never overwritten once written.
+    """
+
+    initial_capacity: int = 256  # in rows, first allocation if no max_rows is given
+    growth_factor: float = 2.0  # capacity multiplier when the store runs out of rows
+
+    def __init__(
+        self, row_shape: tuple, dtype=np.float64, max_rows: int = None
+    ) -> None:
+        """ """
+        self._row_shape: tuple = tuple(row_shape)
+        self._max_rows: int = max_rows  # expected total rows, caps geometric growth
+        capacity = self.initial_capacity
+        if max_rows is not None:
+            capacity = min(capacity, max_rows)
+        self._data: np.ndarray = np.empty((capacity, *self._row_shape), dtype=dtype)
+        self._count: int = 0  # number of rows written
+        self._last_start: int = 0  # first row of the latest batch
+
+    def __len__(self) -> int:
+        """ """
+        return self._count
+
+    @property
+    def row_shape(self) -> tuple:
+        """ """
+        return self._row_shape
+
+    @property  # view of the rows written by the latest append()
+    def latest_batch(self) -> np.ndarray:
+        """ """
+        return self._data[self._last_start : self._count]
+
+    @property  # view of all rows written so far
+    def all_so_far(self) -> np.ndarray:
+        """ """
+        return self._data[: self._count]
+
+    def append(self, batch: np.ndarray) -> np.ndarray:
+        """ """
+        num_rows = len(batch)
+        stop = self._count + num_rows
+        if stop > len(self._data):
+            self._grow(stop)
+        self._data[self._count : stop] = batch
+        self._last_start, self._count = self._count, stop
+        return self.latest_batch
+
+    def _grow(self, min_capacity: int) -> None:
+        """ """
+        capacity = max(min_capacity, int(len(self._data) * self.growth_factor))
+        if self._max_rows is not None and min_capacity <= self._max_rows:
+            capacity = min(capacity, self._max_rows)  # never over-allocate past reps
+        data = np.empty((capacity, *self._row_shape), dtype=self._data.dtype)
+        data[: self._count] = self._data[: self._count]
+        self._data = data
+
+
 class QMResultFetcher:
     """ """
 
-    def __init__(self, handle: JobResults) -> None:
+    min_poll_interval: float = 0.01  # in s, first wait between polls for new results
+    poll_backoff: float = 2.0  # factor by which the poll interval grows while idle
+
+    def __init__(
+        self,
+        handle: JobResults,
+        row_shapes: dict[str, tuple] = None,
+        reps: int = None,
+        max_workers: int = 1,
+    ) -> None:
         """ """
         self._handle: JobResults = handle
+        self._executor: ThreadPoolExecutor = None  # fetch tags concurrently if set
+        if max_workers > 1:
+            prefix = type(self).__name__
+            self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=prefix)
         self._result_spec: dict[str, Callable] = {"single": dict(), "multiple": dict()}
+        self._row_shapes: dict[str, tuple] = row_shapes or dict()  # per result tag
+        self._reps: int = reps  # expected number of result rows per tag
+        self._stores: dict[str, QMResultStore] = dict()  # only used in live fetch mode
 
         if self._handle.is_processing():  # determine fetch mode - live or not live
             self._is_live: bool = True
             self.is_fetching: bool = True  # to indicate live fetching status
             self.count: int = 0  # current number of results fetched
             self._last_count: int = None  # only used in live fetch mode
+            self._poll_interval: float = self.min_poll_interval  # adapts while waiting
             self._set_result_spec()
         else:
             self._is_live = False
             self.is_fetching, self.count, self._last_count = None, None, None
 
+    def __enter__(self):
+        """ """
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        """ """
+        self.close()
+
     def _set_result_spec(self):
         """ """
         for tag, result in self._handle:
@@ -32,9 +122,16 @@ class QMResultFetcher:
             elif isinstance(result, MultipleNamedJobResult):
                 if self._is_live:
                     self._result_spec["multiple"][tag] = self._fetch_batch
+                    if tag in self._row_shapes:  # preallocate before the first batch
+                        row_shape = self._row_shapes[tag]
+                        store = QMResultStore(row_shape, max_rows=self._reps)
+                        self._stores[tag] = store
                 else:
                     self._result_spec["multiple"][tag] = self._fetch_multiple
-                result.wait_for_values(2)  # so that std err can be calculated
+                # so that std err can be calculated. A run with rep_block == reps
+                # streams a single row holding all reps, waiting for 2 would block
+                num_rows = 2 if self._reps is None else min(2, self._reps)
+                result.wait_for_values(num_rows)
 
     def fetch(self) -> dict[str, list]:
         """ """
@@ -44,19 +141,64 @@ class QMResultFetcher:
             if self.count == self._last_count:  # no new results to fetch
                 if not self._handle.is_processing():
                     self.is_fetching, self._is_live = False, False  # live fetch is done
+                    self.close()
                 return dict()  # return empty dict because no new results to fetch
         else:
             self._set_result_spec()  # set result spec for non-live fetch mode
 
-        results = dict()  # populate and return results dictionary
-        for result_spec in self._result_spec.values():
-            for tag, method in result_spec.items():
-                results[tag] = method(tag)
-        return results
+        # all batches are sliced up to the same self.count snapshot, so results stay
+        # consistent across tags even when they are fetched concurrently
+        tasks = [item for spec in self._result_spec.values() for item in spec.items()]
+        values = self._map(lambda task: task[1](task[0]), tasks)
+        return {tag: value for (tag, _), value in zip(tasks, values)}
+
+    def close(self) -> None:
+        """ """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _map(self, fn: Callable[[Any], Any], items: Iterable) -> list:
+        """ """
+        if self._executor is None:
+            return [fn(item) for item in items]
+        return list(self._executor.map(fn, items))
+
+    def wait_for_new_results(
+        self, min_count: int = 1, timeout: float = None, max_interval: float = 1.0
+    ) -> bool:
+        """
+        Blocks until at least `min_count` results beyond `self.count` are available or
+        the job stops processing, polling with an interval that doubles (up to
+        `max_interval`) while no new results arrive and resets once they do. Returns
+        False if `timeout` (in s) elapsed first.
+        """
+        if not self._is_live:
+            return True
+
+        start_time, seen_count = time.perf_counter(), self.count
+        while True:
+            count = self._count_results()
+            if count > seen_count:  # new data, poll eagerly again
+                seen_count, self._poll_interval = count, self.min_poll_interval
+            if count - self.count >= min_count or not self._handle.is_processing():
+                return True
+
+            elapsed_time = time.perf_counter() - start_time
+            if timeout is not None and elapsed_time >= timeout:
+                return False
+
+            interval = self._poll_interval
+            if timeout is not None:
+                interval = min(interval, timeout - elapsed_time)
+            time.sleep(interval)
+            next_interval = self._poll_interval * self.poll_backoff
+            self._poll_interval = min(next_interval, max_interval)
 
     def _count_results(self):
         """ """
-        return min(len(self._handle.get(tag)) for tag in self._result_spec["multiple"])
+        tags = self._result_spec["multiple"]
+        return min(self._map(lambda tag: len(self._handle.get(tag)), tags))
 
     def _fetch_single(self, tag):
         """ """
@@ -65,7 +207,25 @@ class QMResultFetcher:
     def _fetch_batch(self, tag):
         """ """
         slc = slice(self._last_count, self.count)
-        return self._handle.get(tag).fetch(slc, flat_struct=True)
+        batch = self._handle.get(tag).fetch(slc, flat_struct=True)
+        store = self._stores.get(tag)
+        if store is None:
+            store = QMResultStore(batch.shape[1:], batch.dtype, max_rows=self._reps)
+            self._stores[tag] = store
+        elif store.row_shape != batch.shape[1:]:  # replacing it would lose its rows
+            raise ValueError(
+                f"Fetched rows of result '{tag}' have shape {batch.shape[1:]}, "
+                f"expected {store.row_shape}"
+            )
+        return store.append(batch)  # view into the store, no further copies needed
+
+    def latest_batch(self, tag: str) -> np.ndarray:
+        """ """
+        return self._stores[tag].latest_batch
+
+    def all_so_far(self, tag: str) -> np.ndarray:
+        """ """
+        return self._stores[tag].all_so_far
 
     def _fetch_multiple(self, tag):
         """ """
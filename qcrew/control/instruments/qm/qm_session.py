@@ -0,0 +1,169 @@
+""" """
+
+import copy
+from typing import Any
+
+import numpy as np
+from qm.QuantumMachine import QuantumMachine
+from qm.QuantumMachinesManager import QuantumMachinesManager
+
+from qcrew.helpers import logger
+
+
+class QMSession:
+    """
+    Keeps one quantum machine open across stages and runs. The config of the open QM is
+    tracked, and a new config only re-opens the QM if it differs in more than the AO DC
+    offsets and mixer correction matrices, which are pushed to the running QM instead.
+    Whether the QM is still open is only checked with the manager on the first access
+    after invalidate(), e.g. once per run, not on every access.
+    """
+
+    def __init__(self) -> None:
+        """ """
+        self._qmm: QuantumMachinesManager = None  # created on first use by qmm getter
+        self._qm: QuantumMachine = None  # updated by get_qm()
+        self._config: dict[str, Any] = None  # plain dict copy of the open QM's config
+        self._is_verified: bool = False  # True once the QM is known to be open
+
+    @property  # qmm getter
+    def qmm(self) -> QuantumMachinesManager:
+        """ """
+        if self._qmm is None:
+            self._qmm = QuantumMachinesManager()
+        return self._qmm
+
+    def get_qm(self, config: dict[str, Any]) -> QuantumMachine:
+        """
+        Returns the open QM updated to the given config, opening a new QM if needed.
+        """
+        config = _to_plain_dict(config)
+
+        if not self._is_open():
+            self._open(config)
+        elif config != self._config:
+            if self._push_runtime_settings(config):
+                self._config = config
+            else:
+                self._open(config)
+        else:
+            logger.debug(f"Reusing QM '{self._qm.id}' with unchanged config")
+
+        return self._qm
+
+    def close(self) -> None:
+        """ """
+        if self._qm is not None:
+            self._qm.close()
+            logger.info(f"Closed QM '{self._qm.id}'")
+        self._qm, self._config = None, None
+        self._is_verified = False
+
+    def invalidate(self) -> None:
+        """
+        Makes the next get_qm() check that the QM is still open, e.g. at the start of a
+        run or after a call to the QM failed.
+        """
+        self._is_verified = False
+
+    def _is_open(self) -> bool:
+        """ """
+        if self._qm is None:
+            return False
+        if not self._is_verified:
+            # the QM may have been closed elsewhere, e.g. by another open_qm() call
+            open_ids = self.qmm.list_open_quantum_machines()
+            self._is_verified = self._qm.id in open_ids
+        return self._is_verified
+
+    def _open(self, config: dict[str, Any]) -> None:
+        """ """
+        self._qm = self.qmm.open_qm(config)
+        self._config = config
+        self._is_verified = True
+        logger.info(f"Opened QM '{self._qm.id}'")
+
+    def _push_runtime_settings(self, config: dict[str, Any]) -> bool:
+        """
+        Pushes changed AO DC offsets and mixer corrections to the open QM. Returns False
+        without pushing anything if other parts of the config changed, or if an offset
+        cannot be mapped to an element input.
+        """
+        old_config, old_offsets, old_corrections = _split_runtime_settings(self._config)
+        new_config, new_offsets, new_corrections = _split_runtime_settings(config)
+        if new_config != old_config:
+            return False
+
+        offset_updates = list()
+        for port, offset in new_offsets.items():
+            if offset != old_offsets.get(port):
+                element_input = _find_element_input(config, port)
+                if element_input is None:
+                    return False
+                offset_updates.append((*element_input, offset))
+
+        correction_updates = list()
+        for mixer_entry, correction in new_corrections.items():
+            if correction != old_corrections.get(mixer_entry):
+                correction_updates.append((*mixer_entry, tuple(correction)))
+
+        for element, input_name, offset in offset_updates:
+            self._qm.set_output_dc_offset_by_element(element, input_name, offset)
+            logger.debug(f"Set '{element}' AO DC '{input_name}' {offset = }")
+        for mixer, int_freq, lo_freq, correction in correction_updates:
+            self._qm.set_mixer_correction(mixer, int_freq, lo_freq, correction)
+            logger.debug(f"Set '{mixer}' correction matrix to {correction}")
+
+        logger.info(f"Updated QM '{self._qm.id}' without re-opening it")
+        return True
+
+
+def _to_plain_dict(value: Any) -> Any:
+    """
+    Returns a deep copy of a (nested) QM config with dicts in place of QMConfig and
+    lists in place of numpy arrays, so configs can be compared and stored safely.
+    """
+    if isinstance(value, dict):
+        return {key: _to_plain_dict(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_plain_dict(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def _split_runtime_settings(config: dict[str, Any]) -> tuple:
+    """
+    Returns a copy of config without AO DC offsets and mixer corrections, plus dicts of
+    the offsets keyed by (controller, port) and corrections keyed by mixer entry.
+    """
+    config = copy.deepcopy(config)
+
+    offsets = dict()
+    for controller_name, controller in config.get("controllers", {}).items():
+        for port, analog_output in controller.get("analog_outputs", {}).items():
+            offsets[(controller_name, port)] = analog_output.pop("offset", None)
+
+    corrections = dict()
+    for mixer_name, mixer_entries in config.get("mixers", {}).items():
+        for entry in mixer_entries:
+            int_freq = entry.get("intermediate_frequency")
+            lo_freq = entry.get("lo_frequency")
+            corrections[(mixer_name, int_freq, lo_freq)] = entry.pop("correction", None)
+
+    return config, offsets, corrections
+
+
+def _find_element_input(config: dict[str, Any], port: tuple) -> tuple[str, str]:
+    """
+    Returns (element name, input name) of an element fed by the given AO port, None if
+    no element uses it.
+    """
+    for element_name, element in config.get("elements", {}).items():
+        mix_inputs = element.get("mixInputs", {})
+        for input_name in ("I", "Q"):
+            if tuple(mix_inputs.get(input_name, ())) == port:
+                return element_name, input_name
+        if tuple(element.get("singleInput", {}).get("port", ())) == port:
+            return element_name, "single"
+    return None
@@ -1,7 +1,10 @@
 """ Sa124 class written to support the SA124B's frequency sweep mode. A frequency sweep displays amplitude on the vertical axis and frequency on the horizontal axis """
 
+import base64
+from collections import OrderedDict
+import struct
 import time
-from typing import ClassVar
+from typing import ClassVar, Union
 
 import numpy as np
 
@@ -9,6 +12,9 @@ from qcrew.control.instruments.instrument import Instrument
 import qcrew.control.instruments.signal_hound.sa_api as sa
 from qcrew.helpers import logger
 
+# header of packed sweeps: start frequency, bin size and sweep length
+_SWEEP_HEADER = struct.Struct("<ddI")
+
 
 class Sa124(Instrument):
     """ """
@@ -53,6 +59,24 @@ class Sa124(Instrument):
     default_ref_power: float = 0.0
     """ Reference power level of the device in dBm. To achieve the best results, ensure gain and attenuation are set to AUTO and reference level is set at or slightly above expected input power for best sensitivity. """
 
+    iq_decimation: int = 8
+    """ Decimation used by `get_tone_power()` in IQ mode, a power of 2 in [1, 128]. The IQ sample rate is 486.111 kS/s divided by the decimation. """
+
+    iq_bandwidth: float = 50e3
+    """ Bandwidth of the IQ mode bandpass filter in Hz. `get_tone_power()` integrates power over this bandwidth, so it plays the role of the rbw of a sweep. """
+
+    iq_samples: int = 4096
+    """ Number of IQ samples averaged by `get_tone_power()` for each power reading. """
+
+    iq_tone_width: float = 20e3
+    """ Width in Hz of the band around the tone whose power `get_tone_contrast()` counts as the tone, wide enough to hold the tone despite the frequency error of the device's reference. The noise floor is read from the rest of the IQ passband, see `iq_floor_fraction`. """
+
+    iq_floor_fraction: float = 0.9
+    """ Fraction of `iq_bandwidth` read by `get_tone_contrast()`. The bins near the band edges are left out, where the IQ bandpass filter rolls off and would bias the noise floor low. """
+
+    sweep_cache_size: int = 4
+    """ Number of sweep configurations whose sweep info and frequencies are cached, so that alternating between a few configurations (e.g. the LO and SB leakage centers while mixer tuning) does not query the device each time. """
+
     # pylint: enable=line-too-long
     # pylint: disable=redefined-builtin, intentional shadowing of `id`
 
@@ -74,7 +98,16 @@ class Sa124(Instrument):
         self.rbw: float = rbw
         self.ref_power: float = ref_power
         self._freqs: np.ndarray = None  # will be updated by _set_sweep()
+        self._sweep_min: np.ndarray = None  # buffer updated by _set_sweep()
+        self._sweep_max: np.ndarray = None  # buffer updated by _set_sweep()
+        self._sweep_header: tuple[float, float] = None  # (start freq, bin size)
         self.sweep_length: int = None  # will be updated by _set_sweep()
+        self._iq_config: tuple = None  # updated by _set_iq(), None in sweep mode
+        self._iq_sample_rate: float = None  # in S/s, updated by _set_iq()
+        # (center, span, rbw, ref_power) applied on the device, None if unknown
+        self._sweep_config: tuple = None  # updated by _set_sweep() and _set_iq()
+        # sweep config: (sweep info, frequencies), least recently used first
+        self._sweep_cache: OrderedDict[tuple, tuple[dict, np.ndarray]] = OrderedDict()
 
         self.connect()
 
@@ -116,49 +149,186 @@ class Sa124(Instrument):
         return sa.sa_query_sweep_info(self._handle)
 
     def sweep(self, **sweep_params) -> tuple[list[float], list[float]]:
-        """ """
+        """
+        Returns (frequencies, amplitudes) as lists, see sweep_array() for arrays.
+        """
+        freqs, amps = self.sweep_array(copy=False, **sweep_params)
+        return freqs.tolist(), amps.tolist()
+
+    def sweep_array(
+        self, copy: bool = True, **sweep_params
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (frequencies, amplitudes) arrays. Sweeps are read into buffers allocated
+        once per sweep configuration, without copy the arrays returned are these
+        buffers, which the next sweep overwrites.
+        """
         if sweep_params:
-            return self._sweep_with_params(**sweep_params)
-        amps = sa.sa_get_sweep_64f(self._handle)["max"]
-        return self._freqs, amps.tolist()  # self._freqs already updated by _set_sweep()
-
-    def _sweep_with_params(self, **sweep_params) -> tuple[list[float], list[float]]:
+            self._sweep_with_params(**sweep_params)
+        else:
+            if self._iq_config is not None:  # back to sweep mode after get_tone_power()
+                self._set_sweep()
+            sa.sa_get_sweep_64f_into(self._handle, self._sweep_min, self._sweep_max)
+        if copy:
+            return self._freqs.copy(), self._sweep_max.copy()
+        return self._freqs, self._sweep_max
+
+    def sweep_packed(self, **sweep_params) -> bytes:
+        """
+        Returns the sweep as bytes, a header of start frequency, bin size and length
+        followed by the float64 amplitudes, to transfer sweeps through the stage's Pyro
+        proxies far more compactly than lists. Unpack with Sa124.unpack_sweep().
+        """
+        _, amps = self.sweep_array(copy=False, **sweep_params)
+        header = _SWEEP_HEADER.pack(*self._sweep_header, len(amps))
+        return header + amps.astype("<f8", copy=False).tobytes()
+
+    @staticmethod
+    def unpack_sweep(packed: Union[bytes, dict]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (frequencies, amplitudes) arrays of a sweep packed by sweep_packed().
+        Also accepts the dict Pyro's serpent serializer turns bytes into.
+        """
+        if isinstance(packed, dict):  # serpent sends bytes as {"data": base64 str, ...}
+            packed = base64.b64decode(packed["data"])
+        f_start, bin_size, length = _SWEEP_HEADER.unpack_from(packed)
+        offset = _SWEEP_HEADER.size
+        amps = np.frombuffer(packed, dtype="<f8", count=length, offset=offset)
+        return f_start + bin_size * np.arange(length), amps
+
+    def _sweep_with_params(self, **sweep_params) -> None:
         """ """
         self._set_sweep(**sweep_params)
         length, center, span = self.sweep_length, self.center, self.span
         logger.info(f"Sweeping {length} points with {center = }, {span = }...")
         start_time = time.perf_counter()
-        amps = sa.sa_get_sweep_64f(self._handle)["max"]
+        sa.sa_get_sweep_64f_into(self._handle, self._sweep_min, self._sweep_max)
         elapsed_time = time.perf_counter() - start_time
         logger.info(f"Sweep done in {elapsed_time:.5}s")
-        return self._freqs, amps.tolist()  # self._freqs already updated by _set_sweep()
 
-    def _set_sweep(self, **sweep_params) -> None:
+    def get_tone_power(self, freq: float, ref_power: float = None) -> float:
+        """
+        Returns the power in dBm at freq integrated over `iq_bandwidth`, from a short
+        IQ acquisition instead of a full sweep. The device is only reconfigured if freq
+        or the IQ settings changed since the last call, and returns to sweep mode on the
+        next sweep().
+        """
+        iq_data = self._get_iq_data(freq, ref_power)
+        power = np.mean(iq_data.real ** 2 + iq_data.imag ** 2)  # IQ data is in sqrt(mW)
+        return float(10 * np.log10(power))
+
+    def get_tone_contrast(self, freq: float, ref_power: float = None) -> float:
+        """
+        Returns the power of the tone at freq in dB above the noise floor, both read
+        from the FFT of the same short IQ acquisition. The tone power is summed over the
+        bins within `iq_tone_width` / 2 of freq, and compared to the mean noise power
+        per bin of the rest of the IQ passband times the number of tone bins, so a tone
+        at the floor reads 0 dB. Like the contrast read from a sweep, it is biased: the
+        floor bins are at most `iq_bandwidth` / 2 away from the tone, so the phase noise
+        and window leakage of a strong tone raise the floor and lower the contrast. The
+        bias shrinks with the tone, so it does not move the contrast minimum.
+        """
+        iq_data = self._get_iq_data(freq, ref_power)
+        window = np.hanning(len(iq_data))  # confines the tone's leakage to a few bins
+        powers = np.abs(np.fft.fft(iq_data * window)) ** 2
+        offsets = np.abs(np.fft.fftfreq(len(iq_data), d=1 / self._iq_sample_rate))
+
+        is_tone = offsets <= self.iq_tone_width / 2
+        max_offset = self.iq_floor_fraction * self.iq_bandwidth / 2
+        is_floor = ~is_tone & (offsets <= max_offset)
+        if not is_floor.any():
+            raise ValueError("No noise floor bins, iq_tone_width exceeds iq_bandwidth")
+        floor = np.mean(powers[is_floor]) * np.count_nonzero(is_tone)
+        return float(10 * np.log10(np.sum(powers[is_tone]) / floor))
+
+    def _get_iq_data(self, freq: float, ref_power: float = None) -> np.ndarray:
+        """
+        Returns `iq_samples` IQ samples centered on freq, in sqrt(mW).
+        """
+        if not sa.MIN_CENTER <= freq <= sa.MAX_CENTER:
+            logger.error(f"Frequency out of bounds [{sa.MIN_CENTER, sa.MAX_CENTER}]")
+            raise ValueError("Value out of bounds")
+        ref_power = self.ref_power if ref_power is None else ref_power
+        iq_config = (freq, ref_power, self.iq_decimation, self.iq_bandwidth)
+        if iq_config != self._iq_config:
+            self._set_iq(*iq_config)
+
+        # purge samples acquired before this call, e.g. before a mixer offset change
+        iq = sa.sa_get_IQ_data_unpacked(self._handle, self.iq_samples, sa.SA_TRUE)
+        return iq["iq_data"]
+
+    def _set_iq(
+        self, freq: float, ref_power: float, decimation: int, bandwidth: float
+    ) -> None:
         """ """
         sa.sa_initiate(self._handle, sa.SA_IDLE, sa.SA_FALSE)  # idle before configuring
+        sa.sa_config_center_span(self._handle, freq, bandwidth)  # IQ mode ignores span
+        sa.sa_config_level(self._handle, min(ref_power, sa.MAX_REF_POWER))
+        sa.sa_config_IQ(self._handle, decimation, bandwidth)
+        sa.sa_initiate(self._handle, sa.SA_IQ, sa.SA_FALSE)
+        stream_info = sa.sa_query_stream_info(self._handle)
+        self._iq_sample_rate = stream_info["samples_per_second"]
+        self._iq_config = (freq, ref_power, decimation, bandwidth)
+        self._sweep_config = None  # IQ mode overwrites the center, span and level
+        logger.debug(f"Set IQ mode at {freq:E} Hz with {bandwidth = :E} Hz")
 
+    def _set_sweep(self, **sweep_params) -> None:
+        """
+        Configures the device for sweeping, only pushing the settings that differ from
+        the configuration already applied, and nothing if none do.
+        """
         if "center" in sweep_params:
             self._set_center(sweep_params["center"])  # set instance attribute
         if "span" in sweep_params:
             self._set_span(sweep_params["span"])  # set instance attribute
-        sa.sa_config_center_span(self._handle, self.center, self.span)  # set on device
-
         if "rbw" in sweep_params:
             self._set_rbw(sweep_params["rbw"])  # set instance attribute
-        sa.sa_config_sweep_coupling(self._handle, self.rbw, self.rbw, self.rej_img)
-
         if "ref_power" in sweep_params:
             self._set_ref_power(sweep_params["ref_power"])  # set instance attribute
-        sa.sa_config_level(self._handle, self.ref_power)
 
+        config = (self.center, self.span, self.rbw, self.ref_power)
+        if config == self._sweep_config:
+            logger.debug("Sweep configuration unchanged, skipped reconfiguring device")
+            return
+        applied_config = self._sweep_config or (None, None, None, None)
+        applied_center, applied_span, applied_rbw, applied_ref_power = applied_config
+
+        sa.sa_initiate(self._handle, sa.SA_IDLE, sa.SA_FALSE)  # idle before configuring
+        self._iq_config, self._sweep_config = None, None  # unknown until fully applied
+        if (self.center, self.span) != (applied_center, applied_span):
+            sa.sa_config_center_span(self._handle, self.center, self.span)
+        if self.rbw != applied_rbw:
+            sa.sa_config_sweep_coupling(self._handle, self.rbw, self.rbw, self.rej_img)
+        if self.ref_power != applied_ref_power:
+            sa.sa_config_level(self._handle, self.ref_power)
         sa.sa_initiate(self._handle, sa.SA_SWEEPING, sa.SA_FALSE)  # ready to sweep
+        self._sweep_config = config
 
-        sweep_info = self.sweep_info
+        sweep_info, self._freqs = self._get_sweep_info(config)
         f_start = sweep_info["start_freq"]
         bin_size = sweep_info["bin_size"]
         sweep_len = sweep_info["sweep_length"]
-        self._freqs = [f_start + i * bin_size for i in range(sweep_len)]
-        self.sweep_length = len(self._freqs)
+        self._sweep_header = (f_start, bin_size)
+        if self.sweep_length != sweep_len or self._sweep_max is None:
+            self._sweep_min, self._sweep_max = np.empty(sweep_len), np.empty(sweep_len)
+        self.sweep_length = sweep_len
+
+    def _get_sweep_info(self, config: tuple) -> tuple[dict, np.ndarray]:
+        """
+        Returns the sweep info and frequencies of the applied config, from the cache if
+        the config was applied recently.
+        """
+        if config in self._sweep_cache:
+            self._sweep_cache.move_to_end(config)
+            return self._sweep_cache[config]
+
+        sweep_info = self.sweep_info
+        f_start, bin_size = sweep_info["start_freq"], sweep_info["bin_size"]
+        freqs = f_start + bin_size * np.arange(sweep_info["sweep_length"])
+        self._sweep_cache[config] = (sweep_info, freqs)
+        if len(self._sweep_cache) > self.sweep_cache_size:
+            self._sweep_cache.popitem(last=False)
+        return sweep_info, freqs
 
     def _set_center(self, center: float) -> None:
         """ """
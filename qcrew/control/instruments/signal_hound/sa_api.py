@@ -436,6 +436,13 @@ def sa_get_sweep_64f(device):
     return {"status": status, "min": sweep_min, "max": sweep_max}
 
 
+@error_check
+def sa_get_sweep_64f_into(device, sweep_min, sweep_max):
+    # fills preallocated float64 arrays of the sweep length, no sweep info query
+    status = saGetSweep_64f(device, sweep_min, sweep_max)
+    return {"status": status, "min": sweep_min, "max": sweep_max}
+
+
 @error_check
 def sa_get_partial_sweep_32f(device):
     sweep_length = sa_query_sweep_info(device)["sweep_length"]
@@ -0,0 +1,100 @@
+""" Bounded-queue stages used by the professor to pipeline its fetch-save-analyze-plot loop. Each stage applies a callable to every item it receives, either on its own worker thread or on the calling thread (needed for matplotlib), and forwards non-None return values to its downstream stages. """
+
+import queue
+import threading
+from typing import Any, Callable
+
+from qcrew.helpers import logger
+
+_STOP = object()  # sentinel placed on a stage's queue to ask it to finish
+_PUT_TIMEOUT = 0.1  # in s, how often a blocked put() checks if its stage has failed
+
+
+class PipelineStage:
+    """ """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        maxsize: int = 8,
+        drop_oldest: bool = False,
+    ) -> None:
+        """ """
+        self.name: str = name
+        self._fn: Callable[[Any], Any] = fn
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._drop_oldest: bool = drop_oldest  # else block producers when queue full
+        self._consumers: list[PipelineStage] = list()
+        self._thread: threading.Thread = None  # updated by start()
+        self.error: Exception = None  # first exception raised by fn, if any
+        self.dropped: int = 0  # number of items discarded by drop-oldest
+
+    def __repr__(self) -> str:
+        """ """
+        return f"{type(self).__name__} '{self.name}'"
+
+    def connect(self, stage: "PipelineStage") -> "PipelineStage":
+        """ """
+        self._consumers.append(stage)
+        return stage
+
+    def put(self, item: Any) -> None:
+        """ """
+        if not self._drop_oldest:  # block while full to exert backpressure upstream
+            while True:
+                try:
+                    self._queue.put(item, timeout=_PUT_TIMEOUT)
+                    return
+                except queue.Full:
+                    if self.error is not None:  # failed stage only drains, never blocks
+                        return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    if self._queue.get_nowait() is not _STOP:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self) -> None:
+        """ """
+        self.put(_STOP)
+
+    def start(self) -> None:
+        """ """
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def run(self) -> None:
+        """ """
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            if self.error is not None:  # keep draining so producers never deadlock
+                continue
+            try:
+                result = self._fn(item)
+            except Exception as exc:  # pylint: disable=broad-except, re-raised by join()
+                logger.error(f"{self} failed: {exc!r}")
+                self.error = exc
+                continue
+            if result is not None:
+                for consumer in self._consumers:
+                    consumer.put(result)
+
+        for consumer in self._consumers:
+            consumer.close()
+        if self.dropped:
+            logger.debug(f"{self} dropped {self.dropped} stale items")
+
+    def join(self) -> None:
+        """ """
+        if self._thread is not None:
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
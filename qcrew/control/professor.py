@@ -1,21 +1,39 @@
 """ The professor is qcrew's experiment run manager. Professor provides the `run()` method, which when called by the user, executes the experiment, enters its fetch-analyze-plot-save loop, and closes the loop by calling the experiment's `update()` method. """
 
+import inspect
+from pathlib import Path
+import threading
 import time
 import numpy as np
 
 from qcrew.analyze import stats
 from qcrew.analyze.plotter import Plotter
 from qcrew.control import Stagehand
-from qcrew.control.instruments.qm import QMResultFetcher
+from qcrew.control.instruments.qm import QMProgramCache, QMResultFetcher
+from qcrew.control.pipeline import PipelineStage
 from qcrew.helpers import logger
+from qcrew.helpers.catalog import CATALOG_FILENAME, RunCatalog
 from qcrew.helpers.datasaver import DataSaver, initialise_database
+import qcrew.measure.qua_macros as macros
 from qcrew.measure.experiment import Experiment
 
 import matplotlib.pyplot as plt
 from IPython import display
 
+PIPELINE_QUEUE_SIZE = 8  # max batches buffered between pipelined save/analyze stages
 
-def run(experiment: Experiment) -> None:
+program_cache = QMProgramCache()  # compiled programs reused across run() calls
+
+
+def run(
+    experiment: Experiment,
+    pipelined: bool = False,
+    fetch_workers: int = 1,
+    async_save: bool = False,
+    compression: str = None,
+    swmr: bool = False,
+    compact_metadata: bool = False,
+) -> None:
     """ """
 
     ##########################        CONNECT TO STAGE        ##########################
@@ -37,12 +55,13 @@ def run(experiment: Experiment) -> None:
 
         qua_program = experiment.QUA_sequence()
         qm = stage.QM
-        qm_job = qm.execute(qua_program)
+        qm_job = program_cache.execute(
+            qm, qua_program, *_get_program_key_parts(experiment, qm)
+        )
 
         #########################        INVOKE HELPERS        #########################
 
-        fetcher = QMResultFetcher(handle=qm_job.result_handles)
-        stderr = (None, None, None)  # to hold running (stderr, mean, variance * (n-1))
+        stderr = (None, None)  # to hold (stderr, running stats accumulator)
 
         plotter = Plotter(experiment.plot_setup)
 
@@ -51,54 +70,205 @@ def run(experiment: Experiment) -> None:
             sample_name=stage.sample_name,
             project_name=stage.project_name,
             path=stage.datapath,
+            swmr=swmr,  # SWMR writing needs the file created in the latest format
         )
+        db_path = Path(db.filename)
 
         ##################        LIVE POST-PROCESSING LOOP        ####################
 
-        with DataSaver(db) as datasaver:
+        # async_save writes to the database from a background thread. Chunk shapes of
+        # live-saved data follow the sweep, compression is one of datasaver.COMPRESSIONS
+        datasaver_kwargs = {
+            "asynchronous": async_save,
+            "buffering": experiment.buffering,
+            "expected_rows": experiment.reps,
+            "compression": compression,
+            # swmr lets other processes read live-saved data while it is written
+            "swmr": swmr,
+            "swmr_datasets": {
+                f"data/{tag}": (int(np.prod(experiment.buffering)),)
+                for tag in experiment.live_saving_tags
+            },
+            # save metadata as one JSON dataset instead of an HDF5 object per value
+            "compact_metadata": compact_metadata,
+        }
+        fetcher = QMResultFetcher(
+            handle=qm_job.result_handles,
+            row_shapes=experiment.result_row_shapes,  # to preallocate result stores
+            reps=experiment.get_num_results(),
+            max_workers=fetch_workers,  # > 1 fetches result tags concurrently
+        )
+        # the fetcher is closed on exit, shutting down its fetch threads in all modes
+        with fetcher, DataSaver(db, **datasaver_kwargs) as datasaver:
 
             ##############        SAVE MEASUREMENT RUN METADATA       ##################
 
-            datasaver.add_metadata(experiment.parameters)
-            for mode in stage.modes:
-                datasaver.add_metadata(mode.parameters)
+            # written in one call, each mode in a group so that names do not collide
+            mode_parameters = {mode.name: mode.parameters for mode in stage.modes}
+            datasaver.add_metadata({**experiment.parameters, **mode_parameters})
 
-            while fetcher.is_fetching:
+            if pipelined:  # fetch, save, analyze and plot run as decoupled stages
+                final_save_dict = _run_pipelined(
+                    experiment, fetcher, datasaver, plotter
+                )
+            else:
+                while fetcher.is_fetching:
 
-                ###############            FETCH PARTIAL RESULTS         ###############
+                    ###############            FETCH PARTIAL RESULTS         ###########
 
-                partial_results = fetcher.fetch()
-                num_results = fetcher.count
-                if not partial_results:  # empty dict means no new results available
-                    continue
+                    partial_results = fetcher.fetch()
+                    num_results = fetcher.count
+                    if not partial_results:  # empty dict means no new results available
+                        fetcher.wait_for_new_results(
+                            max_interval=experiment.fetch_period
+                        )
+                        continue
+                    partial_results = experiment.reorder_results(partial_results)
 
-                ################            LIVE SAVE RESULTS         ##################
+                    ################            LIVE SAVE RESULTS         ##############
 
-                datasaver.update_multiple_results(
-                    partial_results, save=experiment.live_saving_tags, group="data"
-                )
+                    datasaver.update_multiple_results(
+                        partial_results, save=experiment.live_saving_tags, group="data"
+                    )
 
-                #######            CALCULATE RUNNING MEAN STANDARD ERROR         #######
+                    #######            CALCULATE RUNNING MEAN STANDARD ERROR         ###
 
-                stderr = experiment.estimate_sd(
-                    stats, partial_results, num_results, stderr
-                )
+                    stderr = experiment.estimate_sd(
+                        stats, partial_results, num_results, stderr
+                    )
 
-                #############            LIVE PLOT AVAILABLE RESULTS         ###########
+                    #############            LIVE PLOT AVAILABLE RESULTS         #######
 
-                final_save_dict = experiment.plot_results(
-                    plotter, partial_results, num_results, stderr
-                )
-                time.sleep(
-                    experiment.fetch_period
-                )  # prevent over-fetching, over-saving, ultra-fast plotting
+                    final_save_dict = experiment.plot_results(
+                        plotter, partial_results, num_results, stderr
+                    )
+                    time.sleep(
+                        experiment.fetch_period
+                    )  # prevent over-fetching, over-saving, ultra-fast plotting
 
             ##################         SAVE REMAINING DATA         #####################
 
             datasaver.add_multiple_results(
                 final_save_dict, save=final_save_dict.keys(), group="data"
             )
+            datasaver.drain()  # wait for pending writes, re-raises any write error
+
+        ######################        REGISTER RUN IN CATALOG        ###################
+
+        # the run is saved already, so a catalog failure of any kind is only logged
+        try:
+            RunCatalog(Path(stage.datapath) / CATALOG_FILENAME).add_run(db_path)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(f"Failed to add {db_path.name} to the run catalog: {exc!r}")
 
         ##########################          fin           #############################
 
         print(qm_job.execution_report())
+
+
+def _get_program_key_parts(experiment, qm) -> tuple:
+    """
+    Returns everything that determines the QUA program built by the experiment, to key
+    the program cache: the experiment, sweep and mode parameters (including pulse
+    parameters), the QM config and the source code of the experiment and mode classes,
+    their base classes and qua_macros, so editing any of them between runs does not
+    reuse a stale program.
+    NOTE other code the program depends on, e.g. helper functions imported from other
+    modules, is not part of the key. Call `program_cache.clear()` after editing it
+    without restarting the session.
+    """
+    experiment_cls = type(experiment)
+    classes = [experiment_cls, *(type(mode) for mode in experiment.modes)]
+    mro = dict.fromkeys(base for cls in classes for base in cls.__mro__)
+    sources = [_get_source(cls) for cls in mro if cls.__module__ != "builtins"]
+
+    return (
+        f"{experiment_cls.__module__}.{experiment_cls.__qualname__}",
+        sources,
+        _get_source(macros),
+        experiment.parameters,
+        experiment.sweep_config,
+        [mode.parameters for mode in experiment.modes],
+        experiment.point_order,
+        qm.get_config(),
+    )
+
+
+def _get_source(obj) -> str:
+    """
+    Returns the source code of a class or module, None if it is not available.
+    """
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):  # e.g. class defined interactively
+        return None
+
+
+def _run_pipelined(experiment, fetcher, datasaver, plotter) -> dict:
+    """
+    Runs the live post-processing loop as a pipeline. Fetching happens on its own
+    thread and hands each batch to a save stage and an analyze stage through bounded
+    queues, so slow saving or plotting only delays the next fetch once a queue is full.
+    The plot stage runs on the calling thread (matplotlib is not thread-safe) and only
+    keeps the newest batch, dropping stale ones.
+    """
+    stderr = (None, None)  # to hold (stderr, running stats accumulator)
+    final_save_dict = dict()
+    fetch_errors = list()
+
+    def save(batch):
+        partial_results, _ = batch
+        datasaver.update_multiple_results(
+            partial_results, save=experiment.live_saving_tags, group="data"
+        )
+
+    def analyze(batch):
+        nonlocal stderr
+        partial_results, num_results = batch
+        stderr = experiment.estimate_sd(stats, partial_results, num_results, stderr)
+        return partial_results, num_results, stderr
+
+    def plot(batch):
+        nonlocal final_save_dict
+        final_save_dict = experiment.plot_results(plotter, *batch)
+
+    save_stage = PipelineStage("save", save, maxsize=PIPELINE_QUEUE_SIZE)
+    analyze_stage = PipelineStage("analyze", analyze, maxsize=PIPELINE_QUEUE_SIZE)
+    plot_stage = analyze_stage.connect(
+        PipelineStage("plot", plot, maxsize=1, drop_oldest=True)
+    )
+    stages = (save_stage, analyze_stage, plot_stage)
+
+    def fetch():
+        try:
+            while fetcher.is_fetching and not any(s.error for s in stages):
+                partial_results = fetcher.fetch()
+                if not partial_results:  # empty dict means no new results available
+                    fetcher.wait_for_new_results(max_interval=experiment.fetch_period)
+                    continue
+                partial_results = experiment.reorder_results(partial_results)
+                batch = (partial_results, fetcher.count)
+                save_stage.put(batch)  # blocks if saving falls too far behind
+                analyze_stage.put(batch)
+                time.sleep(experiment.fetch_period)  # prevent over-fetching
+        except Exception as exc:  # pylint: disable=broad-except, re-raised below
+            logger.error(f"Fetching failed: {exc!r}")
+            fetch_errors.append(exc)
+        finally:
+            save_stage.close()
+            analyze_stage.close()
+
+    fetch_thread = threading.Thread(target=fetch, name="fetch", daemon=True)
+    save_stage.start()
+    analyze_stage.start()
+    fetch_thread.start()
+
+    plot_stage.run()  # returns once the fetch thread is done and all stages drained
+
+    fetch_thread.join()
+    for stage in stages:
+        stage.join()  # re-raises the first error encountered by the stage, if any
+    if fetch_errors:
+        raise fetch_errors[0]
+
+    return final_save_dict
@@ -11,7 +11,9 @@ import qcrew.helpers.yamlizer as yml
 from qcrew.helpers import logger
 
 from qm.QuantumMachine import QuantumMachine
-from qm.QuantumMachinesManager import QuantumMachinesManager
+
+# shared by all LocalStages so the QM stays open across Stagehand contexts and runs
+_QM_SESSION = qciqm.QMSession()
 
 
 class Stage:
@@ -72,8 +74,8 @@ class LocalStage(Stage):
             self.modes = [v for v in self._config if isinstance(v, qcm.Mode)]
             logger.debug(f"Found {len(self.modes)} modes")
 
-            self._qmm = QuantumMachinesManager()
             self._qcb = qciqm.QMConfigBuilder(*self.modes)
+            _QM_SESSION.invalidate()  # check the QM is still open once for this stage
 
     @property  # qm getter
     def QM(self) -> QuantumMachine:
@@ -83,7 +85,7 @@ class LocalStage(Stage):
                 "Please set 'qm' to True in stage.yml to connect to QM and re-run 'setup_stage'"
             )
         cfg = self._qcb.config
-        qm = self._qmm.open_qm(cfg)
+        qm = _QM_SESSION.get_qm(cfg)
         return qm
 
 
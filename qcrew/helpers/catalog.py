@@ -0,0 +1,335 @@
+""" SQLite catalog of saved experiment runs, to find runs by experiment, sample, project, date and metadata values without opening every HDF5 file in the data tree. The professor adds each run when it is saved. Existing trees are indexed with:
+
+    python -m qcrew.helpers.catalog <data root> [--catalog PATH] [--workers N] [--full]
+"""
+
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+from pathlib import Path
+import sqlite3
+from typing import Any, Optional, Union
+
+import h5py
+import numpy as np
+
+from qcrew.helpers import logger
+from qcrew.helpers.datasaver import read_dict_from_hdf5
+
+CATALOG_FILENAME = "run_catalog.sqlite"  # default catalog location is the data root
+DATA_GROUP = "data"  # not indexed, holds the results of the run
+RUN_KEYS = ("exp_name", "sample_name", "project_name", "timestamp")  # run attributes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT PRIMARY KEY,
+    exp_name TEXT,
+    sample_name TEXT,
+    project_name TEXT,
+    timestamp TEXT,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    path TEXT REFERENCES runs(path) ON DELETE CASCADE,
+    key TEXT,
+    value_num REAL,
+    value_text TEXT,
+    PRIMARY KEY (path, key)
+);
+CREATE INDEX IF NOT EXISTS runs_by_exp ON runs (exp_name, timestamp);
+CREATE INDEX IF NOT EXISTS runs_by_sample ON runs (sample_name, timestamp);
+CREATE INDEX IF NOT EXISTS metadata_by_num ON metadata (key, value_num);
+CREATE INDEX IF NOT EXISTS metadata_by_text ON metadata (key, value_text);
+"""
+
+
+class RunCatalog:
+    """
+    Index of runs saved by the DataSaver. Each run is stored with its experiment name,
+    sample, project, timestamp and path, plus its metadata flattened to dotted keys,
+    e.g. "qubit.int_freq" for the int_freq parameter of the qubit mode.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """ """
+        self.path = Path(path)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    def __repr__(self) -> str:
+        """ """
+        return f"{type(self).__name__}('{self.path}')"
+
+    def add_run(self, filepath: Union[str, Path]) -> None:
+        """
+        Adds the run saved at filepath, replacing any previous entry for it.
+        """
+        self._add_records([read_run_record(filepath)])
+
+    def rebuild(
+        self, root: Union[str, Path], workers: int = None, full: bool = False
+    ) -> int:
+        """
+        Indexes every run under root, reading files in parallel with `workers`
+        processes. Unless full, files unchanged since they were indexed are skipped.
+        Returns the number of runs added.
+        """
+        mtimes = {str(p.resolve()): p.stat().st_mtime for p in Path(root).rglob("*.h5")}
+        if not full:
+            with self._connect() as connection:
+                rows = connection.execute("SELECT path, mtime FROM runs").fetchall()
+            indexed = dict(rows)
+            mtimes = {p: t for p, t in mtimes.items() if indexed.get(p) != t}
+
+        logger.info(f"Indexing {len(mtimes)} runs under {root}...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            records = executor.map(_try_read_run_record, mtimes, chunksize=16)
+            records = [record for record in records if record is not None]
+
+        self._add_records(records)
+        logger.success(f"Indexed {len(records)} runs in {self}")
+        return len(records)
+
+    def remove_missing(self) -> int:
+        """
+        Removes the runs whose file no longer exists. Returns the number removed.
+        """
+        with self._connect() as connection:
+            paths = [row[0] for row in connection.execute("SELECT path FROM runs")]
+            missing = [(path,) for path in paths if not Path(path).exists()]
+            connection.executemany("DELETE FROM runs WHERE path = ?", missing)
+        return len(missing)
+
+    def query(
+        self,
+        exp_name: str = None,
+        sample_name: str = None,
+        project_name: str = None,
+        since: Union[str, datetime.datetime] = None,
+        until: Union[str, datetime.datetime] = None,
+        metadata: dict[str, Any] = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Returns the runs matching all the given conditions, oldest first, as dicts of
+        run attributes and path. exp_name, sample_name and project_name accept SQL LIKE
+        wildcards (% and _). since and until bound the timestamp. metadata maps dotted
+        keys to a value, or to a (min, max) tuple for a range (None for no bound).
+        """
+        conditions, values = list(), list()
+        for key, value in zip(RUN_KEYS, (exp_name, sample_name, project_name)):
+            if value is not None:
+                conditions.append(f"runs.{key} LIKE ?")
+                values.append(value)
+        if since is not None:
+            conditions.append("runs.timestamp >= ?")
+            values.append(_to_timestamp(since))
+        if until is not None:
+            conditions.append("runs.timestamp <= ?")
+            values.append(_to_timestamp(until))
+
+        for key, value in (metadata or dict()).items():
+            condition = "SELECT path FROM metadata WHERE key = ?"
+            values.append(key)
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    condition += " AND value_num >= ?"
+                    values.append(low)
+                if high is not None:
+                    condition += " AND value_num <= ?"
+                    values.append(high)
+            else:
+                column, value = _to_columns(value)
+                condition += f" AND {column} = ?"
+                values.append(value)
+            conditions.append(f"runs.path IN ({condition})")
+
+        statement = "SELECT path, exp_name, sample_name, project_name, timestamp"
+        statement += " FROM runs"
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        statement += " ORDER BY timestamp"
+
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(statement, values)]
+
+    def get_metadata(self, filepath: Union[str, Path]) -> dict[str, Any]:
+        """
+        Returns the flattened metadata of the run saved at filepath.
+        """
+        statement = "SELECT key, value_num, value_text FROM metadata WHERE path = ?"
+        with self._connect() as connection:
+            rows = connection.execute(statement, (str(Path(filepath).resolve()),))
+            return {key: num if text is None else text for key, num, text in rows}
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """
+        Yields a connection that commits on success, rolls back on error and closes.
+        """
+        connection = sqlite3.connect(self.path, timeout=30)  # data drive is shared
+        try:
+            connection.execute("PRAGMA foreign_keys = ON")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _add_records(self, records: list[dict[str, Any]]) -> None:
+        """ """
+        runs_statement = "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)"
+        metadata_statement = "INSERT INTO metadata VALUES (?, ?, ?, ?)"
+        with self._connect() as connection:
+            for record in records:
+                path = record["path"]
+                run = [record.get(key) for key in RUN_KEYS]
+                connection.execute("DELETE FROM metadata WHERE path = ?", (path,))
+                connection.execute(runs_statement, (path, *run, record["mtime"]))
+                metadata = [
+                    (path, key, *_to_values(value))
+                    for key, value in record["metadata"].items()
+                ]
+                connection.executemany(metadata_statement, metadata)
+
+
+def read_run_record(filepath: Union[str, Path]) -> dict[str, Any]:
+    """
+    Reads the run attributes and flattened metadata of a saved run. Files saved
+    before the run attributes were written get their timestamp from the date folder
+    and time prefix of the file name, and their sample and experiment names from the
+    rest of it, see _parse_file_name().
+    """
+    filepath = Path(filepath).resolve()
+    with h5py.File(filepath, "r") as file:
+        metadata = read_dict_from_hdf5({}, file, exclude=(DATA_GROUP,))
+
+    record = {key: _to_text(metadata.pop(key, None)) for key in RUN_KEYS}
+    if record["timestamp"] is None:
+        record["timestamp"] = _guess_timestamp(filepath)
+    if record["exp_name"] is None:
+        sample_name, record["exp_name"] = _parse_file_name(filepath)
+        if record["sample_name"] is None:
+            record["sample_name"] = sample_name
+
+    record["path"] = str(filepath)
+    record["mtime"] = filepath.stat().st_mtime
+    record["metadata"] = flatten_metadata(metadata)
+    return record
+
+
+def flatten_metadata(metadata: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    """
+    Flattens nested metadata dicts to a single dict with dotted keys.
+    """
+    flat_metadata = dict()
+    for key, value in metadata.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat_metadata |= flatten_metadata(value, prefix=name)
+        else:
+            flat_metadata[name] = value
+    return flat_metadata
+
+
+def _try_read_run_record(filepath: str) -> Optional[dict[str, Any]]:
+    """
+    read_run_record() for the rebuild worker processes, skipping unreadable files.
+    """
+    try:
+        return read_run_record(filepath)
+    except Exception as exc:  # pylint: disable=broad-except, corrupt or partial files
+        logger.warning(f"Skipped {filepath}: {exc!r}")
+        return None
+
+
+def _guess_timestamp(filepath: Path) -> str:
+    """ """
+    try:
+        time_text = filepath.stem.split("_")[0]
+        date_text = filepath.parent.name
+        run_time = datetime.datetime.strptime(date_text + time_text, "%Y%m%d%H%M%S")
+    except ValueError:
+        run_time = datetime.datetime.fromtimestamp(filepath.stat().st_mtime)
+    return run_time.isoformat(timespec="seconds")
+
+
+def _parse_file_name(filepath: Path) -> tuple[Optional[str], str]:
+    """
+    Returns the (sample name, experiment name) of a file named
+    "<HHMMSS>_<sample name>_<exp name>.h5" by initialise_database(), the time prefix
+    is optional. Sample names are assumed to have no "_", experiment names may.
+    Other file names are taken as the experiment name, with no sample name.
+    """
+    parts = filepath.stem.split("_")
+    if len(parts[0]) == 6 and parts[0].isdigit():  # time prefix
+        parts = parts[1:]
+    if len(parts) < 2:
+        return None, filepath.stem
+    return parts[0], "_".join(parts[1:])
+
+
+def _to_timestamp(value: Union[str, datetime.datetime]) -> str:
+    """ """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(timespec="seconds")
+    return value
+
+
+def _to_text(value: Any) -> Optional[str]:
+    """ """
+    if isinstance(value, bytes):
+        return value.decode()
+    return None if value is None else str(value)
+
+
+def _to_values(value: Any) -> tuple[Optional[float], Optional[str]]:
+    """
+    Returns the (value_num, value_text) columns storing a metadata value. Numbers are
+    stored as value_num so they can be queried by range, everything else as text.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (bool, int, float)):
+        return float(value), None
+    if isinstance(value, bytes):
+        return None, value.decode()
+    if isinstance(value, str):
+        return None, value
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    return None, json.dumps(value, default=str)
+
+
+def _to_columns(value: Any) -> tuple[str, Any]:
+    """
+    Returns the column and value to match a metadata value in a query.
+    """
+    value_num, value_text = _to_values(value)
+    if value_text is None:
+        return "value_num", value_num
+    return "value_text", value_text
+
+
+def main() -> None:
+    """ """
+    parser = argparse.ArgumentParser(description="Index saved runs in a RunCatalog.")
+    parser.add_argument("root", type=Path, help="root of the data tree to scan")
+    parser.add_argument(
+        "--catalog", type=Path, help=f"default: <root>/{CATALOG_FILENAME}"
+    )
+    parser.add_argument("--workers", type=int, help="default: number of CPUs")
+    parser.add_argument("--full", action="store_true", help="re-index unchanged runs")
+    args = parser.parse_args()
+
+    catalog = RunCatalog(args.catalog or args.root / CATALOG_FILENAME)
+    catalog.rebuild(args.root, workers=args.workers, full=args.full)
+    removed = catalog.remove_missing()
+    if removed:
+        logger.info(f"Removed {removed} runs whose file no longer exists")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,25 @@ Based on hdf5 datawrapper from qtlab originally by Reinier Heeres and
 Wolfgang Pfaff and hdf5_data.py from PycQED module.
 @yifan 
 """
+import json
 import os
+import queue
+import threading
 import time
+from concurrent.futures import Future
 import h5py
 import numpy as np
 import logging as log
-from uncertainties import UFloat
+from uncertainties import UFloat, ufloat
 from pathlib import Path
 from typing import Union, Optional, Dict, List
 import logging
 
+try:  # optional, registers the lz4 and blosc HDF5 filters
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
 log = logging.getLogger(__name__)
 ########################################
 #          helper function
@@ -194,7 +203,137 @@ def write_dict_to_hdf5(
             entry_point.attrs[key] = str(item)
 
 
-def read_dict_from_hdf5(data_dict: dict, entry_point):
+# compact metadata format, see write_compact_metadata()
+COMPACT_METADATA = "__metadata__"  # JSON bytes of the whole metadata tree
+COMPACT_METADATA_INDEX = "__metadata_index__"  # flat list of its dotted leaf keys
+_TYPE_TAG = "__type__"  # marks JSON objects encoding a type JSON does not have
+
+
+def _encode_metadata(item):
+    """
+    Converts a metadata tree to JSON-compatible values. Types without a JSON equivalent
+    (tuples, UFloats, numpy arrays, dicts with non-str keys) become objects tagged with
+    their type, so that _decode_metadata() restores them.
+    """
+    if item is None or isinstance(item, (str, bool, int, float)):
+        return item
+    if isinstance(item, np.generic):
+        return item.item()
+    if isinstance(item, dict):
+        if all(isinstance(key, str) for key in item) and _TYPE_TAG not in item:
+            return {key: _encode_metadata(value) for key, value in item.items()}
+        items = [[_encode_metadata(k), _encode_metadata(v)] for k, v in item.items()]
+        return {_TYPE_TAG: "dict", "items": items}
+    if isinstance(item, list):
+        return [_encode_metadata(value) for value in item]
+    if isinstance(item, tuple):
+        return {_TYPE_TAG: "tuple", "items": [_encode_metadata(v) for v in item]}
+    if isinstance(item, UFloat):
+        nominal_value, std_dev = item.nominal_value, item.std_dev
+        return {_TYPE_TAG: "ufloat", "nominal_value": nominal_value, "std_dev": std_dev}
+    if isinstance(item, np.ndarray):
+        data = _encode_metadata(item.tolist())
+        return {_TYPE_TAG: "ndarray", "dtype": item.dtype.str, "data": data}
+
+    log.warning(f'Type "{type(item)}" of "{item}" not supported, storing as string')
+    return str(item)
+
+
+def _decode_metadata(item):
+    """
+    Inverse of _encode_metadata().
+    """
+    if isinstance(item, list):
+        return [_decode_metadata(value) for value in item]
+    if not isinstance(item, dict):
+        return item
+
+    item_type = item.get(_TYPE_TAG)
+    if item_type is None:
+        return {key: _decode_metadata(value) for key, value in item.items()}
+    if item_type == "dict":
+        return {_decode_metadata(k): _decode_metadata(v) for k, v in item["items"]}
+    if item_type == "tuple":
+        return tuple(_decode_metadata(value) for value in item["items"])
+    if item_type == "ufloat":
+        return ufloat(item["nominal_value"], item["std_dev"])
+    if item_type == "ndarray":
+        return np.array(_decode_metadata(item["data"]), dtype=item["dtype"])
+    raise ValueError(f"Unknown compact metadata type '{item_type}'")
+
+
+def _get_metadata_keys(data_dict: dict, prefix: str = "") -> list:
+    """
+    Returns the dotted keys of the leaves of a metadata tree, nested dicts included.
+    """
+    keys = list()
+    for key, value in data_dict.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            keys.extend(_get_metadata_keys(value, prefix=name))
+        else:
+            keys.append(name)
+    return keys
+
+
+def write_compact_metadata(data_dict: dict, entry_point, overwrite: bool = False):
+    """
+    Alternative to write_dict_to_hdf5() storing the whole metadata tree as JSON bytes
+    in one dataset, plus a dataset indexing its dotted leaf keys, instead of one HDF5
+    object per group and value. Metadata already stored this way at entry_point is
+    merged with data_dict, whose values win, unless overwrite. Reading it back with
+    read_dict_from_hdf5() merges it with the other metadata, read_compact_metadata()
+    can also look up a single dotted key.
+    """
+    metadata = dict() if overwrite else read_compact_metadata(entry_point)
+    metadata |= data_dict
+
+    encoded = json.dumps(_encode_metadata(metadata)).encode("utf-8")
+    keys = sorted(_get_metadata_keys(metadata))
+    for name in (COMPACT_METADATA, COMPACT_METADATA_INDEX):
+        if name in entry_point:
+            del entry_point[name]
+    entry_point.create_dataset(
+        COMPACT_METADATA, data=np.frombuffer(encoded, dtype=np.uint8)
+    )
+    entry_point.create_dataset(
+        COMPACT_METADATA_INDEX, data=np.array(keys, dtype=h5py.string_dtype())
+    )
+
+
+def read_compact_metadata(entry_point, key: Optional[str] = None):
+    """
+    Reads the metadata tree written by write_compact_metadata(), empty if there is none.
+    If key is given, only returns the value at that dotted path, e.g. "qubit.int_freq",
+    or the subtree below it, e.g. "qubit". Keys are checked against the key index first,
+    so a missing key raises KeyError without decoding the tree.
+    """
+    if key is not None and not _has_compact_metadata_key(entry_point, key):
+        raise KeyError(f"No compact metadata at '{key}'")
+    if COMPACT_METADATA not in entry_point:
+        return dict()
+    encoded = entry_point[COMPACT_METADATA][()].tobytes()
+    metadata = _decode_metadata(json.loads(encoded.decode("utf-8")))
+    if key is None:
+        return metadata
+
+    value = metadata
+    for name in key.split("."):  # keys of the index are str() of the tree keys
+        value = next(item for k, item in value.items() if str(k) == name)
+    return value
+
+
+def _has_compact_metadata_key(entry_point, key: str) -> bool:
+    """
+    True if the compact metadata key index has a leaf at or below the dotted key.
+    """
+    if COMPACT_METADATA_INDEX not in entry_point:
+        return False
+    keys = entry_point[COMPACT_METADATA_INDEX].asstr()[()]
+    return any(k == key or k.startswith(f"{key}.") for k in keys)
+
+
+def read_dict_from_hdf5(data_dict: dict, entry_point, exclude=()):
     """
     Reads a dictionary from an hdf5 file or group that was written using the
     corresponding "write_dict_to_hdf5" function defined above.
@@ -206,9 +345,16 @@ def read_dict_from_hdf5(data_dict: dict, entry_point):
                 function to add the data to an existing data_dict.
         entry_point  (hdf5 group):
                 hdf5 file or group from which to read.
+        exclude (collection of str):
+                names of the groups and datasets of entry_point not to read.
     """
     # if 'list_type' not in entry_point.attrs:
     for key, item in entry_point.items():
+        if key in exclude or key == COMPACT_METADATA_INDEX:
+            continue
+        if key == COMPACT_METADATA:
+            data_dict.update(read_compact_metadata(entry_point))
+            continue
         if RepresentsInt(key):
             key = int(key)
         if isinstance(item, h5py.Group):
@@ -508,6 +654,7 @@ class DatabaseFile(h5py.File):
         datadir: str,
         timesubdir: bool = False,
         timefilename: bool = True,
+        swmr: bool = False,
     ):
         """
         Creates an empty data set including the file, for which the currently
@@ -517,6 +664,7 @@ class DatabaseFile(h5py.File):
             name (str) : base name of the file
             datadir (str) : A base path where the hdf5file will be created in its subdirectory
                 using the standard timestamp structure
+            swmr (bool) : create the file in the latest format, which SWMR writing needs
         """
         self._timesubdir = timesubdir
         self._timefilename = timefilename
@@ -536,7 +684,8 @@ class DatabaseFile(h5py.File):
 
         if not os.path.isdir(self.folder):
             os.makedirs(self.folder)
-        super(DatabaseFile, self).__init__(self.filepath, "a")
+        libver = "latest" if swmr else None  # SWMR needs superblock version >= 3
+        super(DatabaseFile, self).__init__(self.filepath, "a", libver=libver)
         self.flush()
 
 
@@ -547,9 +696,11 @@ def initialise_database(
     path: Union[str, Path],
     timesubdir: bool = False,
     timefilename: bool = True,
+    swmr: bool = False,
 ) -> Path:
     """initialise the database in the date folder under the given main path.
     return the database hdf5 object
+    swmr must be True if the database is saved to by a DataSaver with swmr=True
     """
 
     name = sample_name + "_" + exp_name
@@ -559,36 +710,338 @@ def initialise_database(
         datadir=path,
         timesubdir=timesubdir,
         timefilename=timefilename,
+        swmr=swmr,
     )
 
+    # run attributes, used to index the run in a catalog.RunCatalog
+    database.attrs["exp_name"] = exp_name
+    database.attrs["sample_name"] = sample_name
+    database.attrs["project_name"] = project_name
+    run_time = time.strftime("%Y-%m-%dT%H:%M:%S", database._localtime)
+    database.attrs["timestamp"] = run_time
+    database.flush()
+
     db_path = Path(database.filename)
     log.info("Create and initialise the database at {db_path}")
     return database
 
 
+# default flush policy of DataHandle, the file is flushed when either limit is reached
+FLUSH_INTERVAL = 5.0  # in s, max time between flushes
+FLUSH_BYTES = 32 * 2**20  # max bytes written between flushes
+
+# attribute holding the number of valid rows of datasets appended to by DataHandle,
+# whose first dimension may be over-allocated until the DataSaver is closed
+LENGTH_ATTR = "logical_length"
+
+# chunking policy of datasets appended to by DataHandle
+CHUNK_BYTES = 2**18  # target chunk size
+MIN_CHUNK_ROWS = 16  # rows are split along the sweep if fewer would fit in a chunk
+
+COMPRESSIONS = (None, "gzip", "lz4", "blosc")  # lz4 and blosc need hdf5plugin
+
+WRITE_QUEUE_SIZE = 16  # max pending write calls of an asynchronous DataSaver
+_STOP = object()  # sentinel asking the writer thread of an AsyncDataHandle to finish
+
+
+def get_chunk_shape(
+    row_shape: tuple,
+    itemsize: int,
+    buffering: Optional[tuple] = None,
+    expected_rows: Optional[int] = None,
+) -> tuple:
+    """
+    Chunk shape of a dataset appended to along axis 0 with rows of row_shape, aiming
+    for CHUNK_BYTES per chunk. Chunks hold whole rows, unless fewer than MIN_CHUNK_ROWS
+    rows would fit; flat rows of a sweep with the given buffering are then split
+    between whole inner sweeps, so reading a few sweep points over all repetitions
+    only touches a few chunks. The number of rows never exceeds expected_rows.
+    """
+    target_len = max(1, CHUNK_BYTES // itemsize)
+    row_len = int(np.prod(row_shape))
+    max_cols = max(1, target_len // MIN_CHUNK_ROWS)
+
+    chunk_row_shape = tuple(row_shape)
+    is_sweep_row = buffering and int(np.prod(buffering)) == row_len
+    if len(row_shape) == 1 and row_len > max_cols and is_sweep_row:
+        cols = 1
+        for dim in reversed(buffering):  # keep whole inner sweeps in one chunk
+            if cols * dim > max_cols:
+                break
+            cols *= dim
+        chunk_row_shape = (cols if cols > 1 else max_cols,)
+
+    rows = max(1, target_len // max(1, int(np.prod(chunk_row_shape))))
+    if expected_rows:
+        rows = min(rows, expected_rows)
+    return (rows, *chunk_row_shape)
+
+
+def get_compression_kwargs(compression: Optional[str], dtype) -> dict:
+    """
+    Returns the h5py create_dataset() filter arguments for a compression in
+    COMPRESSIONS. Float data is byte-shuffled first, which helps compressing the
+    slowly varying I/Q values.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown {compression = }, expect one of {COMPRESSIONS}")
+    if compression is None:
+        return {}
+
+    is_float = np.issubdtype(dtype, np.floating)
+    if compression == "gzip":
+        return {"compression": "gzip", "compression_opts": 4, "shuffle": is_float}
+    if hdf5plugin is None:
+        raise ImportError(f"Please install hdf5plugin to use {compression} compression")
+    if compression == "lz4":
+        return {**hdf5plugin.LZ4(), "shuffle": is_float}
+    # blosc shuffles internally
+    shuffle = hdf5plugin.Blosc.SHUFFLE if is_float else hdf5plugin.Blosc.NOSHUFFLE
+    return {**hdf5plugin.Blosc(cname="lz4", clevel=5, shuffle=shuffle)}
+
+
 class DataSaver:
-    def __init__(self, database: h5py.File) -> None:
+    def __init__(
+        self,
+        database: h5py.File,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_bytes: int = FLUSH_BYTES,
+        asynchronous: bool = False,
+        queue_size: int = WRITE_QUEUE_SIZE,
+        buffering: Optional[tuple] = None,
+        expected_rows: Optional[int] = None,
+        compression: Optional[str] = None,
+        swmr: bool = False,
+        swmr_datasets: Optional[Dict[str, tuple]] = None,
+        compact_metadata: bool = False,
+    ) -> None:
+        """
+        If asynchronous, the handle returned on entering queues all writes to a writer
+        thread that owns the file, see AsyncDataHandle.
+        buffering and expected_rows are the sweep shape and expected number of rows of
+        live-saved data, used to choose chunk shapes, see get_chunk_shape().
+        compression is one of COMPRESSIONS, applied to live-saved datasets.
+        If swmr, live-saved data can be read by other processes while it is written,
+        see DataHandle.start_swmr(), the database must be created with
+        initialise_database(swmr=True). swmr_datasets maps the path of each dataset that
+        will be live-saved to its row shape, they are all created before the first
+        live save.
+        If compact_metadata, metadata is saved by default with write_compact_metadata().
+        """
+        get_compression_kwargs(compression, np.float64)  # fail early if unavailable
         self.db = database
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.buffering = buffering
+        self.expected_rows = expected_rows
+        self.compression = compression
+        self.asynchronous = asynchronous
+        self.queue_size = queue_size
+        self.swmr = swmr
+        self.swmr_datasets = swmr_datasets
+        self.compact_metadata = compact_metadata
+        self._data_handle = None  # updated by __enter__
+        self._handle = None  # updated by __enter__, async front-end if asynchronous
 
     def __enter__(self) -> None:
         # check if the hdf5 file is open or not
         if not self.db.__bool__():
             self.db = h5py.File(self.db.filename, "a")
 
-        return DataHandle(database=self.db)
+        # SWMR needs the latest file format, the file must be created in it by
+        # initialise_database(swmr=True) as reopening does not upgrade its superblock
+        if self.swmr:
+            filename = self.db.filename
+            self.db.close()
+            self.db = h5py.File(filename, "a", libver="latest")
+
+        self._data_handle = DataHandle(
+            database=self.db,
+            flush_interval=self.flush_interval,
+            flush_bytes=self.flush_bytes,
+            buffering=self.buffering,
+            expected_rows=self.expected_rows,
+            compression=self.compression,
+            swmr=self.swmr,
+            swmr_datasets=self.swmr_datasets,
+            compact_metadata=self.compact_metadata,
+        )
+        self._handle = self._data_handle
+        if self.asynchronous:
+            self._handle = AsyncDataHandle(self._handle, queue_size=self.queue_size)
+        return self._handle
 
     def __exit__(self, type, value, traceback) -> None:
-        self.db.flush()
-        self.db.close()
-        print("The database hdf5 file is closed")
+        try:
+            self._handle.close()  # trims over-allocated datasets and flushes
+        finally:
+            self.db = self._data_handle.db  # the file is reopened when leaving SWMR
+            self.db.close()
+            print("The database hdf5 file is closed")
 
 
 class DataHandle:
-    def __init__(self, database: h5py.File):
+    growth_factor = 2.0  # capacity multiplier when a dataset runs out of rows
+
+    def __init__(
+        self,
+        database: h5py.File,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_bytes: int = FLUSH_BYTES,
+        buffering: Optional[tuple] = None,
+        expected_rows: Optional[int] = None,
+        compression: Optional[str] = None,
+        swmr: bool = False,
+        swmr_datasets: Optional[Dict[str, tuple]] = None,
+        compact_metadata: bool = False,
+    ):
         self.db = database
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.buffering = buffering
+        self.expected_rows = expected_rows
+        self.compression = compression
+        self.swmr = swmr  # if True, SWMR starts with the first live save
+        self.swmr_datasets = dict(swmr_datasets) if swmr_datasets else dict()
+        self._is_swmr_active = False
+        self.compact_metadata = compact_metadata  # default format of add_metadata()
+        self._lengths = dict()  # number of valid rows of appended datasets, by name
+        self._unflushed_bytes = 0
+        self._last_flush_time = time.perf_counter()
+
+    def flush(self) -> None:
+        """
+        Records the logical length of the appended datasets and flushes the file.
+        """
+        if not self._is_swmr_active:  # attributes cannot be written in SWMR mode
+            for name, length in self._lengths.items():
+                self.db[name].attrs[LENGTH_ATTR] = length
+        self.db.flush()
+        self._unflushed_bytes = 0
+        self._last_flush_time = time.perf_counter()
+
+    def close(self) -> None:
+        """
+        Trims the appended datasets to their logical length and flushes the file.
+        """
+        for name, length in self._lengths.items():
+            dataset = self.db[name]
+            if dataset.shape[0] != length:
+                dataset.resize(length, axis=0)
+        self.flush()
+
+    def start_swmr(self) -> None:
+        """
+        Creates the datasets declared in swmr_datasets and switches the file to
+        single-writer/multiple-reader mode, so other processes can open it with
+        h5py.File(filename, "r", libver="latest", swmr=True) and call refresh() on the
+        datasets to follow the live saves. Datasets then only grow to their exact
+        length, so readers can rely on their shape. No new datasets, groups or
+        attributes can be created until end_swmr().
+        """
+        for path, row_shape in self.swmr_datasets.items():
+            if path not in self.db:
+                group, _, name = path.rpartition("/")
+                enter_point = self.db.require_group(group) if group else self.db
+                self._create_dataset(enter_point, name, np.empty((0, *row_shape)))
+        for name, length in self._lengths.items():  # readers rely on the shape alone
+            dataset = self.db[name]
+            if dataset.shape[0] != length:
+                dataset.resize(length, axis=0)
+            if LENGTH_ATTR in dataset.attrs:  # would hide rows saved in SWMR mode
+                del dataset.attrs[LENGTH_ATTR]
+        self.db.flush()
+        self.db.swmr_mode = True
+        self._is_swmr_active = True
+        log.info(f"Started SWMR mode for {list(self.swmr_datasets)}")
+
+    def end_swmr(self) -> None:
+        """
+        Reopens the file in normal append mode, e.g. to write the final results.
+        """
+        if not self._is_swmr_active:
+            return
+        self.swmr = False  # do not restart SWMR on the next live save
+        filename = self.db.filename
+        self.flush()
+        self.db.close()
+        self.db = h5py.File(filename, "a", libver="latest")
+        self._is_swmr_active = False
+
+    def drain(self) -> None:
+        """
+        Writes are synchronous, so this only flushes the file. Mirrors
+        AsyncDataHandle.drain() so callers can use either handle.
+        """
+        self.flush()
+
+    def _maybe_flush(self) -> None:
+        """
+        Flushes the file if the time or byte limit of the flush policy is reached.
+        """
+        elapsed_time = time.perf_counter() - self._last_flush_time
+        if elapsed_time >= self.flush_interval or (
+            self._unflushed_bytes >= self.flush_bytes
+        ):
+            self.flush()
+
+    def _get_length(self, dataset: h5py.Dataset) -> int:
+        """
+        Returns the number of valid rows of the dataset.
+        """
+        if dataset.name not in self._lengths:  # e.g. written by an earlier DataHandle
+            length = dataset.attrs.get(LENGTH_ATTR, dataset.shape[0])
+            self._lengths[dataset.name] = int(length)
+        return self._lengths[dataset.name]
+
+    def _append(self, dataset: h5py.Dataset, data: np.ndarray) -> None:
+        """
+        Writes data after the last valid row of the dataset. Capacity grows
+        geometrically, so most appends write into preallocated rows without resizing.
+        """
+        length = self._get_length(dataset)
+        new_length = length + data.shape[0]
+        capacity = dataset.shape[0]
+        if new_length > capacity:
+            # readers of a SWMR file only see the shape, so never over-allocate
+            growth_factor = 1 if self._is_swmr_active else self.growth_factor
+            capacity = max(new_length, int(capacity * growth_factor))
+            dataset.resize(capacity, axis=0)
+        dataset[length:new_length] = data
+        self._lengths[dataset.name] = new_length
+        self._unflushed_bytes += data.nbytes
+
+    def _create_dataset(self, enter_point, name: str, data: np.ndarray):
+        """
+        Creates a dataset appendable along axis 0 with the chunking and compression
+        policy of the handle.
+        """
+        # create new max shape, in first dimension, it is unlimited
+        data_shape_list = list(data.shape)
+        data_shape_list[0] = None
+        maxshape = tuple(data_shape_list)
+        chunks = get_chunk_shape(
+            data.shape[1:],
+            data.dtype.itemsize,
+            buffering=self.buffering,
+            expected_rows=self.expected_rows,
+        )
+        dataset = enter_point.create_dataset(
+            name=name,
+            data=data,
+            maxshape=maxshape,
+            chunks=chunks,
+            **get_compression_kwargs(self.compression, data.dtype),
+        )
+        self._lengths[dataset.name] = data.shape[0]
+        self._unflushed_bytes += data.nbytes
+        return dataset
 
     def update_result(self, name: str, data: np.ndarray, group: Optional[str]) -> None:
 
+        if self.swmr and not self._is_swmr_active:
+            self.start_swmr()
+
         # if group is given, it will create a group in the hdf5 file
         if group:
             enter_point = self.db.require_group(group)
@@ -623,9 +1076,8 @@ class DataHandle:
                             data has the shape of {exist_data_shape}, the second dimension should be the same."
                         )
 
-                    # resize the existing data shape and update data
-                    dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
-                    dataset[-data.shape[0] :] = data
+                    # append data, growing the dataset if needed
+                    self._append(dataset, data)
 
                 # 3d raw data
                 # the first index is the repetition number
@@ -641,9 +1093,8 @@ class DataHandle:
                             data has the shape of {exist_data_shape}, the second and third dimension should be the same."
                         )
 
-                    # resize the existing data shape and update data
-                    dataset.resize(dataset.shape[0] + data.shape[0], axis=0)
-                    dataset[-data.shape[0] :] = data
+                    # append data, growing the dataset if needed
+                    self._append(dataset, data)
 
                 else:
                     raise ValueError(
@@ -666,28 +1117,18 @@ class DataHandle:
             # convert the shape of new data
             # if the new data is i dimension, it will convert it to 2 dimension
             if len(new_data_shape) == 1:
-                newdata_shape_list = list(new_data_shape)
-                newdata_shape_list[0] = 1
-                newdata_shape_2d = tuple(newdata_shape_list)
-                data = data.reshape(newdata_shape_2d)
+                data = data.reshape(1, new_data_shape[0])
                 new_data_shape = data.shape
 
-                # create new max shape, in first dimension, it is unlimited
-                newdata_shape_list[0] = None
-                maxshape = tuple(newdata_shape_list)
-                enter_point.create_dataset(
-                    name=name, data=data, maxshape=maxshape, chunks=True
-                )
-            else:
-                data_shape_list = list(new_data_shape)
-                data_shape_list[0] = None
-                maxshape = tuple(data_shape_list)
-                enter_point.create_dataset(
-                    name=name, data=data, maxshape=maxshape, chunks=True
+            if self._is_swmr_active:
+                raise ValueError(
+                    f"Cannot create dataset '{name}' in SWMR mode, please declare "
+                    "it in swmr_datasets"
                 )
+            self._create_dataset(enter_point, name, data)
 
-        # flush data to the file once update new data
-        self.db.flush()
+        # flush data to the file according to the flush policy
+        self._maybe_flush()
 
     def update_multiple_results(
         self,
@@ -703,7 +1144,6 @@ class DataHandle:
         else:
             for i, (key, value) in enumerate(data_dict.items()):
                 self.update_result(name=key, data=value, group=group)
-        self.db.flush()
 
     def add_result(
         self, name: str, data: np.ndarray, overwirte: bool = False, group=Optional[str]
@@ -711,6 +1151,7 @@ class DataHandle:
         """
         add the result once, rather than update the data
         """
+        self.end_swmr()  # new datasets cannot be created in SWMR mode
 
         # if group is given, it will create a group in the hdf5 file
         if group:
@@ -721,6 +1162,7 @@ class DataHandle:
         if name in enter_point.keys():
             if isinstance(enter_point[name], h5py.Dataset):
                 if overwirte:
+                    self._lengths.pop(enter_point[name].name, None)  # not appended to
                     del enter_point[name]
                     enter_point.create_dataset(name=name, data=data)
                     log.info("Delete the exisitng data and overwrite it")
@@ -765,7 +1207,17 @@ class DataHandle:
             for i, (key, value) in enumerate(data_dict.items()):
                 self.add_result(name=key, data=value, overwirte=overwrite, group=group)
 
-    def add_metadata(self, metadata_dict: dict, overwrite: bool = False) -> None:
+    def add_metadata(
+        self, metadata_dict: dict, overwrite: bool = False, compact: bool = None
+    ) -> None:
+        """
+        compact selects write_compact_metadata() over write_dict_to_hdf5(), it defaults
+        to the compact_metadata setting of the handle.
+        """
+        self.end_swmr()  # attributes cannot be written in SWMR mode
+        if self.compact_metadata if compact is None else compact:
+            write_compact_metadata(metadata_dict, self.db, overwrite=overwrite)
+            return
         if overwrite:
             overwirte_level = 0
         else:
@@ -783,3 +1235,306 @@ def get_dict(results: dict, *args) -> dict:
         if isinstance(key, str) and key in results.keys():
             get_dict[key] = results
     return get_dict
+
+
+class AsyncDataHandle:
+    """
+    Asynchronous front-end of a DataHandle. Write calls are put on a bounded queue and
+    executed in order by a writer thread, which is the only thread touching the file
+    until close() returns, so disk stalls do not block the caller. Arrays passed to
+    write calls must not be modified afterwards. The first error raised by the writer
+    is re-raised by the next call, drain() or close(); later writes are discarded.
+    """
+
+    def __init__(self, handle: DataHandle, queue_size: int = WRITE_QUEUE_SIZE):
+        self._handle = handle
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None  # first exception raised by the writer thread, if any
+        self._thread = threading.Thread(target=self._write, name="datasaver")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def update_result(self, *args, **kwargs) -> None:
+        self._submit("update_result", *args, **kwargs)
+
+    def update_multiple_results(self, *args, **kwargs) -> None:
+        self._submit("update_multiple_results", *args, **kwargs)
+
+    def add_result(self, *args, **kwargs) -> None:
+        self._submit("add_result", *args, **kwargs)
+
+    def add_multiple_results(self, *args, **kwargs) -> None:
+        self._submit("add_multiple_results", *args, **kwargs)
+
+    def add_metadata(self, *args, **kwargs) -> None:
+        self._submit("add_metadata", *args, **kwargs)
+
+    def get_metadata(self, *args, **kwargs) -> dict:
+        """
+        Reads metadata after all pending writes are done.
+        """
+        return self._submit("get_metadata", *args, **kwargs).result()
+
+    def flush(self) -> None:
+        self._submit("flush")
+
+    def drain(self) -> None:
+        """
+        Blocks until all pending writes are done and the file is flushed.
+        """
+        self._submit("flush")
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """
+        Finishes the pending writes, closes the DataHandle and stops the writer thread.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def _submit(self, method_name: str, *args, **kwargs) -> Future:
+        """
+        Queues a call of the DataHandle method, blocking while the queue is full.
+        """
+        self._raise_error()
+        future = Future()
+        self._queue.put((future, method_name, args, kwargs))
+        return future
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _write(self) -> None:
+        """
+        Writer thread loop, executes queued calls until asked to stop.
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    self._call(self._handle.close)
+                    break
+                future, method_name, args, kwargs = item
+                if self._error is not None:  # keep draining so callers never block
+                    future.cancel()
+                    continue
+                method = getattr(self._handle, method_name)
+                try:
+                    future.set_result(method(*args, **kwargs))
+                except Exception as e:
+                    self._set_error(e)
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _call(self, method) -> None:
+        try:
+            method()
+        except Exception as e:
+            self._set_error(e)
+
+    def _set_error(self, error: Exception) -> None:
+        log.error(f"Writing to the database failed: {error!r}")
+        if self._error is None:
+            self._error = error
+
+
+class LazyDataset:
+    """
+    Read-only, sliceable view of a saved dataset that only reads the requested part from
+    disk. Contiguous uncompressed datasets are memory-mapped, others are read through
+    h5py. Rows past the logical length of datasets still being written are hidden.
+    dims labels each dimension with a sweep axis name, or "rep" and "point" for raw
+    data rows holding one repetition of the flattened sweep.
+    """
+
+    def __init__(self, dataset: h5py.Dataset, sweep_axes=(), sweep_shape=()):
+        self._dataset = dataset
+        self.name = dataset.name
+        self.sweep_shape = tuple(sweep_shape)
+        length = dataset.attrs.get(LENGTH_ATTR, dataset.shape[0] if dataset.ndim else 0)
+        self.shape = (int(length), *dataset.shape[1:]) if dataset.ndim else ()
+        self.dims = self._get_dims(tuple(sweep_axes))
+        self._memmap = self._get_memmap()
+
+    def __repr__(self) -> str:
+        name, shape, dims = self.name, self.shape, self.dims
+        return f"{type(self).__name__}('{name}', {shape=}, {dims=})"
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        return np.asarray(self[()], dtype=dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if self._memmap is not None:
+            return np.asarray(self._memmap[key])
+        return self._dataset[self._restrict(key)]
+
+    @property
+    def dtype(self):
+        return self._dataset.dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def is_memmapped(self) -> bool:
+        return self._memmap is not None
+
+    def iter_rows(self, rows_per_block: Optional[int] = None, sweep_shape=False):
+        """
+        Yields (start row, block of rows) pairs covering the dataset, to reduce data
+        that does not fit in memory one block at a time. Blocks are aligned with the
+        HDF5 chunks by default. If sweep_shape, flat rows are reshaped to the sweep
+        shape.
+        """
+        if rows_per_block is None:
+            if self._dataset.chunks is not None:
+                rows_per_block = self._dataset.chunks[0]
+            else:
+                row_bytes = self.dtype.itemsize * int(np.prod(self.shape[1:]))
+                rows_per_block = max(1, CHUNK_BYTES // max(1, row_bytes))
+
+        for start in range(0, len(self), rows_per_block):
+            block = self[start : start + rows_per_block]
+            if sweep_shape and self.dims[1:] == ("point",):
+                block = block.reshape(len(block), *self.sweep_shape)
+            yield start, block
+
+    def _get_dims(self, sweep_axes: tuple) -> tuple:
+        if self.shape == self.sweep_shape:
+            return sweep_axes
+        if self.shape[1:] == self.sweep_shape:
+            return ("rep", *sweep_axes)
+        if self.ndim == 2 and self.shape[1] == int(np.prod(self.sweep_shape)):
+            return ("rep", "point")
+        return tuple(f"dim_{i}" for i in range(self.ndim))
+
+    def _get_memmap(self):
+        """
+        Memory-maps the dataset if it is stored contiguously and uncompressed.
+        """
+        dataset = self._dataset
+        if dataset.chunks is not None or dataset.compression is not None:
+            return None
+        dtype = np.dtype(dataset.dtype.str)  # e.g. "<f8", "|V8" for non-numeric types
+        if dtype.kind not in "biuf" or not self.shape:
+            return None
+        offset = dataset.id.get_offset()
+        if offset is None:  # storage not allocated yet
+            return None
+        return np.memmap(
+            dataset.file.filename,
+            mode="r",
+            dtype=dtype,
+            offset=offset,
+            shape=self.shape,
+        )
+
+    def _restrict(self, key):
+        """
+        Maps an index along the first axis to rows within the logical length.
+        """
+        if not self.shape or self.shape[0] == self._dataset.shape[0]:
+            return key
+        key = key if isinstance(key, tuple) else (key,)
+        if not key or key[0] is Ellipsis:
+            key = (slice(None), *key)
+        rows = range(self.shape[0])[key[0]]  # raises IndexError like numpy
+        if isinstance(rows, range):
+            rows = slice(rows.start, rows.stop, rows.step)
+        return (rows, *key[1:])
+
+
+class DataReader:
+    """
+    Opens a saved experiment file for offline analysis. Datasets of the data group are
+    returned as LazyDataset objects labeled with the sweep axes, whose coordinates are
+    read from the saved x, y, other sweep and "internal sweep" datasets. Use swmr=True
+    to follow a file that is being written by a DataSaver in SWMR mode.
+    """
+
+    def __init__(self, filepath: Union[str, Path], group: str = "data", swmr=False):
+        self.filepath = Path(filepath)
+        self.group = group
+        if swmr:
+            self.db = h5py.File(self.filepath, "r", libver="latest", swmr=True)
+        else:
+            self.db = h5py.File(self.filepath, "r")
+        self._metadata = None  # updated by metadata getter
+
+    def __enter__(self) -> "DataReader":
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}('{self.filepath.name}', {self.keys()})"
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._data
+
+    def __getitem__(self, name: str) -> LazyDataset:
+        dataset = self._data[name]
+        if self.db.swmr_mode:
+            dataset.refresh()
+        return LazyDataset(dataset, self.sweep_axes, self.sweep_shape)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def keys(self) -> list:
+        return list(self._data.keys())
+
+    @property
+    def metadata(self) -> dict:
+        """
+        Everything saved outside of the data group, e.g. experiment and mode parameters.
+        """
+        if self._metadata is None:
+            self._metadata = read_dict_from_hdf5({}, self.db, exclude=(self.group,))
+        return self._metadata
+
+    @property
+    def sweep_axes(self) -> list:
+        """
+        Names of the sweep axes in buffering order, from the saved experiment
+        parameters, or from the saved x, y and internal sweep datasets otherwise.
+        """
+        sweep_axes = self.metadata.get("sweep_axes")
+        if sweep_axes is None:
+            sweep_axes = [key for key in ("x", "y", "internal sweep") if key in self]
+        # the names are read back as bytes unless saved as compact metadata
+        sweep_axes = [k.decode() if isinstance(k, bytes) else k for k in sweep_axes]
+        return [key for key in sweep_axes if key in self]
+
+    @property
+    def sweep_shape(self) -> tuple:
+        sweep_axes = self.sweep_axes
+        return self._data[sweep_axes[0]].shape if sweep_axes else ()
+
+    @property
+    def coords(self) -> dict:
+        """
+        1D coordinates of each sweep axis, read from the saved sweep datasets which have
+        the full sweep shape.
+        """
+        coords = dict()
+        for axis, key in enumerate(self.sweep_axes):
+            dataset = self._data[key]
+            index = [0] * dataset.ndim
+            index[axis] = slice(None)
+            coords[key] = dataset[tuple(index)]
+        return coords
+
+    @property
+    def _data(self):
+        return self.db[self.group] if self.group else self.db
@@ -22,6 +22,10 @@ class Experiment(Parametrized):
         "wait_time",  # wait time in nanoseconds between repetitions
         "fetch_period",  # wait time between fetching and plotting
         "single_shot",
+        "block_size",  # reps averaged per block on the server, None saves every rep
+        "rep_block",  # consecutive reps played at each sweep point
+        "shuffle",  # visit sweep points in random order, can be a seed
+        "sweep_axes",  # names of the saved sweep axes, used by datasaver.DataReader
     }
 
     def __init__(
@@ -31,8 +35,12 @@ class Experiment(Parametrized):
         wait_time,
         x_sweep=None,
         y_sweep=None,
+        sweeps=None,
         fetch_period=1,
         single_shot=False,
+        block_size=None,
+        rep_block=1,
+        shuffle=False,
     ):
 
         # List of modes used in the experiment. String values will be replaced by
@@ -46,11 +54,42 @@ class Experiment(Parametrized):
         # Wait time between live fetching/plotting/saving rounds
         self.fetch_period = fetch_period
 
-        # Sweep configurations
-        self.sweep_config = {"n": (0, self.reps, 1), "x": x_sweep, "y": y_sweep}
+        # Loop order. rep_block consecutive reps are played at each sweep point: 1 keeps
+        # the repetition loop outermost, reps makes averaging the innermost loop and
+        # values in between interleave blocks of averaging with the sweep.
+        self.rep_block = rep_block
+        if self.reps % self.rep_block:
+            raise ValueError(f"{reps = } must be a multiple of {rep_block = }")
+        if self.rep_block > 1 and block_size:
+            raise ValueError("rep_block and block_size cannot be combined")
+
+        # If True or a seed, sweep points are visited in a random order, drawn when the
+        # QUA sequence is built. point_order[i] is the index of the i-th visited point.
+        self.shuffle = shuffle
+        self.point_order = None  # updated in QUA_sequence
+
+        # Sweep configurations. Extra sweeps are named axes nested inside x and y, in
+        # the order they are given.
+        sweeps = dict() if sweeps is None else dict(sweeps)
+        self.sweep_config = {
+            "n": (0, self.reps, self.rep_block),
+            "x": x_sweep,
+            "y": y_sweep,
+        }
+        self.sweep_config |= sweeps
+        self.sweep_keys = ["x", "y"] + list(sweeps)  # ordered outermost to innermost
         self.buffering = tuple()  # defined in _configure_sweeps
         self.single_shot = single_shot
 
+        # Number of repetitions averaged into each block of moments on the server. If
+        # None, every repetition is sent to the client for std error estimation.
+        self.block_size = block_size
+        if self.block_size and self.reps % self.block_size:
+            logger.warning(
+                f"{self.reps = } is not a multiple of {self.block_size = }, the last "
+                f"{self.reps % self.block_size} reps are left out of the std error"
+            )
+
         # ExpVariable definitions. This list is updated in _configure_sweeps and after
         # stream and variable declaration.
         self.variables = {
@@ -58,13 +97,31 @@ class Experiment(Parametrized):
             "x": macros.ExpVariable(average=False, save_all=False),
             "y": macros.ExpVariable(average=False, save_all=False),
             "I": macros.ExpVariable(
-                average=False, tag="I", var_type=qua.fixed, buffer=True
+                average=False,
+                tag="I",
+                var_type=qua.fixed,
+                buffer=True,
+                save_all=not self.block_size,
             ),
             "Q": macros.ExpVariable(
-                average=False, tag="Q", var_type=qua.fixed, buffer=True
+                average=False,
+                tag="Q",
+                var_type=qua.fixed,
+                buffer=True,
+                save_all=not self.block_size,
             ),
         }
 
+        # Counter of consecutive reps at each sweep point
+        if self.rep_block > 1:
+            self.variables["n_inner"] = macros.ExpVariable(var_type=int)
+
+        # Extra sweep axes
+        for key in sweeps:
+            if key in self.variables or not key.isidentifier():
+                raise ValueError(f"Invalid name for sweep axis: '{key}'")
+            self.variables[key] = macros.ExpVariable(average=False, save_all=False)
+
         # Single shot
         if self.single_shot:
             self.variables |= {
@@ -81,21 +138,37 @@ class Experiment(Parametrized):
         self.Z_SQ_RAW_tag = "Z_SQ_RAW"
         self.Z_SQ_RAW_AVG_tag = "Z_SQ_RAW_AVG"
         self.Z_AVG_tag = "Z_AVG"
+        self.I_BLOCK_tag = "I_BLOCK"
+        self.Q_BLOCK_tag = "Q_BLOCK"
+        self.I_SQ_BLOCK_tag = "I_SQ_BLOCK"
+        self.Q_SQ_BLOCK_tag = "Q_SQ_BLOCK"
+
+        if self.block_size:
+            # tags of the data to be used in the standard deviation estimation
+            self.sd_estimation_tags = [
+                self.I_BLOCK_tag,
+                self.Q_BLOCK_tag,
+                self.I_SQ_BLOCK_tag,
+                self.Q_SQ_BLOCK_tag,
+            ]
+            # block moments replace the raw I and Q repetitions in live saving
+            self.live_saving_tags = list(self.sd_estimation_tags)
+        else:
+            # tags of the data to be used in the standard deviation estimation
+            self.sd_estimation_tags = [self.Z_SQ_RAW_tag, self.Z_SQ_RAW_AVG_tag]
 
-        # tags of the data to be used in the standard deviation estimation
-        self.sd_estimation_tags = [self.Z_SQ_RAW_tag, self.Z_SQ_RAW_AVG_tag]
-
-        # tags of the data to be used in live saving
-        self.live_saving_tags = [self.variables["I"].tag, self.variables["Q"].tag]
+            # tags of the data to be used in live saving
+            self.live_saving_tags = [self.variables["I"].tag, self.variables["Q"].tag]
 
         # tags of the data to be used in the final save
         self.final_saving_tags = [self.Z_AVG_tag] + [
-            self.variables[v].tag for v in ["x", "y"] if self.variables[v].tag
+            self.variables[v].tag for v in self.sweep_keys if self.variables[v].tag
         ]
 
         # parameters to be used by the plotter. Updated in self.setup_plot method.
         self.plot_setup = dict()
         self.setup_plot(**self.plot_setup)
+        self._is_live_plot_skipped = False  # to warn only once for >2D sweeps
 
         logger.info(f"Created {type(self).__name__}")
 
@@ -105,13 +178,22 @@ class Experiment(Parametrized):
         # Assumes the professor has already updated self.modes
         return [mode.name for mode in self.modes]
 
+    @property
+    def sweep_axes(self):
+        # return the names of the configured sweep axes in buffering order, including
+        # the internal sweep if defined in the child experiment class
+        sweep_axes = [key for key in self.sweep_keys if self.sweep_config[key]]
+        if hasattr(self, "internal_sweep"):
+            sweep_axes.append("internal sweep")
+        return sweep_axes
+
     @property
     def results_tags(self):
-        # return the tags for independent variables x, y (if applicable) and dependent
-        # variables z for live plotting and data saving.
+        # return the tags for independent variables x, y and extra sweeps (if
+        # applicable) and dependent variables z for live plotting and data saving.
 
         indep_tags = []
-        for var in ["x", "y"]:
+        for var in self.sweep_keys:
             if self.variables[var].tag:
                 indep_tags.append(self.variables[var].tag)
 
@@ -175,7 +257,7 @@ class Experiment(Parametrized):
 
     def _configure_sweeps(self, sweep_variables_keys):
         """
-        Check if each x and y sweeps are correctly configured. If so, update buffering, variable type, and tag of x and y in self.variables accordingly.
+        Check if each sweep in sweep_variables_keys is correctly configured. If so, update buffering, variable type, and tag of the swept variables in self.variables accordingly. Buffering follows the order of sweep_variables_keys.
         """
 
         buffering = list()
@@ -199,6 +281,9 @@ class Experiment(Parametrized):
                 # Define key as memory tag
                 self.variables[key].tag = key
 
+        # number of sweep points visited by the sweep loops
+        self.num_points = int(np.prod(buffering))
+
         # if an internal sweep is defined in the child experiment class, add its length
         # to the buffering
         try:
@@ -208,6 +293,16 @@ class Experiment(Parametrized):
 
         self.buffering = tuple(buffering)
 
+        # stream buffer dimensions. Each rep_block of consecutive reps is buffered
+        # along its own axis, next to the sweep point axis.
+        if self.rep_block > 1:
+            points_len = np.prod(self.buffering) // self.num_points
+            self.stream_buffering = (self.num_points, self.rep_block)
+            if points_len > 1:
+                self.stream_buffering += (points_len,)
+        else:
+            self.stream_buffering = int(np.prod(self.buffering))
+
         if len(self.buffering) == 0:
             logger.warning("No sweep is configured")
         return
@@ -223,10 +318,11 @@ class Experiment(Parametrized):
     def QUA_sequence(self):
         """
         Method that returns the QUA sequence to be executed in the quantum machine.
-        The x sweep is always the innermost loop when both x and y are configured.
+        Sweeps are nested in the order of self.sweep_keys, so x is the outermost loop
+        after the repetition loop and the last extra sweep is the innermost one.
         """
 
-        self._configure_sweeps(["x", "y"])
+        self._configure_sweeps(self.sweep_keys)
 
         with qua.program() as qua_sequence:
 
@@ -238,21 +334,124 @@ class Experiment(Parametrized):
             for key, value in self.variables.items():
                 setattr(self, key, value.var)
             # Plays pulse sequence in a loop. Variable order defines loop nesting order
-            sweep_variables = [self.variables[key] for key in ["n", "x", "y"]]
-            macros.QUA_loop(self.QUA_play_pulse_sequence, sweep_variables)
+            sweep_keys = ["n"] + self.sweep_keys
+            sweep_variables = [self.variables[key] for key in sweep_keys]
+            macros.QUA_loop(
+                self.QUA_play_pulse_sequence,
+                sweep_variables,
+                rep_block=self.rep_block,
+                rep_variable=self.variables.get("n_inner"),
+                point_tables=self._build_point_tables(),
+            )
 
             # Define stream processing
-            buffer_len = np.prod(self.buffering)
+            rep_axis = 1 if self.rep_block > 1 else None
             with qua.stream_processing():
-                macros.process_streams(self.variables, buffer_len=buffer_len)
-                macros.process_Z_values(
-                    self.variables["I"].stream,
-                    self.variables["Q"].stream,
-                    buffer_len=buffer_len,
+                macros.process_streams(
+                    self.variables, buffer_len=self.stream_buffering, rep_axis=rep_axis
                 )
+                if self.block_size:
+                    macros.process_block_moments(
+                        self.variables["I"].stream,
+                        self.variables["Q"].stream,
+                        buffer_len=self.stream_buffering,
+                        block_size=self.block_size,
+                    )
+                else:
+                    macros.process_Z_values(
+                        self.variables["I"].stream,
+                        self.variables["Q"].stream,
+                        buffer_len=self.stream_buffering,
+                        rep_axis=rep_axis,
+                    )
 
         return qua_sequence
 
+    def _build_point_tables(self):
+        """
+        Draws a random sweep point order if shuffling is enabled and returns the tables
+        of sweep values for macros.QUA_loop. Returns None if points are swept in order.
+        """
+
+        self.point_order = None
+        sweep_variables = [
+            self.variables[key] for key in self.sweep_keys if self.sweep_config[key]
+        ]
+        if self.shuffle is None or self.shuffle is False or not sweep_variables:
+            return None
+
+        seed = None if self.shuffle is True else self.shuffle
+        self.point_order = np.random.default_rng(seed).permutation(self.num_points)
+        logger.info(f"Shuffled the order of {self.num_points} sweep points")
+        return macros.build_point_tables(sweep_variables, self.point_order)
+
+    def reorder_results(self, partial_results):
+        """
+        Rearranges fetched results from the order they were acquired in to the order of
+        an ordinary sweep: raw repetitions along the first axis and sweep points in
+        C order of self.buffering along the last one. Returns partial_results unchanged
+        when rep_block is 1 and points are not shuffled.
+        """
+
+        if self.rep_block == 1 and self.point_order is None:
+            return partial_results
+
+        points_len = int(np.prod(self.buffering)) // self.num_points
+        row_tags, raw_tags = self._get_row_tags()
+
+        reordered_results = dict()
+        for tag, data in partial_results.items():
+            if tag in raw_tags and self.rep_block > 1:
+                # (rows, points, rep_block, ...) -> (rows, rep_block, points, ...)
+                data = np.moveaxis(data, 2, 1)
+            data = data.reshape(-1, self.num_points, points_len)
+
+            if self.point_order is not None:
+                # the i-th acquired point is point_order[i]
+                unshuffled_data = np.empty_like(data)
+                unshuffled_data[..., self.point_order, :] = data
+                data = unshuffled_data
+
+            shape = (-1, self.num_points * points_len) if tag in row_tags else (-1,)
+            reordered_results[tag] = data.reshape(shape)
+
+        return reordered_results
+
+    def _get_row_tags(self):
+        """
+        Returns the set of tags saved with save_all, which hold one row per fetched
+        result, and the subset of them holding every raw repetition, which are not
+        averaged over rep blocks.
+        """
+
+        streamed_variables = [v for v in self.variables.values() if v.tag]
+        row_tags = set(self.sd_estimation_tags) | {
+            v.tag for v in streamed_variables if v.save_all
+        }
+        raw_tags = {self.Z_SQ_RAW_tag} | {
+            v.tag for v in streamed_variables if v.save_all and not v.average
+        }
+        return row_tags, raw_tags & row_tags
+
+    @property
+    def result_row_shapes(self):
+        """
+        Shape of one fetched row of each tag saved with save_all, as streamed by the
+        server before reorder_results, so the fetcher can preallocate its stores.
+        Defined once QUA_sequence has configured the sweeps.
+        """
+
+        raw_shape = tuple(int(n) for n in np.atleast_1d(self.stream_buffering))
+        point_shape = raw_shape[:1] + raw_shape[2:] if self.rep_block > 1 else raw_shape
+        row_tags, raw_tags = self._get_row_tags()
+        return {tag: raw_shape if tag in raw_tags else point_shape for tag in row_tags}
+
+    def get_num_results(self):
+        """
+        Number of results, i.e. rows of each tag saved with save_all, of a full run.
+        """
+        return self.reps // (self.block_size or self.rep_block)
+
     def QUA_stream_results(self):
         """
         Execute stream_results macro in macros library. Meant to be used in
@@ -263,17 +462,85 @@ class Experiment(Parametrized):
     def estimate_sd(self, statistician, partial_results, num_results, stderr):
         """
         Method to call the statistician and estimate running mean standard error.
-        stderr holds the running values of (stderr, mean, variance * (n-1))
+        stderr holds (stderr, accumulator), where the statistician's RunningStats
+        accumulator is None before the first batch and reused for the whole run.
+        The two estimators differ: with every rep streamed, this is the std error of
+        the mean of the per-rep magnitudes |z|, while with block_size it is the std
+        error of the plotted magnitude of the mean |<Z>| = sqrt(Z_AVG). They agree when
+        the signal is well above the noise, near zero signal the former is larger.
         """
 
         # TODO do this for multiple dependent variables
 
+        if self.block_size:
+            return self._estimate_z_avg_sd_from_blocks(
+                statistician, partial_results, num_results, stderr
+            )
+
         zs_raw = np.sqrt(partial_results[self.Z_SQ_RAW_tag])
-        zs_raw_avg = np.sqrt(partial_results[self.Z_SQ_RAW_AVG_tag])
 
-        stderr = statistician.get_std_err(zs_raw, zs_raw_avg, num_results, *stderr)
+        _, running_stats = stderr
+        if running_stats is None:
+            running_stats = statistician.RunningStats()
+        running_stats.update(zs_raw)
+
+        return running_stats.std_err, running_stats
+
+    def _estimate_z_avg_sd_from_blocks(
+        self, statistician, partial_results, num_results, stderr
+    ):
+        """
+        Estimates the std error of |<Z>| = sqrt(Z_AVG) from the block moments streamed
+        by macros.process_block_moments, propagating the std errors of <I> and <Q>.
+        The running stats accumulate the block means of I and Q and the variances of I
+        and Q within each block, stacked along the first axis. The variance of a rep
+        combines the mean within-block variance with the variance of the block means,
+        so the I^2 moments are only ever compared to the mean of their own block.
+        """
+
+        i_blocks, q_blocks, i_sq_blocks, q_sq_blocks = (
+            partial_results[tag] for tag in self.sd_estimation_tags
+        )
+        # rows are blocks; columns are the moments of each sweep point
+        moments = np.stack(
+            [
+                i_blocks,
+                q_blocks,
+                np.clip(i_sq_blocks - i_blocks**2, 0, None),
+                np.clip(q_sq_blocks - q_blocks**2, 0, None),
+            ],
+            axis=1,
+        )
+
+        _, running_stats = stderr
+        if running_stats is None:
+            running_stats = statistician.RunningStats()
+        running_stats.update(moments)
+
+        # all blocks have the same size, so the mean of block means is the pooled mean
+        i_avg, q_avg, i_within_var, q_within_var = running_stats.mean
+        i_between_m2, q_between_m2 = running_stats.m2[:2]
+        num_blocks = running_stats.count
+        num_reps = num_blocks * self.block_size
 
-        return stderr
+        # sum of squared deviations of all reps from the pooled mean, made unbiased
+        i_var = self.block_size * (num_blocks * i_within_var + i_between_m2)
+        q_var = self.block_size * (num_blocks * q_within_var + q_between_m2)
+        i_var, q_var = i_var / max(num_reps - 1, 1), q_var / max(num_reps - 1, 1)
+
+        # propagate the std errors of <I> and <Q> to sqrt(<I>^2 + <Q>^2), neglecting
+        # the I-Q covariance
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_var = (i_avg**2 * i_var + q_avg**2 * q_var) / (i_avg**2 + q_avg**2)
+            std_err = np.sqrt(z_var / num_reps)
+
+        return std_err, running_stats
+
+    def get_num_reps(self, num_results):
+        """
+        Converts the number of fetched results to the number of repetitions they hold.
+        """
+        return num_results * (self.block_size or self.rep_block)
 
     def plot_results(self, plotter, partial_results, num_results, stderr):
         """
@@ -326,6 +593,8 @@ class Experiment(Parametrized):
             internal_sweep_dict = {}
             pass
 
+        num_results = self.get_num_reps(num_results)
+
         # Estimate standard error
         if self.single_shot:
             # Variance of the binomial variable assuming our estimate for probabilities
@@ -338,13 +607,19 @@ class Experiment(Parametrized):
             # Retrieve and reshape standard error estimation
             error_data = stderr[0].reshape(self.buffering)
 
-        plotter.live_plot(
-            independent_data,
-            dependent_data,
-            num_results,
-            fit_fn=self.fit_fn,
-            err=error_data,
-        )
+        # The plotter handles up to two independent variables, higher dimensional
+        # sweeps are only saved
+        if len(independent_data) <= 2:
+            plotter.live_plot(
+                independent_data,
+                dependent_data,
+                num_results,
+                fit_fn=self.fit_fn,
+                err=error_data,
+            )
+        elif not self._is_live_plot_skipped:
+            logger.warning(f"Live plotting {len(independent_data)}D sweeps is skipped")
+            self._is_live_plot_skipped = True
 
         # build data dictionary for final save
         dep_data_dict = {dep_tags[i]: dependent_data[i] for i in range(len(dep_tags))}
@@ -1,14 +1,15 @@
-import h5py
 import matplotlib.pyplot as plt
 import numpy as np
 
+from qcrew.helpers.datasaver import DataReader
+
 filepath = (
     "C:/Users/qcrew/Desktop/qcrew/data/lion_transmon/20220304/110559_lion_rr_amp_calibration.h5"
 )
-file = h5py.File(filepath, "r")
-data = file["data"]
-z_avg = data["Z_AVG"]
-x = data["x"]
+# DataReader hides the over-allocated rows of files left open by an interrupted run
+with DataReader(filepath) as reader:
+    z_avg = np.array(reader["Z_AVG"])
+    x = np.array(reader["x"])
 plt.figure(figsize=(12, 8))
 plt.plot(np.array(x), np.array(z_avg))
 plt.show()
@@ -1,5 +1,6 @@
 import numpy as np
 import copy
+import functools
 from qm import qua
 
 
@@ -102,6 +103,18 @@ class ExpVariable:
 
         return
 
+    @property
+    def values(self):
+        """
+        List of the values taken by the variable over its sweep, in loop order. None if no sweep is configured.
+        """
+
+        if self.sweep is None:
+            return None
+        if self.sweep_type == "for_":
+            return np.arange(*self.sweep).tolist()
+        return list(self.sweep)
+
 
 def declare_variables(var_list):
     """
@@ -145,9 +158,9 @@ def stream_results(var_list):
         qua.save(value.var, value.stream)
 
 
-def process_streams(var_list, buffer_len=1):
+def process_streams(var_list, buffer_len=1, rep_axis=None):
     """
-    Save streamed values to memory.
+    Save streamed values to memory. buffer_len is either the buffer length or a tuple with the buffer dimensions. If rep_axis is given, the consecutive repetitions buffered along it are averaged, except for streams saving every raw repetition, which are reordered by the client.
     """
 
     for key, value in var_list.items():
@@ -156,7 +169,9 @@ def process_streams(var_list, buffer_len=1):
         stream = copy.deepcopy(value.stream)
         memory_tag = value.tag
         if value.buffer:
-            stream = stream.buffer(buffer_len)
+            stream = _buffer(stream, buffer_len)
+            if value.average or not value.save_all:
+                stream = _average_reps(stream, rep_axis)
         if value.average:
             stream = stream.average()
         if value.save_all:
@@ -165,87 +180,132 @@ def process_streams(var_list, buffer_len=1):
             stream.save(memory_tag)
 
 
-def process_Z_values(I_stream, Q_stream, buffer_len=1):
+def process_Z_values(I_stream, Q_stream, buffer_len=1, rep_axis=None):
     """
-    Use results from I and Q streams to save processed data to memory. Z_SQ_RAW and Z_SQ_RAW_AVG are used for std error calculation; Z_AVG, for plotting.
+    Use results from I and Q streams to save processed data to memory. Z_SQ_RAW and Z_SQ_RAW_AVG are used for std error calculation; Z_AVG, for plotting. buffer_len and rep_axis are used as in process_streams.
     """
 
     # Is and Qs
-    I_raw = I_stream.buffer(buffer_len)
-    Q_raw = Q_stream.buffer(buffer_len)  # to reshape result streams
-    I_avg = I_raw.average()
-    Q_avg = Q_raw.average()
+    I_raw = _buffer(I_stream, buffer_len)
+    Q_raw = _buffer(Q_stream, buffer_len)  # to reshape result streams
+    I_avg = _average_reps(I_raw, rep_axis).average()
+    Q_avg = _average_reps(Q_raw, rep_axis).average()
 
     # we need these two streams to calculate  std err in a single pass
     (I_raw * I_raw + Q_raw * Q_raw).save_all("Z_SQ_RAW")
-    (I_raw * I_raw + Q_raw * Q_raw).average().save_all("Z_SQ_RAW_AVG")
+    z_sq_raw = _average_reps(I_raw * I_raw + Q_raw * Q_raw, rep_axis)
+    z_sq_raw.average().save_all("Z_SQ_RAW_AVG")
     
     # to live plot latest average
     (I_avg * I_avg + Q_avg * Q_avg).save("Z_AVG")
 
 
-def QUA_loop(qua_function, sweep_variables):
+def _buffer(stream, buffer_len):
+    """
+    Buffers a stream with buffer_len, either an int or a tuple of buffer dimensions.
+    """
+
+    if isinstance(buffer_len, tuple):
+        return stream.buffer(*buffer_len)
+    return stream.buffer(buffer_len)
+
+
+def _average_reps(stream, rep_axis):
+    """
+    Averages buffered values along rep_axis, if given, to get one value per sweep point.
+    """
+
+    if rep_axis is None:
+        return stream
+    return stream.map(qua.FUNCTIONS.average(rep_axis))
+
+
+def process_block_moments(I_stream, Q_stream, buffer_len=1, block_size=1):
+    """
+    Alternative to process_Z_values that averages I, Q, I^2 and Q^2 over blocks of block_size repetitions on the server, so only one row of moments per block is sent to the client instead of every raw repetition. I_BLOCK, Q_BLOCK, I_SQ_BLOCK and Q_SQ_BLOCK are used for std error calculation; Z_AVG, for plotting. The Z^2 block mean is not streamed since it equals I_SQ_BLOCK + Q_SQ_BLOCK. Repetitions that do not fill a complete block are only included in Z_AVG.
+    """
+
+    block_average = qua.FUNCTIONS.average(0)  # average over the block dimension
+    block_moments = {
+        "I_BLOCK": I_stream,
+        "Q_BLOCK": Q_stream,
+        "I_SQ_BLOCK": I_stream * I_stream,
+        "Q_SQ_BLOCK": Q_stream * Q_stream,
+    }
+    for memory_tag, stream in block_moments.items():
+        stream.buffer(block_size, buffer_len).map(block_average).save_all(memory_tag)
+
+    # to live plot latest average
+    I_avg = I_stream.buffer(buffer_len).average()
+    Q_avg = Q_stream.buffer(buffer_len).average()
+    (I_avg * I_avg + Q_avg * Q_avg).save("Z_AVG")
+
+
+def QUA_loop(
+    qua_function, sweep_variables, rep_block=1, rep_variable=None, point_tables=None
+):
     """
-    Loops a given qua_function. ::sweep_variables:: holds a list of ExpVariable objects for which a sweep is configured. Its order matches the loop nesting order.
+    Loops a given qua_function. ::sweep_variables:: holds a list of ExpVariable objects for which a sweep is configured. Its order matches the loop nesting order, from the outermost to the innermost loop, and variables without a configured sweep are skipped, so any number of sweep axes is supported.
     The first variable is assumed to always use qua.for_ loops.
+    If rep_block > 1, qua_function is played rep_block consecutive times at each sweep point, counted by the rep_variable ExpVariable; the repetition loop must then step by rep_block.
+    If point_tables is given, it holds the values of each configured sweep variable in the order the sweep points are visited (see build_point_tables), and a single for_each_ loop over all variables replaces the nested loops.
     """
 
-    # Repetition loop
-    n = sweep_variables[0]
-    v1 = sweep_variables[1]
-    v2 = sweep_variables[2]
+    if rep_block > 1:
+        qua_function = functools.partial(
+            _QUA_rep_loop, qua_function, rep_variable, rep_block
+        )
 
+    # Repetition loop
+    n, *sweep_axes = sweep_variables
     n_start, n_stop, n_step = n.sweep
-    # Unpack start, stop, step if sweep_type is 'for_'
-    if v1.sweep_type == "for_":
-        v1_start, v1_stop, v1_step = v1.sweep
-    if v2.sweep_type == "for_":
-        v2_start, v2_stop, v2_step = v2.sweep
-
     with qua.for_(n.var, n_start, n.var < n_stop, n.var + n_step):
+        configured_axes = [v for v in sweep_axes if v.sweep is not None]
+        if point_tables is None:
+            _QUA_nested_loop(qua_function, configured_axes)
+        else:
+            with qua.for_each_(tuple(v.var for v in configured_axes), point_tables):
+                qua_function()
+
+
+def _QUA_rep_loop(qua_function, rep_variable, rep_block):
+    """
+    Plays qua_function rep_block consecutive times.
+    """
+
+    var = rep_variable.var
+    with qua.for_(var, 0, var < rep_block, var + 1):
+        qua_function()
+
+
+def build_point_tables(sweep_variables, point_order):
+    """
+    Returns a tuple with one list of values per sweep variable, such that the i-th values of the lists are the coordinates of sweep point point_order[i]. Sweep points are numbered in the order of the nested loops, the first variable being the outermost.
+    """
+
+    grids = np.meshgrid(*[v.values for v in sweep_variables], indexing="ij")
+    return tuple(grid.ravel()[point_order].tolist() for grid in grids)
+
+
+def _QUA_nested_loop(qua_function, sweep_variables):
+    """
+    Recursively nests one loop per sweep variable and plays qua_function innermost.
+    """
+
+    if not sweep_variables:
+        qua_function()
+        return
+
+    with QUA_sweep(sweep_variables[0]):
+        _QUA_nested_loop(qua_function, sweep_variables[1:])
+
+
+def QUA_sweep(variable):
+    """
+    Returns the QUA loop context manager that sweeps the given ExpVariable over its configured values, using qua.for_ or qua.for_each_ according to its sweep_type.
+    """
 
-        # If neither v1 nor v2 sweeps are configured, simply play function
-        if v1.sweep is None and v2.sweep is None:
-            qua_function()
-
-        # If only v1 sweep is configured
-        elif v2.sweep is None:
-            if v1.sweep_type == "for_":
-                v1_start, v1_stop, v1_step = v1.sweep
-                with qua.for_(v1.var, v1_start, v1.var < v1_stop, v1.var + v1_step):
-                    qua_function()
-            if v1.sweep_type == "for_each_":
-                with qua.for_each_(v1.var, v1.sweep):
-                    qua_function()
-
-        # If only v2 sweep is configured
-        elif v1.sweep is None:
-            if v2.sweep_type == "for_":
-                v2_start, v2_stop, v2_step = v2.sweep
-                with qua.for_(v2.var, v2_start, v2.var < v2_stop, v2.var + v2_step):
-                    qua_function()
-            if v2.sweep_type == "for_each_":
-                with qua.for_each_(v2.var, v2.sweep):
-                    qua_function()
-
-        # If both v1 and v2 sweeps are configured, branch according to the sweep types
-
-        elif v1.sweep_type == "for_" and v2.sweep_type == "for_":
-            with qua.for_(v1.var, v1_start, v1.var < v1_stop, v1.var + v1_step):
-                with qua.for_(v2.var, v2_start, v2.var < v2_stop, v2.var + v2_step):
-                    qua_function()
-
-        elif v1.sweep_type == "for_" and v2.sweep_type == "for_each_":
-            with qua.for_(v1.var, v1_start, v1.var < v1_stop, v1.var + v1_step):
-                with qua.for_each_(v2.var, v2.sweep):
-                    qua_function()
-
-        elif v1.sweep_type == "for_" and v2.sweep_type == "for_each_":
-            with qua.for_each_(v1.var, v1.sweep):
-                with qua.for_(v2.var, v2_start, v2.var < v2_stop, v2.var + v2_step):
-                    qua_function()
-
-        elif v1.sweep_type == "for_" and v2.sweep_type == "for_each_":
-            with qua.for_each_(v1.var, v1.sweep):
-                with qua.for_each_(v2.var, v2.sweep):
-                    qua_function()
+    if variable.sweep_type == "for_":
+        start, stop, step = variable.sweep
+        return qua.for_(variable.var, start, variable.var < stop, variable.var + step)
+    return qua.for_each_(variable.var, variable.sweep)
@@ -1,21 +1,29 @@
 """ """
 
 import pathlib
-import time
 
 import numpy as np
 from qcrew.control.stage.stagehand import Stagehand
 from qcrew.helpers import logger
 
+from vnarunner import VNARunner, SettlePolicy
 from vnasavedata import VNADataSaver
 
 
 class AmpFluxSweep:
     """ """
 
-    def __init__(self, vna, yoko, repetitions: int, currents: tuple) -> None:
+    def __init__(
+        self,
+        vna,
+        yoko,
+        repetitions: int,
+        currents: tuple,
+        settle: SettlePolicy = 0.1,
+    ) -> None:
         """ """
         self.repetitions = repetitions
+        self.settle = settle  # for yoko output level to stabilize
         self.vna = vna
         self.yoko = yoko
         self.vna.is_averaging = (
@@ -27,13 +35,16 @@ class AmpFluxSweep:
             start, stop, step = currents
             self.currents = np.arange(start, stop + step / 2, step).round(7)
             datashape = (self.repetitions, len(self.currents), vna.sweep_points)
+            axes = ("rep", "current", "frequency")
         elif isinstance(currents, set):
             self.currents = sorted(currents)
             datashape = (self.repetitions, len(self.currents), vna.sweep_points)
+            axes = ("rep", "current", "frequency")
         elif isinstance(currents, (int, float)):
             self.currents = currents
             self._run = self._run_fsweep
             datashape = (self.repetitions, vna.sweep_points)
+            axes = ("rep", "frequency")
         else:
             raise ValueError(f"Invalid specification of {currents = }")
 
@@ -43,6 +54,7 @@ class AmpFluxSweep:
             "datasets": vna.datakeys,  # each group will have datasets of these names
             "datashape": datashape,
             "datatype": "f4",
+            "axes": axes,  # dimension names, coordinates are saved by run()
         }
 
     def run(self, saver) -> None:
@@ -59,37 +71,25 @@ class AmpFluxSweep:
 
     def _run_fsweep(self, saver) -> None:
         self.yoko.level = self.currents
-        for rep in range(self.repetitions):
-            self.vna.sweep()
-            saver.save_data(self.vna.data, pos=(rep,))  # save to root group
-            logger.info(f"Frequency sweep count = {rep+1} / {self.repetitions}")
+        points = [((rep,), None) for rep in range(self.repetitions)]
+        VNARunner(self.vna, saver).run(points)
 
     def _run_fasweep(self, saver) -> None:
         # save current data since its already available
         saver.save_data({"current": self.currents})
 
-        num_currents = len(self.currents)
-        # for n reps, for each current in self.currents, do fsweep
-        """
-        for rep in range(self.repetitions):
-            logger.info(f"Repetition: {rep+1}/{self.repetitions}")
-            for count, current in enumerate(self.currents):
-                self.yoko.level = current
-                logger.info(f"Set {current = }, sweep count: {count+1}/{num_currents}")
-                time.sleep(0.1)  # for yoko output level to stabilize
-                self.vna.sweep()
-                saver.save_data(self.vna.data, pos=(rep, count))
-        """
-
-        # try with outermost loop being current
-        for count, current in enumerate(self.currents):
-            self.yoko.level = current
-            logger.info(f"Set {current = }, sweep count: {count+1}/{num_currents}")
-            time.sleep(0.1)  # for yoko output level to stabilize
-            for rep in range(self.repetitions):
-                logger.info(f"Repetition: {rep+1}/{self.repetitions}")
-                self.vna.sweep()
-                saver.save_data(self.vna.data, pos=(rep, count))
+        # outermost loop is current, so the yoko settles once per current
+        points = [
+            ((rep, count), current)
+            for count, current in enumerate(self.currents)
+            for rep in range(self.repetitions)
+        ]
+        runner = VNARunner(self.vna, saver, self._set_current, settle=self.settle)
+        runner.run(points)
+
+    def _set_current(self, current: float) -> None:
+        self.yoko.level = current
+        logger.info(f"Set {current = }")
 
 if __name__ == "__main__":
 
@@ -146,6 +146,10 @@ if __name__ == "__main__":
             # eg 2: currents = {-15e-6, 0e-6, 15e-6} will sweep curent at -15uA, 0uA, and 15uA
             # eg 3: currents = 0 will do a frequency sweep at constant current of 0uA i.e. no current sweep
             "currents": (-4e-3, 4e-3, 0.1e-3),
+            # delay (s) after setting each current for the yoko output to stabilize
+            # can also be a callable, e.g. step_settle(rate) from vnarunner waits in
+            # proportion to the current step
+            "settle": 0.1,
         }
 
         # create measurement instance with instruments and measurement_parameters
@@ -2,20 +2,28 @@
 
 
 import pathlib
-import time
 
 import numpy as np
 from qcrew.control.stage.stagehand import Stagehand
 from qcrew.helpers import logger
 
+from vnarunner import VNARunner, SettlePolicy
 from vnasavedata import VNADataSaver
 
 class PumpPowerSweep:
     """ """
 
-    def __init__(self, vna, pump, repetitions: int, powers: tuple) -> None:
+    def __init__(
+        self,
+        vna,
+        pump,
+        repetitions: int,
+        powers: tuple,
+        settle: SettlePolicy = 0.1,
+    ) -> None:
         """ """
         self.repetitions = repetitions
+        self.settle = settle  # for signalcore output level to stabilize
         self.vna = vna
         self.pump = pump
         self.vna.is_averaging = (
@@ -27,13 +35,16 @@ class PumpPowerSweep:
             start, stop, step = powers
             self.powers = np.arange(start, stop + step / 2, step).round(7)
             datashape = (self.repetitions, len(self.powers), vna.sweep_points)
+            axes = ("rep", "power", "frequency")
         elif isinstance(powers, set):
             self.powers = sorted(powers)
             datashape = (self.repetitions, len(self.powers), vna.sweep_points)
+            axes = ("rep", "power", "frequency")
         elif isinstance(powers, (int, float)):
             self.powers = powers
             self._run = self._run_fsweep
             datashape = (self.repetitions, vna.sweep_points)
+            axes = ("rep", "frequency")
         else:
             raise ValueError(f"Invalid specification of {powers = }")
 
@@ -43,6 +54,7 @@ class PumpPowerSweep:
             "datasets": vna.datakeys,  # each group will have datasets of these names
             "datashape": datashape,
             "datatype": "f4",
+            "axes": axes,  # dimension names, coordinates are saved by run()
         }
 
     def run(self, saver) -> None:
@@ -57,25 +69,25 @@ class PumpPowerSweep:
 
     def _run_fsweep(self, saver) -> None:
         self.pump.power = self.powers
-        for rep in range(self.repetitions):
-            self.vna.sweep()
-            saver.save_data(self.vna.data, pos=(rep,))  # save to root group
-            logger.info(f"Frequency sweep count = {rep+1} / {self.repetitions}")
+        points = [((rep,), None) for rep in range(self.repetitions)]
+        VNARunner(self.vna, saver).run(points)
 
     def _run_fpsweep(self, saver) -> None:
         # save power data since its already available
         saver.save_data({"power": self.powers})
 
-        num_powers = len(self.powers)
         # for n reps, for each pump power in self.powers, do fsweep
-        for rep in range(self.repetitions):
-            logger.info(f"Repetition: {rep+1}/{self.repetitions}")
-            for count, power in enumerate(self.powers):
-                self.pump.power = power
-                logger.info(f"Set {power = }, sweep count: {count+1}/{num_powers}")
-                time.sleep(0.1)  # for signalcore output level to stabilize
-                self.vna.sweep()
-                saver.save_data(self.vna.data, pos=(rep, count))
+        points = [
+            ((rep, count), power)
+            for rep in range(self.repetitions)
+            for count, power in enumerate(self.powers)
+        ]
+        runner = VNARunner(self.vna, saver, self._set_power, settle=self.settle)
+        runner.run(points)
+
+    def _set_power(self, power: float) -> None:
+        self.pump.power = power
+        logger.info(f"Set {power = }")
 
 if __name__ == "__main__":
 
@@ -135,6 +147,8 @@ if __name__ == "__main__":
             # eg 2: powers = {-15, 0, 15} will sweep power at -15dBm, 0dBm, and 15dBm
             # eg 3: powers = 0 will do a frequency sweep at constant power of 0 dBm i.e. no power sweep
             "powers": (-20, -10, 3),
+            # delay (s) after setting each pump power for the output to stabilize
+            "settle": 0.1,
         }
 
         # create measurement instance with instruments and measurement_parameters
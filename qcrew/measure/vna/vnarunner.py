@@ -0,0 +1,89 @@
+""" Pipelined sweep loop shared by the VNA measurement scripts. Traces of one sweep are written to file by a writer thread while the next bias or power point is set, settled and swept. """
+
+import time
+from typing import Any, Callable, Iterable, Optional, Union
+
+from qcrew.control.pipeline import PipelineStage
+from qcrew.helpers import logger
+
+WRITER_QUEUE_SIZE = 8  # number of sweeps that can wait to be written before blocking
+
+# a settle policy is a fixed delay in s, or a callable returning the delay in s given
+# the previous (None on the first point) and the new point value
+SettlePolicy = Union[float, Callable[[Any, Any], float]]
+
+
+def step_settle(
+    rate: float, min_delay: float = 0.0, max_delay: float = float("inf")
+) -> Callable[[Any, Any], float]:
+    """
+    Returns a settle policy waiting `rate` s per unit of change of a scalar point value,
+    clipped to [min_delay, max_delay]. The first point waits max_delay if it is finite.
+    """
+
+    def settle(previous: Any, value: Any) -> float:
+        """ """
+        if previous is None:
+            return max_delay if max_delay != float("inf") else min_delay
+        return min(max(rate * abs(value - previous), min_delay), max_delay)
+
+    return settle
+
+
+class VNARunner:
+    """
+    Runs a sequence of VNA sweeps, each saved at its own position through the saver's
+    save_data() on a writer thread. A sweep point is set with set_point() and settled
+    only when its value differs from the previous one.
+    """
+
+    def __init__(
+        self,
+        vna,
+        saver,
+        set_point: Optional[Callable[[Any], None]] = None,
+        settle: SettlePolicy = 0.0,
+        queue_size: int = WRITER_QUEUE_SIZE,
+    ) -> None:
+        """ """
+        self.vna = vna
+        self.saver = saver
+        self.set_point = set_point
+        self.settle = settle
+        self.queue_size = queue_size
+
+    def run(self, points: Iterable[tuple[tuple, Any]]) -> None:
+        """
+        points: (pos, value) for each sweep, where pos is passed to save_data() and value
+        to set_point(), e.g. ((rep, count), current). The writer is drained before
+        returning and re-raises any error it encountered.
+        """
+        writer = PipelineStage("vna-writer", self._save, maxsize=self.queue_size)
+        writer.start()
+        previous = None  # value of the last point set, None before the first point
+        try:
+            points = list(points)
+            for count, (pos, value) in enumerate(points, start=1):
+                if self.set_point is not None and (count == 1 or value != previous):
+                    self.set_point(value)
+                    time.sleep(self._get_settle_delay(previous, value))
+                    previous = value
+                self.vna.sweep()
+                writer.put((self.vna.data, pos))  # overlaps writing with the next sweep
+                logger.info(f"Sweep {count} / {len(points)} done at {pos = }")
+                if writer.error is not None:
+                    break
+        finally:
+            writer.close()
+            writer.join()  # re-raises the first error encountered by the writer, if any
+
+    def _save(self, item: tuple[dict, tuple]) -> None:
+        """ """
+        data, pos = item
+        self.saver.save_data(data, pos=pos)
+
+    def _get_settle_delay(self, previous: Any, value: Any) -> float:
+        """ """
+        if callable(self.settle):
+            return self.settle(previous, value)
+        return self.settle
@@ -2,12 +2,22 @@
 
 from datetime import datetime
 import pathlib
+import time
 
 import h5py
+import numpy as np
 
 
 class VNADataSaver:
-    """ """
+    """
+    Saves VNA traces to datasets of shape datashape, one trace per save_data() call at
+    position pos, which indexes all but the last (frequency) dimension. Consecutive
+    traces along one dimension are buffered and written as one hyperslab, buffers are
+    written and the file flushed at least every flush_interval s and on exit.
+    axes names each dimension, as a sequence of names or a dict of name to coordinates
+    (None if the coordinates are saved later with save_data()). Coordinates are stored
+    as datasets of the same name and attached to the data as dimension scales.
+    """
 
     def __init__(
         self,
@@ -18,10 +28,13 @@ class VNADataSaver:
         datashape,
         datagroup: str = "/",
         datatype: str = "f8",
+        axes=None,
+        flush_interval: float = 5.0,
+        max_buffer_rows: int = 64,
     ) -> None:
         """ """
-        date, time = datetime.now().strftime("%Y%m%d %H%M%S").split()
-        filename = f"{time}_{measurementname}_{usersuffix}.hdf5"
+        date, time_ = datetime.now().strftime("%Y%m%d %H%M%S").split()
+        filename = f"{time_}_{measurementname}_{usersuffix}.hdf5"
         filedir = datapath / date
         filedir.mkdir(parents=True, exist_ok=True)
         self.filepath = filedir / filename
@@ -29,6 +42,13 @@ class VNADataSaver:
         self.datafile = h5py.File(str(self.filepath), "a")
         self.datagroup = datagroup
         self.datatype = datatype
+        self.datashape = tuple(datashape)
+        self.flush_interval = flush_interval
+        self.max_buffer_rows = max_buffer_rows
+        self._buffers = {}  # dataset name: _RowBuffer of traces not yet written
+        self._last_flush = time.monotonic()
+
+        self.axes = self._get_axes(axes)
         self.datasets = {}
         for datasetname in datasets:
             name = f"{datagroup}/{datasetname}"
@@ -36,6 +56,11 @@ class VNADataSaver:
                 name=name, shape=datashape, dtype=datatype
             )
             self.datasets[datasetname] = dataset
+            for dim, axis in enumerate(self.axes):
+                dataset.dims[dim].label = axis
+        for axis, coordinates in self.axes.items():
+            if coordinates is not None:
+                self._save_axis(axis, coordinates)
         self.datafile.flush()
 
     def __enter__(self):
@@ -44,9 +69,18 @@ class VNADataSaver:
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         """ """
-        self.datafile.flush()
+        self.flush()
         self.datafile.close()
 
+    def flush(self) -> None:
+        """
+        Writes all buffered traces and flushes the file.
+        """
+        for name in list(self._buffers):
+            self._write_buffer(name)
+        self.datafile.flush()
+        self._last_flush = time.monotonic()
+
     def save_metadata(self, metadatadict) -> None:
         """ """
         for key, value in metadatadict.items():
@@ -61,17 +95,117 @@ class VNADataSaver:
         """ """
         for name, datastream in data.items():
             if pos is None:  # create new dataset
+                if name in self.axes:
+                    self._save_axis(name, datastream)
+                    continue
                 name, dtype = f"{self.datagroup}/{name}", self.datatype
                 self.datafile.create_dataset(name=name, data=datastream, dtype=dtype)
             # insert into existing dataset at given pos
             else:
-                dataset = self.datasets[name]
-                if len(pos) == 1:
-                    rep_count = (*pos,)
-                    dataset[rep_count] = datastream
-                elif len(pos) == 2:
-                    rep_count, var_count = pos
-                    dataset[rep_count, var_count] = datastream
-                else:
-                    raise RuntimeError(f"WE DO NOT DO {len(pos)}D SWEEPS HERE...")
-        self.datafile.flush()
+                self._buffer_row(name, tuple(pos), datastream)
+
+        if pos is None or time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    def _get_axes(self, axes) -> dict:
+        """ """
+        if axes is None:
+            return {}
+        if not isinstance(axes, dict):
+            axes = dict.fromkeys(axes)
+        if len(axes) != len(self.datashape):
+            raise ValueError(f"Expect {len(self.datashape)} axes, got {list(axes)}")
+        return axes
+
+    def _save_axis(self, axis: str, coordinates) -> None:
+        """
+        Saves the coordinates of an axis in their own dtype and attaches them as the
+        dimension scale of that axis of all datasets. Coordinates saved earlier, e.g.
+        given at init and saved again with save_data(), are overwritten.
+        """
+        dim = list(self.axes).index(axis)
+        coordinates = np.asarray(coordinates)
+        if len(coordinates) != self.datashape[dim]:
+            size = self.datashape[dim]
+            raise ValueError(f"Expect {size} coordinates for '{axis}' axis")
+
+        name = f"{self.datagroup}/{axis}"
+        if name in self.datafile:
+            scale = self.datafile[name]
+            scale[...] = coordinates
+        else:
+            scale = self.datafile.create_dataset(name=name, data=coordinates)
+        scale.make_scale(axis)
+        for dataset in self.datasets.values():
+            dataset.dims[dim].attach_scale(scale)
+
+    def _buffer_row(self, name: str, pos: tuple, row) -> None:
+        """ """
+        if len(pos) >= len(self.datashape):
+            raise ValueError(f"Expect pos of at most {len(self.datashape) - 1} indices")
+
+        buffer = self._buffers.get(name)
+        if buffer is not None and not buffer.extend(pos, row):
+            self._write_buffer(name)
+            buffer = None
+        if buffer is None:
+            self._buffers[name] = _RowBuffer(pos, row)
+        elif len(buffer) >= self.max_buffer_rows:
+            self._write_buffer(name)
+
+    def _write_buffer(self, name: str) -> None:
+        """ """
+        buffer = self._buffers.pop(name)
+        self.datasets[name][buffer.selection] = buffer.rows
+
+
+class _RowBuffer:
+    """
+    Consecutive rows of a dataset along one dimension, written as one hyperslab.
+    """
+
+    def __init__(self, pos: tuple, row) -> None:
+        """ """
+        self.pos = pos  # position of the first row
+        self.axis = None  # dimension along which rows are consecutive, set by extend()
+        self._rows = [row]
+
+    def __len__(self) -> int:
+        """ """
+        return len(self._rows)
+
+    def extend(self, pos: tuple, row) -> bool:
+        """
+        Appends row if pos is the next position along the buffered dimension, returns
+        False without appending otherwise.
+        """
+        if len(pos) != len(self.pos):
+            return False
+        offsets = [index - start for index, start in zip(pos, self.pos)]
+        if self.axis is None:
+            steps = [dim for dim, offset in enumerate(offsets) if offset]
+            if len(steps) != 1 or offsets[steps[0]] != 1:
+                return False
+            self.axis = steps[0]
+
+        expected = [0] * len(offsets)
+        expected[self.axis] = len(self._rows)
+        if offsets != expected:
+            return False
+        self._rows.append(row)
+        return True
+
+    @property
+    def selection(self) -> tuple:
+        """ """
+        if self.axis is None:
+            return self.pos
+        selection = list(self.pos)
+        start = self.pos[self.axis]
+        selection[self.axis] = slice(start, start + len(self._rows))
+        return tuple(selection)
+
+    @property
+    def rows(self):
+        """ """
+        return self._rows[0] if self.axis is None else np.stack(self._rows)
@@ -7,6 +7,7 @@ import numpy as np
 
 from qcrew.control.stage.stagehand import Stagehand
 from qcrew.helpers import logger
+from vnarunner import VNARunner
 from vnasavedata import VNADataSaver
 
 
@@ -14,10 +15,16 @@ class VNASweep:
     """ """
 
     def __init__(
-        self, vna, repetitions: int, powers: tuple, attenuation: tuple
+        self,
+        vna,
+        repetitions: int,
+        powers: tuple,
+        attenuation: tuple,
+        settle: float = 0.0,
     ) -> None:
         """ """
         self.repetitions = repetitions
+        self.settle = settle  # settle policy applied after setting each power
         self.vna = vna
         self.port1_attenuation, self.port2_attenuation = attenuation
         if self.vna.is_averaging:
@@ -35,6 +42,7 @@ class VNASweep:
             self._run = self._run_fsweep
             self.powers = powers
             datashape = (self.repetitions, vna.sweep_points)
+            axes = ("rep", "frequency")
         elif is_fpsweep:
             self._run = self._run_fpsweep
             powerlist = []
@@ -49,6 +57,7 @@ class VNASweep:
             self.powers = list(itertools.product(*powerlist))
             logger.info(f"Found {len(self.powers)} input power combinations specified")
             datashape = (self.repetitions, len(self.powers), vna.sweep_points)
+            axes = ("rep", "power", "frequency")
         else:
             raise ValueError(f"Invalid specification of {powers = }")
 
@@ -58,6 +67,7 @@ class VNASweep:
             "datasets": vna.datakeys,  # each group will have datasets of these names
             "datashape": datashape,
             "datatype": "f4",
+            "axes": axes,  # dimension names, coordinates are saved by run()
         }
 
     def run(self, saver) -> None:
@@ -68,10 +78,8 @@ class VNASweep:
     def _run_fsweep(self, saver) -> None:
         """ """
         self.vna.powers = self.powers  # set input power on the VNA
-        for rep in range(self.repetitions):
-            self.vna.sweep()
-            saver.save_data(self.vna.data, pos=(rep,))  # save to root group
-            logger.info(f"Frequency sweep count = {rep+1} / {self.repetitions}")
+        points = [((rep,), None) for rep in range(self.repetitions)]
+        VNARunner(self.vna, saver).run(points)
 
     def _run_fpsweep(self, saver) -> None:
         """ """
@@ -82,15 +90,20 @@ class VNASweep:
         saver.save_data({"power": port1_powers, "power2": port2_powers})
 
         # for each power tuple in self.powers, do fsweep, for n reps
-        for power_count, (p1, p2) in enumerate(self.powers):  # p1, p2 = port powers
-            self.vna.powers = (p1, p2)  # set input power on the VNA
-            logger.info(f"Set power = ({p1}, {p2})")
-            for rep in range(self.repetitions):
-                self.vna.sweep()
-                saver.save_data(self.vna.data, pos=(rep, power_count))
-                logger.info(f"Frequency sweep repetition {rep+1} / {self.repetitions}")
-            if self.vna.is_averaging:
-                self.vna.reset_averaging_count()
+        points = [
+            ((rep, power_count), tuple(power))
+            for power_count, power in enumerate(self.powers)
+            for rep in range(self.repetitions)
+        ]
+        runner = VNARunner(self.vna, saver, self._set_powers, settle=self.settle)
+        runner.run(points)
+
+    def _set_powers(self, powers: tuple) -> None:
+        """ """
+        if self.vna.is_averaging:
+            self.vna.reset_averaging_count()
+        self.vna.powers = powers  # set input power on the VNA, p1, p2 = port powers
+        logger.info(f"Set power = {powers}")
 
 
 if __name__ == "__main__":
@@ -155,6 +168,8 @@ if __name__ == "__main__":
                 # total physical attenuation added to VNA ports, if any
                 # (port_1_attenuation, port_2_attenuation) in dB
                 "attenuation": (70.0, 0),
+                # delay (s) after setting each input power before sweeping
+                "settle": 0.0,
             }
 
             # create measurement instance with instruments and measurement_parameters
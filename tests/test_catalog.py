@@ -0,0 +1,78 @@
+""" Unit tests of the SQLite catalog of saved runs """
+
+from pathlib import Path
+
+import h5py
+
+from qcrew.helpers.catalog import RunCatalog, read_run_record
+from qcrew.helpers.datasaver import DataSaver, initialise_database
+
+
+def save_run(datapath, exp_name, metadata, compact_metadata=False):
+    """ Saves a run with metadata like the professor does, returns its path """
+    db = initialise_database(
+        exp_name=exp_name, sample_name="lion", project_name="tests", path=datapath
+    )
+    filepath = str(Path(db.filename).resolve())
+    with DataSaver(db, compact_metadata=compact_metadata) as datasaver:
+        datasaver.add_metadata(metadata)
+    return filepath
+
+
+def test_read_run_record_flattens_metadata(tmp_path):
+    metadata = {"reps": 100, "qubit": {"int_freq": -50e6, "name": "qubit"}}
+    filepath = save_run(tmp_path, "power_rabi", metadata)
+    record = read_run_record(filepath)
+    assert record["exp_name"] == "power_rabi"
+    assert record["sample_name"] == "lion"
+    assert record["metadata"]["reps"] == 100
+    assert record["metadata"]["qubit.int_freq"] == -50e6
+
+
+def test_query_finds_runs_by_name_and_metadata(tmp_path):
+    rabi = save_run(tmp_path, "power_rabi", {"reps": 100, "qubit": {"int_freq": -5e7}})
+    t1 = save_run(tmp_path, "t1", {"reps": 500, "qubit": {"int_freq": -6e7}}, True)
+    catalog = RunCatalog(tmp_path / "catalog.sqlite")
+    catalog.add_run(rabi)
+    catalog.add_run(t1)
+
+    def paths(**conditions):
+        return [run["path"] for run in catalog.query(**conditions)]
+
+    assert paths(exp_name="power%") == [rabi]
+    assert sorted(paths(sample_name="lion")) == sorted([rabi, t1])
+    assert paths(metadata={"reps": (200, None)}) == [t1]
+    assert paths(metadata={"qubit.int_freq": -5e7}) == [rabi]
+    assert paths(exp_name="t1", metadata={"reps": 100}) == []
+    assert catalog.get_metadata(t1)["qubit.int_freq"] == -6e7
+
+
+def test_rebuild_indexes_tree_and_skips_unchanged_files(tmp_path):
+    save_run(tmp_path, "power_rabi", {"reps": 100})
+    with h5py.File(tmp_path / "tests" / "broken.h5", "w"):
+        pass  # no run attributes, indexed from its file name
+    catalog = RunCatalog(tmp_path / "catalog.sqlite")
+    assert catalog.rebuild(tmp_path, workers=1) == 2
+    assert catalog.rebuild(tmp_path, workers=1) == 0
+    assert len(catalog.query()) == 2
+
+    save_run(tmp_path, "t1", {"reps": 500})
+    assert catalog.rebuild(tmp_path, workers=1) == 1
+    assert [run["exp_name"] for run in catalog.query(exp_name="t1")] == ["t1"]
+
+
+def test_legacy_file_names_give_sample_and_experiment_names(tmp_path):
+    folder = tmp_path / "tests" / "20260101"
+    folder.mkdir(parents=True)
+    with h5py.File(folder / "093015_lion_power_rabi.h5", "w") as file:
+        file.attrs["reps"] = 100  # saved before the run attributes were written
+    record = read_run_record(folder / "093015_lion_power_rabi.h5")
+    assert record["exp_name"] == "power_rabi"
+    assert record["sample_name"] == "lion"
+    assert record["timestamp"] == "2026-01-01T09:30:15"
+
+    catalog = RunCatalog(tmp_path / "catalog.sqlite")
+    catalog.rebuild(tmp_path, workers=1)
+    runs = catalog.query(exp_name="power_rabi", sample_name="lion")
+    assert [run["path"] for run in runs] == [record["path"]]
+    assert catalog.get_metadata(record["path"])["reps"] == 100
@@ -0,0 +1,253 @@
+""" Unit tests of the DataSaver write path and the DataReader read path """
+
+import threading
+
+import h5py
+import numpy as np
+import pytest
+from uncertainties import ufloat
+
+from qcrew.helpers import datasaver
+from qcrew.helpers.datasaver import (
+    COMPACT_METADATA,
+    AsyncDataHandle,
+    LENGTH_ATTR,
+    DataReader,
+    DataSaver,
+    get_chunk_shape,
+    get_compression_kwargs,
+    initialise_database,
+    read_compact_metadata,
+    read_dict_from_hdf5,
+)
+
+
+def test_reader_hides_rows_past_logical_length_of_unclosed_file(tmp_path):
+    filepath = tmp_path / "run.hdf5"
+    saver = DataSaver(h5py.File(filepath, "a"))
+    handle = saver.__enter__()
+    for rep in range(3):  # grows the dataset geometrically past 3 rows
+        handle.update_result("I", np.full(4, rep, dtype=float), group="data")
+    handle.flush()
+    handle.db.close()  # as if the run crashed before the DataSaver was closed
+
+    with h5py.File(filepath, "r") as file:
+        assert file["data/I"].shape[0] > 3
+        assert file["data/I"].attrs[LENGTH_ATTR] == 3
+    with DataReader(filepath) as reader:
+        data = np.array(reader["I"])
+    np.testing.assert_array_equal(data, np.repeat([[0.0], [1.0], [2.0]], 4, axis=1))
+
+
+def test_overwritten_dataset_is_not_trimmed_to_its_previous_length(tmp_path):
+    filepath = tmp_path / "run.hdf5"
+    with DataSaver(h5py.File(filepath, "a")) as handle:
+        for rep in range(3):
+            handle.update_result("Z", np.full(4, rep, dtype=float), group="data")
+        new_data = np.arange(20.0).reshape(5, 4)
+        handle.add_result("Z", new_data, overwirte=True, group="data")
+
+    with DataReader(filepath) as reader:
+        np.testing.assert_array_equal(reader["Z"], new_data)
+
+
+def test_compact_metadata_round_trip_and_key_lookup(tmp_path):
+    filepath = tmp_path / "run.hdf5"
+    metadata = {
+        "reps": 100,
+        "sweep": (0.0, 1.0, 0.25),
+        "fit": {"tau": ufloat(20e3, 1e3)},
+        "weights": np.arange(3.0),
+        "qubit": {"int_freq": -50e6, "ports": {"I": 3, "Q": 4}, 2: "two"},
+    }
+    with DataSaver(h5py.File(filepath, "a"), compact_metadata=True) as handle:
+        handle.add_metadata(metadata)
+        handle.add_metadata({"reps": 200})  # merged with the metadata already saved
+
+    with h5py.File(filepath, "r") as file:
+        assert list(file) == [COMPACT_METADATA, "__metadata_index__"]
+        saved = read_dict_from_hdf5({}, file)
+        assert read_compact_metadata(file, "qubit.int_freq") == -50e6
+        assert read_compact_metadata(file, "qubit.ports") == {"I": 3, "Q": 4}
+        assert read_compact_metadata(file, "qubit.2") == "two"
+        with pytest.raises(KeyError):
+            read_compact_metadata(file, "qubit.lo_freq")
+
+    assert saved["reps"] == 200
+    assert saved["sweep"] == (0.0, 1.0, 0.25)
+    assert saved["fit"]["tau"].std_dev == 1e3
+    np.testing.assert_array_equal(saved["weights"], metadata["weights"])
+    assert saved["qubit"] == metadata["qubit"]
+
+
+def test_swmr_live_save_to_initialised_database(tmp_path):
+    db = initialise_database(
+        exp_name="t1",
+        sample_name="lion",
+        project_name="tests",
+        path=tmp_path,
+        swmr=True,
+    )
+    filepath = db.filename
+    swmr_datasets = {"data/I": (4,)}
+    with DataSaver(db, swmr=True, swmr_datasets=swmr_datasets) as handle:
+        for rep in range(3):
+            handle.update_result("I", np.full(4, rep, dtype=float), group="data")
+        handle.flush()
+        with DataReader(filepath, swmr=True) as reader:  # reads while it is written
+            np.testing.assert_array_equal(reader["I"][:, 0], [0.0, 1.0, 2.0])
+        handle.add_metadata({"reps": 3})  # leaves SWMR mode to write attributes
+
+    with DataReader(filepath) as reader:
+        assert reader.metadata["reps"] == 3
+        assert len(reader["I"]) == 3
+
+
+@pytest.mark.parametrize("compact_metadata", [False, True])
+def test_reader_labels_memmapped_sweep_data(tmp_path, compact_metadata):
+    filepath = tmp_path / "run.hdf5"
+    xs, ys = np.linspace(0.0, 1.0, 4), np.array([3.0, 0.0, 1.0])
+    x_grid, y_grid = np.meshgrid(xs, ys, indexing="ij")
+    z_avg = x_grid + 10 * y_grid
+    with DataSaver(h5py.File(filepath, "a"), compact_metadata=compact_metadata) as h:
+        for name, data in {"x": x_grid, "y": y_grid, "Z_AVG": z_avg}.items():
+            h.add_result(name, data, group="data")
+        h.add_metadata({"sweep_axes": ["x", "y"], "reps": 10})
+
+    with DataReader(filepath) as reader:
+        z_data = reader["Z_AVG"]
+        assert reader.sweep_axes == ["x", "y"]
+        assert z_data.dims == ("x", "y")
+        assert z_data.is_memmapped  # contiguous float64, read without h5py
+        np.testing.assert_array_equal(z_data[1:3, 0], z_avg[1:3, 0])
+        np.testing.assert_array_equal(reader.coords["x"], xs)
+        np.testing.assert_array_equal(reader.coords["y"], ys)
+
+
+class RecordingHandle:
+    """ DataHandle double recording its calls and the thread making them """
+
+    def __init__(self, fail_on=None):
+        self.calls, self.threads, self.fail_on = list(), set(), fail_on
+        self.release = threading.Event()  # writes block until released
+        self.release.set()
+
+    def update_result(self, name, data, group):
+        self.release.wait(5.0)
+        self.threads.add(threading.current_thread().name)
+        if data == self.fail_on:
+            raise OSError("disk full")
+        self.calls.append(data)
+
+    def flush(self):
+        self.calls.append("flush")
+
+    def get_metadata(self, read_dict):
+        return {"calls": list(self.calls)}
+
+    def close(self):
+        self.calls.append("close")
+
+
+def test_async_writes_run_in_order_on_writer_thread():
+    handle = RecordingHandle()
+    async_handle = AsyncDataHandle(handle, queue_size=2)
+    for rep in range(5):  # more than fit in the queue
+        async_handle.update_result("I", rep, group="data")
+    assert async_handle.get_metadata({}) == {"calls": [0, 1, 2, 3, 4]}
+    async_handle.drain()
+    assert handle.calls == [0, 1, 2, 3, 4, "flush"]
+    async_handle.close()
+    assert handle.calls[-1] == "close" and handle.threads == {"datasaver"}
+
+
+def test_async_write_error_is_reraised_on_caller_thread():
+    handle = RecordingHandle(fail_on=1)
+    handle.release.clear()
+    async_handle = AsyncDataHandle(handle)
+    for rep in range(3):
+        async_handle.update_result("I", rep, group="data")
+    handle.release.set()
+
+    with pytest.raises(OSError, match="disk full"):
+        async_handle.drain()
+    assert handle.calls == [0]  # writes after the failed one are discarded
+    with pytest.raises(OSError, match="disk full"):
+        async_handle.update_result("I", 3, group="data")
+    with pytest.raises(OSError, match="disk full"):
+        async_handle.close()
+    assert handle.calls == [0, "close"]  # the file is still closed
+
+
+def test_async_datasaver_round_trip(tmp_path):
+    filepath = tmp_path / "run.hdf5"
+    with DataSaver(h5py.File(filepath, "a"), asynchronous=True) as handle:
+        for rep in range(3):
+            handle.update_result("I", np.full(4, rep, dtype=float), group="data")
+        handle.drain()
+
+    with DataReader(filepath) as reader:
+        np.testing.assert_array_equal(reader["I"][:, 0], [0.0, 1.0, 2.0])
+
+
+@pytest.mark.parametrize(
+    "row_shape, buffering, expected_rows, chunks",
+    [
+        ((100,), (10, 10), None, (327, 100)),  # whole rows fit, aim for CHUNK_BYTES
+        ((100,), (10, 10), 50, (50, 100)),  # never more rows than expected
+        ((5050,), (101, 50), None, (655, 50)),  # split between whole inner sweeps
+        ((6000,), (2, 3000), None, (16, 2048)),  # inner sweep too long, split evenly
+        ((4000,), None, None, (8, 4000)),  # not a sweep row, kept whole
+        ((3, 4), (3, 4), None, (2730, 3, 4)),  # rows with sweep shape are kept whole
+    ],
+)
+def test_chunk_shape_follows_sweep(row_shape, buffering, expected_rows, chunks):
+    assert get_chunk_shape(row_shape, 8, buffering, expected_rows) == chunks
+
+
+@pytest.mark.parametrize(
+    "compression, dtype, kwargs",
+    [
+        (None, np.float64, {}),
+        ("gzip", np.float64, {"compression": "gzip", "shuffle": True}),
+        ("gzip", np.int64, {"compression": "gzip", "shuffle": False}),
+    ],
+)
+def test_compression_kwargs(compression, dtype, kwargs):
+    compression_kwargs = get_compression_kwargs(compression, dtype)
+    assert {key: compression_kwargs[key] for key in kwargs} == kwargs
+
+
+@pytest.mark.parametrize("compression", ["gzip", "lz4", "blosc"])
+def test_live_saved_data_is_chunked_and_compressed(tmp_path, compression):
+    if compression != "gzip":
+        pytest.importorskip("hdf5plugin")
+    filepath = tmp_path / "run.hdf5"
+    rows = np.random.default_rng(0).random((5, 5050))
+    saver = DataSaver(
+        h5py.File(filepath, "a"), buffering=(101, 50), compression=compression
+    )
+    with saver as handle:
+        for row in rows:
+            handle.update_result("I", row, group="data")
+
+    with h5py.File(filepath, "r") as file:
+        assert file["data/I"].chunks == (655, 50)
+        filters = file["data/I"].id.get_create_plist().get_nfilters()
+        assert filters > 0  # plugin filters have no h5py compression name
+    with DataReader(filepath) as reader:
+        np.testing.assert_array_equal(reader["I"], rows)
+
+
+@pytest.mark.parametrize("compression", ["lz4", "blosc"])
+def test_plugin_compression_needs_hdf5plugin(monkeypatch, compression):
+    monkeypatch.setattr(datasaver, "hdf5plugin", None)
+    with pytest.raises(ImportError, match="install hdf5plugin"):
+        get_compression_kwargs(compression, np.float64)
+    with pytest.raises(ImportError):  # fails before anything is written
+        DataSaver(None, compression=compression)
+
+
+def test_unknown_compression_is_rejected():
+    with pytest.raises(ValueError, match="Unknown compression = 'zstd'"):
+        get_compression_kwargs("zstd", np.float64)
@@ -0,0 +1,122 @@
+""" Unit tests of the client-side result processing of the Experiment base class """
+
+import numpy as np
+import pytest
+
+from qcrew.analyze import stats
+from qcrew.measure import qua_macros as macros
+from qcrew.measure.experiment import Experiment
+
+NUM_POINTS = 4
+
+
+class DummyExperiment(Experiment):
+    name = "dummy"
+
+    def QUA_play_pulse_sequence(self):
+        self.QUA_stream_results()
+
+
+def make_experiment(reps, **parameters):
+    parameters = {"x_sweep": (0.0, 1.0, 0.25)} | parameters
+    experiment = DummyExperiment(modes=[], reps=reps, wait_time=10, **parameters)
+    experiment.QUA_sequence()
+    return experiment
+
+
+def signal(x, y, rep):
+    """ Value measured at sweep point (x, y) on repetition rep, unique per sample """
+    return x + 10 * y + 100 * rep
+
+
+def test_block_sd_matches_delta_method_on_all_reps():
+    block_size, reps = 5, 200
+    experiment = make_experiment(reps, block_size=block_size)
+    rng = np.random.default_rng(0)
+    # a large mean makes <I^2> - <I>^2 cancel badly if the variance is pooled naively
+    i_reps = 1e4 + rng.normal(0, 1, (reps, NUM_POINTS))
+    q_reps = 3 + rng.normal(0, 2, (reps, NUM_POINTS))
+
+    def block_means(xs):
+        return xs.reshape(-1, block_size, NUM_POINTS).mean(axis=1)
+
+    results = {
+        "I_BLOCK": block_means(i_reps),
+        "Q_BLOCK": block_means(q_reps),
+        "I_SQ_BLOCK": block_means(i_reps**2),
+        "Q_SQ_BLOCK": block_means(q_reps**2),
+    }
+    stderr = (None, None)
+    for batch in (slice(0, 7), slice(7, None)):
+        batch_results = {tag: data[batch] for tag, data in results.items()}
+        stderr = experiment.estimate_sd(stats, batch_results, None, stderr)
+
+    i_avg, q_avg = i_reps.mean(axis=0), q_reps.mean(axis=0)
+    i_var, q_var = i_reps.var(axis=0, ddof=1), q_reps.var(axis=0, ddof=1)
+    z_var = (i_avg**2 * i_var + q_avg**2 * q_var) / (i_avg**2 + q_avg**2)
+    np.testing.assert_allclose(stderr[0], np.sqrt(z_var / reps), rtol=1e-6)
+
+
+def test_raw_sd_is_std_err_of_mean_magnitude():
+    reps = 20
+    experiment = make_experiment(reps)
+    z_sq_raw = np.random.default_rng(0).random((reps, NUM_POINTS))
+    stderr = (None, None)
+    for batch in np.split(z_sq_raw, [3, 11]):
+        results = {experiment.Z_SQ_RAW_tag: batch}
+        stderr = experiment.estimate_sd(stats, results, None, stderr)
+
+    expected = np.std(np.sqrt(z_sq_raw), axis=0, ddof=1) / np.sqrt(reps)
+    np.testing.assert_allclose(stderr[0], expected)
+    assert stderr[1].count == reps
+
+
+@pytest.mark.parametrize(
+    "rep_block, shuffle", [(1, 1), (3, False), (3, 7), (12, 7), (12, True)]
+)
+def test_reorder_results_restores_the_ordered_sweep(rep_block, shuffle):
+    reps, x_sweep, y_sweep = 12, (0.0, 1.0, 0.25), [3, 0, 1]
+    experiment = make_experiment(
+        reps, x_sweep=x_sweep, y_sweep=y_sweep, rep_block=rep_block, shuffle=shuffle
+    )
+    num_points = experiment.num_points
+    sweep_variables = [experiment.variables[key] for key in ("x", "y")]
+    point_order = experiment.point_order
+    if point_order is None:
+        point_order = np.arange(num_points)
+
+    # coordinates of the i-th acquired point, as played by the shuffled QUA loop
+    xs, ys = map(np.array, macros.build_point_tables(sweep_variables, point_order))
+    # every rep block visits all points in acquisition order, rep_block reps each
+    blocks = np.arange(reps).reshape(-1, 1, rep_block)
+    raw = signal(xs[:, None], ys[:, None], blocks)  # (rows, points, rep_block)
+    if rep_block == 1:
+        raw = raw[..., 0]
+    streamed = {
+        experiment.Z_SQ_RAW_tag: raw,
+        experiment.Z_SQ_RAW_AVG_tag: raw.mean(axis=-1) if rep_block > 1 else raw,
+        experiment.Z_AVG_tag: signal(xs, ys, (reps - 1) / 2),
+    }
+    for tag, data in streamed.items():
+        if tag in experiment.result_row_shapes:
+            assert data.shape[1:] == experiment.result_row_shapes[tag]
+
+    results = experiment.reorder_results(streamed)
+
+    # the ordinary sweep: points in C order of (x, y), reps along the first axis
+    x_grid, y_grid = np.meshgrid(*[v.values for v in sweep_variables], indexing="ij")
+    x_grid, y_grid = x_grid.ravel(), y_grid.ravel()
+    reps_sweep = signal(x_grid, y_grid, np.arange(reps)[:, None])
+    block_sweep = reps_sweep.reshape(-1, rep_block, num_points).mean(axis=1)
+    np.testing.assert_allclose(results[experiment.Z_SQ_RAW_tag], reps_sweep)
+    np.testing.assert_allclose(results[experiment.Z_SQ_RAW_AVG_tag], block_sweep)
+    np.testing.assert_allclose(results[experiment.Z_AVG_tag], reps_sweep.mean(axis=0))
+
+
+def test_build_point_tables_lists_coordinates_in_visiting_order():
+    experiment = make_experiment(2, y_sweep=[3, 0, 1])
+    sweep_variables = [experiment.variables[key] for key in ("x", "y")]
+    point_order = np.array([5, 0, 11, 3])  # points are numbered with y innermost
+    xs, ys = macros.build_point_tables(sweep_variables, point_order)
+    assert xs == [0.25, 0.0, 0.75, 0.25]
+    assert ys == [1, 3, 1, 3]
@@ -21,3 +21,176 @@ class TestMixerTuner:
             except AttributeError:
                 logger.error("MixerTuner must be initialized with Mode objects")
                 raise
+
+
+# unit tests of the MixerTuner paraboloid search, the fake class above is not collected
+
+import numpy as np
+import pytest
+
+try:
+    from qcrew.control.instruments.meta import mixer_tuner as mt
+    from qcrew.control.instruments.signal_hound import sa124
+except OSError as exc:  # qcrew.control needs the lab's instrument DLLs and stage.yml
+    pytest.skip(f"qcrew.control is not importable: {exc}", allow_module_level=True)
+
+OPTIMUM = np.array([0.031, -0.022])  # in V, offsets that null the leakage
+
+
+def get_contrast(offsets, optimum=OPTIMUM, gain=2e4):
+    """ Leakage in dB above the floor, its power is quadratic in the offset errors """
+    error = np.asarray(offsets) - optimum
+    return 10 * np.log10(1 + gain * error @ error)
+
+
+def run_search(fn, rounds=3, step=0.05, threshold=2.0, start=(0.0, 0.0)):
+    probes = list()
+
+    def probe(offsets):
+        probes.append(np.array(offsets))
+        return fn(offsets)
+
+    tuner = mt.MixerTuner(sa=None, qm=None, method="paraboloid")
+    search = mt._paraboloid_search(start, step, rounds, 0.3, threshold)
+    return tuner._run_search(probe, search), probes
+
+
+def test_paraboloid_search_converges_on_quadratic_leakage():
+    result, probes = run_search(get_contrast)
+    assert result.success
+    assert result.fun < 2.0 and result.fun == get_contrast(result.x)
+    assert result.nfev == len(probes) == 10  # one grid and the fitted minimum
+    np.testing.assert_allclose(result.x, OPTIMUM, atol=2e-3)
+
+
+def test_paraboloid_jump_is_clamped_to_trust_region():
+    far_optimum = np.array([1.0, -1.0])
+    result, probes = run_search(lambda x: get_contrast(x, far_optimum), rounds=1)
+    jump = probes[9] - probes[4]  # fitted minimum probed after the 3x3 grid
+    np.testing.assert_allclose(np.linalg.norm(jump), 2 * 0.05)
+    np.testing.assert_allclose(jump / np.linalg.norm(jump), far_optimum / np.sqrt(2))
+    assert not result.success
+    assert "above 2.0dB after 1 rounds" in result.message
+
+
+def test_paraboloid_search_reports_degenerate_fits():
+    result, probes = run_search(lambda x: 10.0, rounds=2)  # flat, no minimum to fit
+    assert not result.success
+    assert result.nit == 2 and len(probes) == 18  # no fitted minimum is probed
+    assert "2 paraboloid fits were degenerate" in result.message
+
+
+def test_paraboloid_search_stops_on_non_finite_contrast():
+    result, probes = run_search(lambda x: np.nan)
+    assert not result.success and len(probes) == 9
+    assert "non-finite" in result.message
+
+
+class FakeMode:
+    """ Mode with the attributes MixerTuner reads, hashable like a real Mode """
+
+    def __init__(self, name, lo_freq, int_freq, optimum=OPTIMUM):
+        self.name, self.lo_freq, self.int_freq = name, lo_freq, int_freq
+        self.optimum, self.mixer_offsets = optimum, dict()
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeQM:
+    """ Records the DC offsets set on each element and returns the given job """
+
+    def __init__(self, job=None):
+        self.offsets, self.job = dict(), job
+
+    def set_output_dc_offset_by_element(self, name, port, offset):
+        self.offsets.setdefault(name, {"I": 0.0, "Q": 0.0})[port] = offset
+
+    def execute(self, program):
+        return self.job
+
+
+class FakeJob:
+    halted = False
+
+    def halt(self):
+        self.halted = True
+
+
+class FakeSA:
+    """ Sweeps a flat floor with the LO leakage of each mode at its carrier freq """
+
+    floor = -90.0
+
+    def __init__(self, qm, *modes):
+        self.qm, self.modes, self.centers = qm, modes, list()
+
+    def sweep_packed(self, **sweep_params):
+        """ Sweeps with the last sweep params if none are given, like Sa124 """
+        self.sweep_params = sweep_params or self.sweep_params
+        center, span, rbw = (self.sweep_params[k] for k in ("center", "span", "rbw"))
+        self.centers.append(center)
+        fs = center - span / 2 + rbw * np.arange(int(span / rbw) + 1)
+        amps = np.full(len(fs), self.floor)
+        for mode in self.modes:
+            offsets = self.qm.offsets.get(mode.name, {"I": 0.0, "Q": 0.0})
+            contrast = get_contrast((offsets["I"], offsets["Q"]), mode.optimum)
+            amps[abs(fs - mode.lo_freq) <= 2 * rbw] += contrast  # 5 bin wide tone
+        return sa124._SWEEP_HEADER.pack(fs[0], rbw, len(fs)) + amps.tobytes()
+
+
+class BrokenSA(FakeSA):
+    def sweep_packed(self, **sweep_params):
+        raise RuntimeError("SA disconnected")
+
+
+def test_are_tones_separated_compares_all_tones_of_different_modes():
+    qubit, rr = FakeMode("qubit", 5e9, -50e6), FakeMode("rr", 7e9, -50e6)
+    assert mt.MixerTuner(qubit, rr, sa=None, qm=None)._are_tones_separated()
+    # the upper sideband of the qubit lands within span of the rr carrier freq
+    rr.lo_freq = 5.051e9
+    assert not mt.MixerTuner(qubit, rr, sa=None, qm=None)._are_tones_separated()
+    rr.lo_freq = 5.0525e9  # more than span apart from all qubit tones
+    assert mt.MixerTuner(qubit, rr, sa=None, qm=None)._are_tones_separated()
+
+
+def test_round_robin_interleaves_searches_until_each_mode_converges():
+    qubit = FakeMode("qubit", 5e9, -50e6)
+    rr = FakeMode("rr", 7e9, -50e6, optimum=np.array([-0.04, 0.015]))
+    tuned = FakeMode("tuned", 6e9, -50e6, optimum=np.zeros(2))
+    qm = FakeQM()
+    sa = FakeSA(qm, qubit, rr, tuned)
+    tuner = mt.MixerTuner(qubit, rr, tuned, sa=sa, qm=qm, method="paraboloid")
+    tuner._tune_round_robin("LO", FakeJob())
+
+    assert sa.centers[:3] == [5e9, 7e9, 6e9]  # tuning checks, tuned is skipped
+    assert sa.centers[3:21] == [5e9, 7e9] * 9  # the 3x3 grids of both searches
+    assert tuner.acquisitions == len(sa.centers) - 3
+    for mode in (qubit, rr):
+        offsets = (mode.mixer_offsets["I"], mode.mixer_offsets["Q"])
+        assert get_contrast(offsets, mode.optimum) < tuner.threshold
+        np.testing.assert_allclose(offsets, mode.optimum, atol=2e-3)
+    assert tuned.mixer_offsets == dict()
+
+
+def test_parallel_tuning_halts_job_when_tuning_fails():
+    job = FakeJob()
+    qubit, rr = FakeMode("qubit", 5e9, -50e6), FakeMode("rr", 7e9, -50e6)
+    sa = BrokenSA(FakeQM(job))
+    tuner = mt.MixerTuner(qubit, rr, sa=sa, qm=sa.qm, parallel=True)
+    tuner._get_qua_program = lambda *modes: None  # fake modes can't play in QUA
+    with pytest.raises(RuntimeError, match="SA disconnected"):
+        tuner.tune()
+    assert job.halted
+
+
+def test_serial_tuning_sets_best_offsets_of_unconverged_search():
+    mode = FakeMode("qubit", 5e9, -50e6, optimum=np.array([1.0, -1.0]))
+    qm = FakeQM()
+    tuner = mt.MixerTuner(mode, sa=FakeSA(qm, mode), qm=qm, method="paraboloid")
+    tuner._tune_mode(mode, FakeJob())  # the SB tone is below threshold, skipped
+
+    offsets = (mode.mixer_offsets["I"], mode.mixer_offsets["Q"])
+    assert qm.offsets["qubit"] == mode.mixer_offsets  # the best probe is pushed
+    assert tuner.threshold < get_contrast(offsets, mode.optimum)
+    assert get_contrast(offsets, mode.optimum) < get_contrast((0.0, 0.0), mode.optimum)
@@ -0,0 +1,101 @@
+""" Unit tests of the PipelineStage used by the professor and the VNA runner """
+
+import threading
+import time
+
+import pytest
+
+try:
+    from qcrew.control.pipeline import PipelineStage
+except OSError as exc:  # qcrew.control needs the lab's instrument DLLs and stage.yml
+    pytest.skip(f"qcrew.control is not importable: {exc}", allow_module_level=True)
+
+TIMEOUT = 5.0  # in s, generous upper bound for thread hand-offs
+
+
+def test_stage_forwards_results_to_consumers_in_order():
+    received = list()
+    doubler = PipelineStage("double", lambda x: 2 * x)
+    collector = doubler.connect(PipelineStage("collect", received.append))
+    doubler.start()
+    collector.start()
+    for item in range(5):
+        doubler.put(item)
+    doubler.close()
+    doubler.join()
+    collector.join()
+    assert received == [0, 2, 4, 6, 8]
+
+
+def test_full_queue_blocks_producer_until_worker_catches_up():
+    release = threading.Event()
+    stage = PipelineStage("slow", lambda _: release.wait(TIMEOUT) and None, maxsize=1)
+    stage.start()
+    stage.put(0)  # taken by the worker, which blocks on release
+    stage.put(1)  # fills the queue
+
+    producer = threading.Thread(target=stage.put, args=(2,), daemon=True)
+    producer.start()
+    producer.join(0.3)
+    assert producer.is_alive()  # back-pressure: put() blocks while the queue is full
+
+    release.set()
+    producer.join(TIMEOUT)
+    assert not producer.is_alive()
+    stage.close()
+    stage.join()
+
+
+def test_drop_oldest_keeps_latest_items():
+    received = list()
+    stage = PipelineStage("plot", received.append, maxsize=2, drop_oldest=True)
+    for item in range(5):  # not started yet, so the queue overflows
+        stage.put(item)
+    assert stage.dropped == 3
+    stage.start()
+    stage.close()
+    stage.join()
+    assert received == [3, 4]
+
+
+def test_worker_error_is_reraised_by_join_and_consumers_are_closed():
+    def fail_on_two(item):
+        if item == 2:
+            raise ValueError("bad item")
+        return item
+
+    received = list()
+    stage = PipelineStage("fail", fail_on_two, maxsize=1)
+    collector = stage.connect(PipelineStage("collect", received.append))
+    stage.start()
+    collector.start()
+    for item in range(10):  # must not deadlock after the failure
+        stage.put(item)
+    stage.close()
+
+    with pytest.raises(ValueError, match="bad item"):
+        stage.join()
+    collector.join()  # closed by the failed stage, so this returns
+    assert isinstance(stage.error, ValueError)
+    assert received == [0, 1]
+
+
+def test_put_returns_when_failed_stage_queue_is_full():
+    release = threading.Event()
+
+    def fail_then_block(_):
+        release.wait(TIMEOUT)
+        raise RuntimeError("failed")
+
+    stage = PipelineStage("fail", fail_then_block, maxsize=1)
+    stage.start()
+    stage.put(0)
+    release.set()
+    deadline = time.monotonic() + TIMEOUT
+    while stage.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for item in range(5):  # the failed stage only drains, producers never block on it
+        stage.put(item)
+    stage.close()
+    with pytest.raises(RuntimeError):
+        stage.join()
@@ -0,0 +1,84 @@
+""" Unit tests of the result stores and live batch fetching of QMResultFetcher """
+
+import numpy as np
+import pytest
+from qm._results_01 import MultipleNamedJobResult
+
+try:
+    from qcrew.control.instruments.qm.qm_result_fetcher import (
+        QMResultFetcher,
+        QMResultStore,
+    )
+except OSError as exc:  # qcrew.control needs the lab's instrument DLLs and stage.yml
+    pytest.skip(f"qcrew.control is not importable: {exc}", allow_module_level=True)
+
+
+class FakeResult(MultipleNamedJobResult):
+    """ Streams the rows given, without connecting to a quantum machine """
+
+    def __init__(self, rows):
+        self.rows = np.asarray(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def wait_for_values(self, count):
+        pass
+
+    def fetch(self, item, flat_struct=False):
+        return self.rows[item]
+
+
+class FakeHandle:
+    def __init__(self, **results):
+        self.results = results
+
+    def __iter__(self):
+        return iter(self.results.items())
+
+    def get(self, tag):
+        return self.results[tag]
+
+    def is_processing(self):
+        return True
+
+
+def test_store_grows_and_keeps_views_of_earlier_batches(monkeypatch):
+    monkeypatch.setattr(QMResultStore, "initial_capacity", 2)
+    store = QMResultStore((3,), max_rows=5)
+    batches = [np.full((rows, 3), float(i)) for i, rows in enumerate((2, 2, 1, 2))]
+    views = [store.append(batch) for batch in batches]
+
+    for view, batch in zip(views, batches):  # earlier views survive the growth
+        np.testing.assert_array_equal(view, batch)
+    np.testing.assert_array_equal(store.latest_batch, batches[-1])
+    np.testing.assert_array_equal(store.all_so_far, np.concatenate(batches))
+    assert len(store) == 7 and store.row_shape == (3,)
+
+
+def test_store_capacity_is_capped_at_max_rows(monkeypatch):
+    monkeypatch.setattr(QMResultStore, "initial_capacity", 2)
+    store = QMResultStore((3,), max_rows=5)
+    for rows in (2, 2, 1):
+        store.append(np.zeros((rows, 3)))
+        assert len(store._data) <= 5
+    assert len(store._data) == len(store) == 5
+
+
+def test_live_fetch_appends_batches_to_preallocated_stores():
+    rows = np.arange(12.0).reshape(4, 3)
+    result = FakeResult(rows[:2])
+    fetcher = QMResultFetcher(FakeHandle(I=result), row_shapes={"I": (3,)}, reps=4)
+    store = fetcher._stores["I"]
+    np.testing.assert_array_equal(fetcher.fetch()["I"], rows[:2])
+    result.rows = rows
+    np.testing.assert_array_equal(fetcher.fetch()["I"], rows[2:])
+    np.testing.assert_array_equal(fetcher.all_so_far("I"), rows)
+    assert fetcher._stores["I"] is store
+
+
+def test_live_fetch_of_rows_with_unexpected_shape_raises():
+    result = FakeResult(np.zeros((2, 3)))
+    fetcher = QMResultFetcher(FakeHandle(I=result), row_shapes={"I": (4,)}, reps=4)
+    with pytest.raises(ValueError, match=r"'I' have shape \(3,\), expected \(4,\)"):
+        fetcher.fetch()
@@ -0,0 +1,70 @@
+""" Unit tests of the RunningStats accumulator used for live std error estimation """
+
+import numpy as np
+import pytest
+
+from qcrew.analyze.stats import RunningStats, get_std_err
+
+SWEEP_SHAPE = (3, 4)
+
+
+@pytest.fixture
+def xs():
+    return np.random.default_rng(0).normal(5.0, 2.0, size=(50, *SWEEP_SHAPE))
+
+
+def check_stats(stats, xs):
+    assert stats.count == len(xs)
+    np.testing.assert_allclose(stats.mean, np.mean(xs, axis=0))
+    np.testing.assert_allclose(stats.variance, np.var(xs, axis=0, ddof=1))
+    std_err = np.std(xs, axis=0, ddof=1) / np.sqrt(len(xs))
+    np.testing.assert_allclose(stats.std_err, std_err)
+
+
+@pytest.mark.parametrize("splits", [[50], [1, 49], [10, 10, 30], [7, 0, 20, 23]])
+def test_update_on_split_batches_matches_numpy(xs, splits):
+    stats = RunningStats()
+    for batch in np.split(xs, np.cumsum(splits)[:-1]):
+        assert stats.update(batch) is stats
+    check_stats(stats, xs)
+
+
+def test_update_reuses_scratch_buffer(xs):
+    stats = RunningStats().update(xs[:20])
+    scratch = stats._scratch
+    stats.update(xs[20:30])  # a smaller batch fits in the first scratch buffer
+    assert stats._scratch is scratch
+    check_stats(stats, xs[:30])
+
+
+def test_merge_of_separate_accumulators_matches_numpy(xs):
+    first, second = RunningStats().update(xs[:17]), RunningStats().update(xs[17:])
+    check_stats(first.merge(second), xs)
+
+
+def test_merge_into_empty_accumulator_copies_state(xs):
+    other = RunningStats().update(xs)
+    stats = RunningStats().merge(other)
+    check_stats(stats, xs)
+    stats.update(xs)
+    check_stats(other, xs)  # merged state is not shared
+
+
+def test_single_repetition_has_undefined_std_err(xs):
+    stats = RunningStats().update(xs[:1])
+    assert np.isnan(stats.variance).all() and np.isnan(stats.std_err).all()
+
+
+def test_empty_accumulator_has_no_std_err():
+    stats = RunningStats()
+    assert stats.variance is None and stats.std_err is None
+
+
+def test_get_std_err_resumes_from_previous_state(xs):
+    # running means after each repetition, as streamed by the old QUA programs
+    ms = np.cumsum(xs, axis=0) / np.arange(1, len(xs) + 1).reshape(-1, 1, 1)
+    std_err, mean, m2 = get_std_err(xs[:20], ms[:20], 20)
+    std_err, mean, m2 = get_std_err(xs[20:], ms[20:], len(xs), std_err, mean, m2)
+    np.testing.assert_allclose(mean, np.mean(xs, axis=0))
+    expected = np.std(xs, axis=0, ddof=1) / np.sqrt(len(xs))
+    np.testing.assert_allclose(std_err, expected)
@@ -0,0 +1,91 @@
+""" Unit tests of the pipelined sweep loop shared by the VNA measurement scripts """
+
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+try:
+    from qcrew.measure.vna import vnarunner
+except OSError as exc:  # qcrew.control needs the lab's instrument DLLs and stage.yml
+    pytest.skip(f"qcrew.control is not importable: {exc}", allow_module_level=True)
+
+
+class FakeVNA:
+    """ Each sweep returns new traces holding the sweep number """
+
+    def __init__(self, delay=0.0):
+        self.sweeps, self.delay = 0, delay
+
+    def sweep(self):
+        if self.sweeps:
+            time.sleep(self.delay)
+        self.sweeps += 1
+
+    @property
+    def data(self):
+        return {"s21_real": np.full(3, float(self.sweeps))}
+
+
+class FakeSaver:
+    """ Records saved traces, failing on the save at fail_pos """
+
+    def __init__(self, fail_pos=None):
+        self.saved, self.threads, self.fail_pos = list(), set(), fail_pos
+
+    def save_data(self, data, pos=None):
+        self.threads.add(threading.current_thread().name)
+        if pos == self.fail_pos:
+            raise OSError("disk full")
+        self.saved.append((pos, data["s21_real"][0]))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ Records settle delays instead of sleeping """
+    delays = list()
+    monkeypatch.setattr(vnarunner, "time", types.SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def test_sweeps_are_saved_in_order_on_writer_thread(sleeps):
+    points = [((rep, count), None) for rep in range(3) for count in range(4)]
+    saver = FakeSaver()
+    vnarunner.VNARunner(FakeVNA(), saver).run(points)
+    assert saver.saved == [(pos, float(i)) for i, (pos, _) in enumerate(points, 1)]
+    assert saver.threads == {"vna-writer"}
+    assert sleeps == list()  # no set_point, nothing to settle
+
+
+def test_points_are_only_set_and_settled_when_their_value_changes(sleeps):
+    values = [1.0, 1.0, 3.0, 10.0, 10.0, 10.1]
+    points = [((i,), value) for i, value in enumerate(values)]
+    set_values = list()
+    settle = vnarunner.step_settle(rate=0.5, min_delay=0.1, max_delay=2.0)
+    saver = FakeSaver()
+    vnarunner.VNARunner(FakeVNA(), saver, set_values.append, settle).run(points)
+
+    assert set_values == [1.0, 3.0, 10.0, 10.1]
+    np.testing.assert_allclose(sleeps, [2.0, 1.0, 2.0, 0.1])  # first point waits max
+    assert [pos for pos, _ in saver.saved] == [pos for pos, _ in points]
+
+
+def test_fixed_settle_delay_and_step_settle_bounds(sleeps):
+    points = [((i,), value) for i, value in enumerate([0, 1, 1, 2])]
+    vnarunner.VNARunner(FakeVNA(), FakeSaver(), lambda _: None, 0.3).run(points)
+    assert sleeps == [0.3, 0.3, 0.3]
+
+    settle = vnarunner.step_settle(rate=2.0)
+    assert settle(None, 5.0) == 0.0  # no max delay to wait on the first point
+    assert settle(5.0, 3.0) == 4.0
+
+
+def test_writer_error_stops_the_sweeps_and_is_reraised():
+    points = [((i,), None) for i in range(50)]
+    vna, saver = FakeVNA(delay=0.005), FakeSaver(fail_pos=(0,))
+    with pytest.raises(OSError, match="disk full"):
+        vnarunner.VNARunner(vna, saver).run(points)
+    assert saver.saved == list()
+    assert vna.sweeps < len(points)  # the loop stops once the writer has failed
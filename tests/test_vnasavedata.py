@@ -0,0 +1,53 @@
+""" Unit tests of the buffered N-D trace saving of VNADataSaver """
+
+import h5py
+import numpy as np
+
+from qcrew.measure.vna.vnasavedata import VNADataSaver
+
+POWERS, NUM_CURRENTS, NUM_FREQS = [-10.0, 0.0], 3, 5
+
+
+def trace(i, j):
+    return 10 * i + j + 0.1 * np.arange(NUM_FREQS)
+
+
+def make_saver(datapath, **kwargs):
+    axes = {"power": POWERS, "current": None, "frequency": None}
+    datashape = (len(POWERS), NUM_CURRENTS, NUM_FREQS)
+    return VNADataSaver(
+        datapath, "vnasweep", "test", ["s21"], datashape, axes=axes, **kwargs
+    )
+
+
+def test_traces_are_buffered_until_flushed_and_axes_overwritten(tmp_path):
+    with make_saver(tmp_path, flush_interval=60.0, max_buffer_rows=2) as saver:
+        dataset = saver.datasets["s21"]
+        for j in range(NUM_CURRENTS):
+            saver.save_data({"s21": trace(0, j)}, pos=(0, j))
+        # two consecutive traces fill a buffer and are written as one hyperslab
+        np.testing.assert_array_equal(dataset[0, :2], [trace(0, 0), trace(0, 1)])
+        assert not dataset[0, 2].any()  # still buffered
+        saver.flush()
+        np.testing.assert_array_equal(dataset[0, 2], trace(0, 2))
+
+        for j in reversed(range(NUM_CURRENTS)):  # not consecutive, written one by one
+            saver.save_data({"s21": trace(1, j)}, pos=(1, j))
+        saver.save_data({"current": [1.0, 2.0, 3.0], "frequency": np.arange(5.0)})
+        saver.save_data({"current": [4.0, 5.0, 6.0]})  # re-saved, e.g. measured
+        filepath = saver.filepath
+
+    with h5py.File(filepath, "r") as file:
+        expected = [[trace(i, j) for j in range(NUM_CURRENTS)] for i in range(2)]
+        np.testing.assert_array_equal(file["s21"], expected)
+        dims = file["s21"].dims
+        assert [dim.label for dim in dims] == ["power", "current", "frequency"]
+        np.testing.assert_array_equal(dims[0]["power"], POWERS)
+        np.testing.assert_array_equal(dims[1]["current"], [4.0, 5.0, 6.0])
+        np.testing.assert_array_equal(dims[2]["frequency"], np.arange(5.0))
+
+
+def test_buffers_are_written_once_flush_interval_elapses(tmp_path):
+    with make_saver(tmp_path, flush_interval=-1.0) as saver:  # always elapsed
+        saver.save_data({"s21": trace(1, 1)}, pos=(1, 1))
+        np.testing.assert_array_equal(saver.datasets["s21"][1, 1], trace(1, 1))